@@ -0,0 +1,284 @@
+# async_engine.py
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from models import WidgetRequest
+from logqueue import log_request
+from poller_s3 import RequestBatch, S3RequestPoller
+
+
+class AsyncioEngine:
+    """
+    asyncio consumer loop with a cap on in-flight requests.
+
+    Listing, GETs, deletes and store writes are the same blocking poller/store
+    calls the other engines use, offloaded to one shared executor. A semaphore
+    limits how many requests are claimed but not yet stored (``max_in_flight``);
+    the executor size limits how many boto3 calls actually run at once.
+
+    Requests are released to ``handler`` in key order like the pipeline engine,
+    but a store write no longer blocks the next hand-off: writes for different
+    widgets overlap, writes for the same widget are chained in key order.
+
+    SIGINT/SIGTERM stop listing, let claimed requests finish and return
+    normally; keys fetched but not handed off are released, not deleted.
+
+    The lines of a batch object (see RequestBatch) are dispatched like single
+    requests, at most ``max_in_flight`` of them at a time, while the batch
+    holds one in-flight slot. The object is deleted once every line has been
+    stored; if the batch is cut short it is released and replayed later.
+
+    With ``retry_on`` (exception types) a single object is deleted only after
+    its store write succeeds; a write failing with one of those types requeues
+    the object (or releases the whole batch) for a later retry instead of
+    stopping. Until that retry succeeds, later objects for the same widget are
+    requeued behind it rather than applied out of order.
+    """
+
+    def __init__(self, poller: S3RequestPoller, handler: Callable[[WidgetRequest], None],
+                 max_in_flight: int = 64, executor_workers: Optional[int] = None, retry_on: tuple = ()):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        self.poller = poller
+        self.handler = handler
+        self.max_in_flight = max_in_flight
+        self.executor_workers = executor_workers or min(max_in_flight, 64)
+        self.retry_on = retry_on
+        self._blocked: dict[str, str] = {}  # widgetId -> key of its failed request
+        self.processed = 0
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._error: Optional[BaseException] = None
+
+    def run(self, stop_after: int = 0) -> int:
+        """Process requests until stop_after is reached (0 = forever) or a signal arrives."""
+        self._executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix="aio")
+        try:
+            asyncio.run(self._main(stop_after))
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._error is not None:
+            raise self._error
+        return self.processed
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _main(self, stop_after: int) -> None:
+        self._stop = asyncio.Event()
+        self._sem = asyncio.Semaphore(self.max_in_flight)
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tails: dict[str, asyncio.Task] = {}
+        self._stores: set[asyncio.Task] = set()
+        signals = self._install_signal_handlers()
+
+        lister = asyncio.create_task(self._list_loop())
+        dispatched = 0
+        try:
+            while not self._stop.is_set() and not (stop_after and dispatched >= stop_after):
+                try:
+                    key, fetch = await asyncio.wait_for(self._ready.get(), timeout=0.1)
+                except asyncio.TimeoutError:
+                    continue
+                dispatched += await self._hand_off(key, fetch)
+        finally:
+            self._stop.set()
+            lister.cancel()
+            await asyncio.gather(lister, return_exceptions=True)
+            while not self._ready.empty():
+                key, fetch = self._ready.get_nowait()
+                if not fetch.cancel() and fetch.done() and fetch.exception() is None:
+                    body = fetch.result()[0]
+                    if isinstance(body, RequestBatch):
+                        body.close()
+                self.poller.release(key)
+            await asyncio.gather(*self._stores, return_exceptions=True)
+            for sig in signals:
+                asyncio.get_running_loop().remove_signal_handler(sig)
+
+    def _install_signal_handlers(self) -> list:
+        loop = asyncio.get_running_loop()
+        installed = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._on_signal, sig)
+                installed.append(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # not the main thread, or not supported on this platform
+        return installed
+
+    def _on_signal(self, sig) -> None:
+        self.log.info(f"Received {signal.Signals(sig).name}; draining in-flight requests.")
+        self._stop.set()
+
+    async def _list_loop(self) -> None:
+        while not self._stop.is_set():
+            await self._sem.acquire()
+            try:
+                key = await self._call(self.poller.next_key)
+            except Exception as e:
+                self._sem.release()
+                if self.poller.is_missing_bucket(e):
+                    self.log.error(f"Bucket {self.poller.bucket2} does not exist.")
+                    self._fail(e)
+                    return
+                self.log.error(f"Error listing requests: {e}")
+                await asyncio.sleep(self.poller.idle.next_delay())
+                continue
+            if key is None:
+                self._sem.release()
+                await asyncio.sleep(self.poller.idle.next_delay())
+                continue
+            self._ready.put_nowait((key, asyncio.create_task(self._fetch(key))))
+
+    async def _fetch(self, key: str):
+        body = await self._call(self.poller.read_body, key)
+        if isinstance(body, RequestBatch):
+            return body, None
+        try:
+            return self.poller.parse(body), None
+        except Exception as e:
+            return None, e
+
+    async def _hand_off(self, key: str, fetch: asyncio.Task) -> int:
+        """Dispatch a fetched object; returns the number of requests dispatched."""
+        try:
+            req, parse_error = await fetch
+        except Exception as e:
+            self.log.error(f"Error retrieving request {key}: {e}")
+            self.poller.release(key)
+            self._unblock(key)
+            self._sem.release()
+            return 0
+
+        if isinstance(req, RequestBatch):
+            return await self._hand_off_batch(req)
+        if self.retry_on and parse_error is None:
+            self._dispatch(req, self._sem.release, key)  # acked once stored
+            return 1
+
+        try:
+            await self._call(self.poller.ack, key)
+        except Exception as e:
+            self.log.error(f"Error deleting request {key}: {e}")
+            self._sem.release()
+            return 0
+        if parse_error is not None:
+            self.log.error(f"Error parsing request {key}: {parse_error}")
+            self._sem.release()
+            return 0
+        log_request(self.poller.log, req.requestId, "Consumed request from %s", key)
+
+        self._dispatch(req, self._sem.release)
+        return 1
+
+    async def _hand_off_batch(self, batch: RequestBatch) -> int:
+        lines = iter(batch)
+        window = asyncio.Semaphore(self.max_in_flight)
+        pending: set[asyncio.Task] = set()
+        complete = False
+        failed: list = []
+        read_error: Optional[BaseException] = None
+        dispatched = 0
+        while not self._stop.is_set():
+            try:
+                req = await self._call(next, lines, None)
+            except Exception as e:
+                read_error = e
+                break
+            if req is None:
+                complete = True
+                break
+            await window.acquire()
+            task = self._dispatch(req, window.release)
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            task.add_done_callback(lambda t: t.result() or failed.append(t))
+            dispatched += 1
+
+        finisher = asyncio.create_task(self._finish_batch(batch, pending, complete, read_error, failed))
+        self._stores.add(finisher)
+        finisher.add_done_callback(self._stores.discard)
+        return dispatched
+
+    async def _finish_batch(self, batch: RequestBatch, pending: set, complete: bool,
+                            read_error: Optional[BaseException] = None, failed: tuple = ()) -> None:
+        try:
+            if pending:
+                await asyncio.wait(set(pending))
+            if failed:
+                self.log.error(f"{len(failed)} line(s) of batch {batch.key} not stored; left in Bucket 2 to retry")
+                self.poller.abandon_batch(batch)
+            elif complete and self._error is None:
+                await self._call(self.poller.finish_batch, batch)
+            elif read_error is not None and self._error is None:
+                # Every dispatched line is stored; resume after them next time
+                await self._call(self.poller.fail_batch, batch, read_error)
+            else:
+                self.poller.abandon_batch(batch)
+        except Exception as e:
+            self.log.error(f"Error deleting batch {batch.key}: {e}")
+        finally:
+            self._sem.release()
+
+    def _dispatch(self, req: WidgetRequest, on_done: Callable[[], None],
+                  key: Optional[str] = None) -> asyncio.Task:
+        prev = self._tails.get(req.widgetId)
+        task = asyncio.create_task(self._store(req, prev, key))
+        self._tails[req.widgetId] = task
+        self._stores.add(task)
+        task.add_done_callback(lambda t, w=req.widgetId: self._store_done(t, w, on_done))
+        return task
+
+    async def _store(self, req: WidgetRequest, prev: Optional[asyncio.Task], key: Optional[str] = None) -> bool:
+        """Run the handler; ``key`` is acked after it succeeds. Returns whether the write landed."""
+        if prev is not None:
+            # Same widget: wait for the earlier write, whatever its outcome
+            await asyncio.wait({prev})
+        if key is not None and self._blocked.get(req.widgetId, key) != key:
+            self.poller.requeue(key)  # an earlier request for this widget goes first
+            return True
+        try:
+            await self._call(self.handler, req)
+        except self.retry_on as e:
+            self.log.error(f"Request {req.requestId} not stored everywhere; left in Bucket 2 to retry: {e}")
+            if key is not None:
+                self._blocked[req.widgetId] = key
+                self.poller.requeue(key)
+            return False
+        except Exception as e:
+            self.log.error(f"Store failed for widget {req.widgetId}: {e}")
+            if key is not None:
+                self.poller.release(key)
+            self._fail(e)
+            return False
+        if key is not None:
+            self._blocked.pop(req.widgetId, None)
+            try:
+                await self._call(self.poller.ack, key)
+            except Exception as e:
+                self.log.error(f"Error deleting request {key}: {e}")
+            log_request(self.poller.log, req.requestId, "Consumed request from %s", key)
+        self.processed += 1
+        return True
+
+    def _store_done(self, task: asyncio.Task, widget_id: str, on_done: Callable[[], None]) -> None:
+        self._stores.discard(task)
+        if self._tails.get(widget_id) is task:
+            del self._tails[widget_id]
+        on_done()
+
+    def _unblock(self, key: str) -> None:
+        """A failed request that can no longer be read must not hold its widget forever."""
+        for widget_id, blocker in list(self._blocked.items()):
+            if blocker == key:
+                del self._blocked[widget_id]
+
+    def _fail(self, e: BaseException) -> None:
+        if self._error is None:
+            self._error = e
+        self._stop.set()
@@ -0,0 +1,35 @@
+# batching.py
+import logging
+import threading
+from typing import Callable
+
+
+class FlushTimer:
+    """
+    Background thread that calls ``fn`` every ``interval_s`` seconds.
+    Used by the batching layers to flush on age even when no new work arrives.
+    Errors from ``fn`` are logged and the timer keeps running.
+    """
+
+    def __init__(self, interval_s: float, fn: Callable[[], None], name: str = "flush-timer"):
+        self.interval = interval_s
+        self.fn = fn
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self) -> "FlushTimer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+            except Exception as e:
+                self.log.error(f"Timed flush failed: {e}")
@@ -0,0 +1,123 @@
+# bench/bench_models.py
+"""
+Micro-benchmark: WidgetRequest parsing and flattening.
+
+Compares the original path (json.loads -> WidgetRequest(**data) with
+regex/getattr validation and a filtered dict copy) against
+WidgetRequest.from_json_bytes + the one-pass to_flat_widget_dict.
+
+Run from the repository root:  python -m bench.bench_models
+"""
+import argparse
+import json
+import re
+import timeit
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from models import WidgetRequest, to_flat_widget_dict
+
+
+# ---- the original implementation, kept here as the baseline ---------------
+
+_LEGACY_OWNER_RE = re.compile(r"[A-Za-z ]+$")
+
+
+@dataclass
+class _LegacyOtherAttribute:
+    name: str
+    value: str
+
+
+@dataclass
+class _LegacyWidgetRequest:
+    type: str
+    requestId: str
+    widgetId: str
+    owner: str
+    label: Optional[str] = None
+    description: Optional[str] = None
+    otherAttributes: Optional[List[_LegacyOtherAttribute]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        if self.type not in ("WidgetCreateRequest", "WidgetDeleteRequest", "WidgetUpdateRequest"):
+            raise ValueError("type must be one of the schema values")
+        for k in ("requestId", "widgetId", "owner"):
+            v = getattr(self, k, None)
+            if not isinstance(v, str) or not v:
+                raise ValueError(f"{k} must be a non-empty string")
+        if not _LEGACY_OWNER_RE.fullmatch(self.owner):
+            raise ValueError("owner must contain only letters and spaces")
+        fixed = []
+        for oa in (self.otherAttributes or []):
+            if isinstance(oa, dict):
+                name, value = oa.get("name"), oa.get("value")
+                if not isinstance(name, str) or not isinstance(value, str):
+                    raise ValueError("each otherAttributes item must have string name and value")
+                fixed.append(_LegacyOtherAttribute(name=name, value=value))
+            elif isinstance(oa, _LegacyOtherAttribute):
+                fixed.append(oa)
+            else:
+                raise ValueError("otherAttributes items must be dicts or OtherAttribute objects")
+        self.otherAttributes = fixed
+
+
+def _legacy_flat(req) -> Dict[str, Any]:
+    d: Dict[str, Any] = {"widgetId": req.widgetId, "owner": req.owner,
+                         "label": req.label, "description": req.description}
+    for oa in req.otherAttributes or []:
+        d[oa.name] = oa.value
+    return {k: v for k, v in d.items() if v is not None}
+
+
+def legacy_path(body: bytes):
+    return _legacy_flat(_LegacyWidgetRequest(**json.loads(body.decode("utf-8"))))
+
+
+def fast_path(body: bytes):
+    return to_flat_widget_dict(WidgetRequest.from_json_bytes(body))
+
+
+# ---- payloads & runner ------------------------------------------------------
+
+def make_payload(n_attrs: int, description_len: int = 200) -> bytes:
+    return json.dumps({
+        "type": "WidgetCreateRequest",
+        "requestId": "e80fab52-71a5-4a76-8c4d-11b66b83ca2a",
+        "widgetId": "8123f304-f23f-440b-a6d3-80e979fa4cd6",
+        "owner": "Mary Matthews",
+        "label": "JWJYY",
+        "description": "x" * description_len,
+        "otherAttributes": [{"name": f"attr{i}", "value": f"value-{i}"} for i in range(n_attrs)],
+    }).encode("utf-8")
+
+
+def per_call_us(fn, body: bytes, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(lambda: fn(body), number=number, repeat=repeat)) / number * 1e6
+
+
+def run(attr_counts=(0, 10, 50, 200), number: int = 2000) -> List[Dict[str, Any]]:
+    results = []
+    for n in attr_counts:
+        body = make_payload(n)
+        assert legacy_path(body) == fast_path(body)
+        legacy_us = per_call_us(legacy_path, body, number)
+        fast_us = per_call_us(fast_path, body, number)
+        results.append({"otherAttributes": n, "bytes": len(body), "legacy_us": round(legacy_us, 2),
+                        "fast_us": round(fast_us, 2), "speedup": round(legacy_us / fast_us, 2)})
+    return results
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="WidgetRequest parse + flatten micro-benchmark")
+    p.add_argument("--number", type=int, default=2000, help="Calls per timing sample (default: 2000).")
+    args = p.parse_args(argv)
+
+    print(f"{'attrs':>6} {'bytes':>7} {'legacy us':>10} {'fast us':>9} {'speedup':>8}")
+    for r in run(number=args.number):
+        print(f"{r['otherAttributes']:>6} {r['bytes']:>7} {r['legacy_us']:>10} {r['fast_us']:>9} {r['speedup']:>7}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,266 @@
+# bench/bench_suite.py
+"""
+Component benchmarks against the in-memory AWS fakes (bench/fakes.py).
+
+Measures throughput and p50/p99 latency for:
+  - S3RequestPoller.get_next_request   (LIST + GET + DELETE + parse)
+  - WidgetRequest.from_json_bytes      (parse + validate)
+  - widget serialization: to_flat_widget_dict + TypeSerializer / json.dumps
+    against the direct to_dynamodb_item / to_widget_json_bytes
+  - consumer.main end to end           (poller -> router -> DynamoDB store)
+each at several payload sizes (number of otherAttributes).
+
+Results are written as JSON; pass --baseline to compare with an earlier run.
+Run from the repository root:
+
+    python -m bench.bench_suite --output bench_results.json
+    python -m bench.bench_suite --baseline bench_results.json --latency-ms 1
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from boto3.dynamodb.types import TypeSerializer
+
+import consumer
+from bench.fakes import FakeAWS
+from metrics import REGISTRY
+from models import WidgetRequest, to_dynamodb_item, to_flat_widget_dict, to_widget_json_bytes
+from poller_s3 import S3RequestPoller
+
+BUCKET2 = "bench-requests"
+TABLE = "bench-widgets"
+
+
+def request_body(i: int, n_attrs: int, description_len: int = 200) -> bytes:
+    return json.dumps({
+        "type": "WidgetCreateRequest",
+        "requestId": f"req-{i:08d}",
+        "widgetId": f"widget-{i:08d}",
+        "owner": "Mary Matthews",
+        "label": "JWJYY",
+        "description": "x" * description_len,
+        "otherAttributes": [{"name": f"attr{a}", "value": f"value-{a}"} for a in range(n_attrs)],
+    }).encode("utf-8")
+
+
+def seed_requests(fakes: FakeAWS, n: int, n_attrs: int) -> None:
+    bucket = fakes.s3.bucket(BUCKET2)
+    for i in range(n):
+        bucket[f"{i:010d}"] = request_body(i, n_attrs)
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+def summarize(name: str, params: Dict[str, Any], samples: List[float], elapsed: float,
+              **extra: Any) -> Dict[str, Any]:
+    """Turn per-operation latencies (seconds) into one result row."""
+    s = sorted(samples)
+    return {
+        "name": name,
+        "params": params,
+        "ops": len(s),
+        "throughput_per_s": round(len(s) / elapsed, 1) if elapsed else 0.0,
+        "p50_us": round(percentile(s, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(s, 0.99) * 1e6, 2),
+        **extra,
+    }
+
+
+def _timed(fn: Callable[[], Any], n: int) -> tuple:
+    samples = []
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(n):
+        t = clock()
+        fn()
+        samples.append(clock() - t)
+    return samples, clock() - start
+
+
+def _close_root_handlers() -> None:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        h.close()
+        root.removeHandler(h)
+
+
+def _quiet_logs() -> None:
+    """Send log records to /dev/null so per-request lines still cost what they
+    cost in production without flooding the terminal. consumer.main keeps
+    this handler as its console handler and removes it on exit."""
+    logging.getLogger().addHandler(logging.StreamHandler(open(os.devnull, "w")))
+
+
+# ---- benchmarks -------------------------------------------------------------
+
+def bench_poller(n: int, n_attrs: int, latency_ms: float, error_rate: float,
+                 page_size: int) -> Dict[str, Any]:
+    fakes = FakeAWS(latency_ms=latency_ms, error_rate=error_rate)
+    seed_requests(fakes, n, n_attrs)
+    _quiet_logs()
+    with fakes.installed():
+        poller = S3RequestPoller(BUCKET2, sleep_ms=0, page_size=page_size,
+                                 refill_threshold=page_size // 4 if page_size > 1 else 0)
+        got = []
+        samples, elapsed = _timed(lambda: got.append(poller.get_next_request()), n)
+        poller.close()
+    _close_root_handlers()
+    return summarize("poller.get_next_request",
+                     {"otherAttributes": n_attrs, "latency_ms": latency_ms, "error_rate": error_rate,
+                      "page_size": page_size},
+                     samples, elapsed, requests=sum(r is not None for r in got),
+                     calls=dict(fakes.faults.calls), errors=fakes.faults.errors)
+
+
+def bench_parse(n: int, n_attrs: int) -> Dict[str, Any]:
+    body = request_body(0, n_attrs)
+    samples, elapsed = _timed(lambda: WidgetRequest.from_json_bytes(body), n)
+    return summarize("models.from_json_bytes", {"otherAttributes": n_attrs, "bytes": len(body)},
+                     samples, elapsed)
+
+
+def bench_serialize(n: int, n_attrs: int) -> List[Dict[str, Any]]:
+    """Per-item cost of the generic and the direct widget serializers."""
+    req = WidgetRequest.from_json_bytes(request_body(0, n_attrs))
+    serializer = TypeSerializer()
+    variants = [
+        ("models.flatten+TypeSerializer", lambda: serializer.serialize(to_flat_widget_dict(req))["M"]),
+        ("models.to_dynamodb_item", lambda: to_dynamodb_item(req)),
+        ("models.flatten+json.dumps", lambda: json.dumps(to_flat_widget_dict(req)).encode("utf-8")),
+        ("models.to_widget_json_bytes", lambda: to_widget_json_bytes(req)),
+    ]
+    out = []
+    for name, fn in variants:
+        samples, elapsed = _timed(fn, n)
+        out.append(summarize(name, {"otherAttributes": n_attrs}, samples, elapsed))
+    return out
+
+
+def bench_consumer(n: int, n_attrs: int, latency_ms: float, error_rate: float,
+                   extra_args: List[str]) -> Dict[str, Any]:
+    """Run consumer.main until it has stored ``n`` seeded requests.
+
+    Per-request latency is the time between successive completed requests,
+    i.e. the service time of the loop as seen by the store.
+    """
+    fakes = FakeAWS(latency_ms=latency_ms, error_rate=error_rate, error_ops={"get_object"})
+    seed_requests(fakes, n, n_attrs)
+    done: List[float] = []
+    route = consumer.handle_request
+
+    def timed_route(req, store, log):
+        route(req, store, log)
+        done.append(time.perf_counter())
+
+    with tempfile.TemporaryDirectory() as tmp, fakes.installed():
+        _quiet_logs()
+        consumer.handle_request = timed_route
+        try:
+            start = time.perf_counter()
+            rc = consumer.main(["--bucket2", BUCKET2, "--target", "dynamodb", "--table", TABLE,
+                                "--sleep-ms", "1", "--stop-after", str(n), "--metrics-interval-s", "0",
+                                "--log-file", os.path.join(tmp, "consumer.log"), *extra_args])
+        finally:
+            consumer.handle_request = route
+    samples = [b - a for a, b in zip([start] + done, done)]
+    elapsed = (done[-1] - start) if done else 0.0
+    return summarize("consumer.main", {"otherAttributes": n_attrs, "latency_ms": latency_ms,
+                                       "error_rate": error_rate, "args": " ".join(extra_args)},
+                     samples, elapsed, rc=rc, stored=len(fakes.dynamodb.table(TABLE)),
+                     errors=fakes.faults.errors)
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for n_attrs in args.attrs:
+        results.append(bench_parse(args.number, n_attrs))
+        results.extend(bench_serialize(args.number, n_attrs))
+        results.append(bench_poller(args.requests, n_attrs, args.latency_ms, args.error_rate, 1))
+        results.append(bench_poller(args.requests, n_attrs, args.latency_ms, args.error_rate, 100))
+        results.append(bench_consumer(args.requests, n_attrs, args.latency_ms, args.error_rate, []))
+        REGISTRY.reset()
+    return results
+
+
+# ---- baseline comparison ----------------------------------------------------
+
+def _result_key(r: Dict[str, Any]) -> str:
+    return r["name"] + " " + json.dumps(r["params"], sort_keys=True)
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            tolerance: float) -> List[Dict[str, Any]]:
+    """Annotate results with the throughput change against a baseline run.
+
+    Returns the results whose throughput dropped by more than ``tolerance``.
+    """
+    base = {_result_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(_result_key(r))
+        if not b or not b["throughput_per_s"]:
+            continue
+        change = r["throughput_per_s"] / b["throughput_per_s"] - 1.0
+        r["vs_baseline"] = round(change, 3)
+        if change < -tolerance:
+            regressions.append(r)
+    return regressions
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'benchmark':<32} {'params':<60} {'ops/s':>10} {'p50 us':>9} {'p99 us':>9} {'vs base':>8}")
+    for r in results:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items() if v not in ("", None))
+        change = f"{r['vs_baseline']:+.1%}" if "vs_baseline" in r else "-"
+        print(f"{r['name']:<32} {params:<60} {r['throughput_per_s']:>10} {r['p50_us']:>9} "
+              f"{r['p99_us']:>9} {change:>8}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Consumer component benchmarks against in-memory AWS fakes")
+    p.add_argument("--attrs", type=lambda s: [int(x) for x in s.split(",")], default=[0, 10, 50],
+                   help="Comma-separated otherAttributes counts to test (default: 0,10,50).")
+    p.add_argument("--number", type=int, default=5000, help="Calls per parse/serialize benchmark (default: 5000).")
+    p.add_argument("--requests", type=int, default=500,
+                   help="Requests seeded for the poller and consumer benchmarks (default: 500).")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every fake AWS call (default: 0).")
+    p.add_argument("--error-rate", type=float, default=0.0,
+                   help="Fraction of fake GETs from Bucket 2 that fail with SlowDown (default: 0).")
+    p.add_argument("--output", default="bench_results.json", help="Where to write the JSON results.")
+    p.add_argument("--baseline", help="Earlier results file to compare throughput against.")
+    p.add_argument("--tolerance", type=float, default=0.10,
+                   help="Throughput drop vs baseline reported as a regression (default: 0.10).")
+    args = p.parse_args(argv)
+
+    results = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": {"python": sys.version.split()[0], "platform": platform.platform(),
+                            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}},
+                   "results": results}, f, indent=2)
+
+    _print_table(results)
+    print(f"\nWrote {len(results)} results to {args.output}")
+    for r in regressions:
+        print(f"REGRESSION: {r['name']} {r['params']} throughput {r['vs_baseline']:+.1%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,305 @@
+# bench/fakes.py
+"""
+In-memory stand-ins for the boto3 S3 and DynamoDB clients.
+
+They implement just the calls the consumer makes, with the same request and
+response shapes, so pollers and stores run unchanged against them. Every
+call can be given a fixed latency and a random failure rate to model a real
+network round trip:
+
+    fakes = FakeAWS(latency_ms=2, error_rate=0.01, error_ops={"get_object"})
+    with fakes.installed():          # boto3.client(...) now returns the fakes
+        consumer.main([...])
+
+Errors are raised as ``botocore.exceptions.ClientError`` (``SlowDown`` for S3,
+``ProvisionedThroughputExceededException`` for DynamoDB).
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class Faults:
+    """Per-call latency and failure injection shared by the fake clients."""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0,
+                 error_ops: Optional[Iterable[str]] = None, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_ops = set(error_ops) if error_ops is not None else None
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, op: str, code: str) -> None:
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            fail = (self.error_rate and (self.error_ops is None or op in self.error_ops)
+                    and self._rng.random() < self.error_rate)
+            if fail:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise ClientError({"Error": {"Code": code, "Message": "injected by bench fakes"}}, op)
+
+
+class _Body:
+    """Streaming body: read() everything or read(n) bytes at a time."""
+
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pos = 0
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        end = len(self._data) if amt is None else self._pos + amt
+        chunk = self._data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def close(self) -> None:
+        pass
+
+
+class _S3Exceptions:
+    NoSuchKey = type("NoSuchKey", (ClientError,), {})
+    NoSuchBucket = type("NoSuchBucket", (ClientError,), {})
+
+
+class FakeS3Client:
+    """Buckets are dicts of key -> bytes; listing is lexicographic like S3."""
+
+    exceptions = _S3Exceptions
+
+    def __init__(self, faults: Optional[Faults] = None):
+        self.faults = faults or Faults()
+        self.buckets: Dict[str, Dict[str, bytes]] = {}
+        self.headers: Dict[tuple, dict] = {}  # (bucket, key) -> ContentType/ContentEncoding
+        self.modified: Dict[tuple, float] = {}  # (bucket, key) -> epoch seconds of the last put
+        self._lock = threading.Lock()
+
+    def bucket(self, name: str) -> Dict[str, bytes]:
+        with self._lock:
+            return self.buckets.setdefault(name, {})
+
+    def _existing(self, name: str, op: str) -> Dict[str, bytes]:
+        b = self.buckets.get(name)
+        if b is None:
+            raise self.exceptions.NoSuchBucket(
+                {"Error": {"Code": "NoSuchBucket", "Message": f"{name} does not exist"}}, op)
+        return b
+
+    def list_objects_v2(self, Bucket: str, MaxKeys: int = 1000, Prefix: str = "",
+                        StartAfter: str = "", ContinuationToken: str = "", Delimiter: str = "",
+                        **kwargs) -> dict:
+        self.faults("list_objects_v2", "SlowDown")
+        b = self._existing(Bucket, "ListObjectsV2")
+        after = max(StartAfter, ContinuationToken)
+        contents, common, more, last = [], [], False, ""
+        with self._lock:
+            for k in sorted(k for k in b if k.startswith(Prefix) and k > after):
+                cut = k.find(Delimiter, len(Prefix)) if Delimiter else -1
+                cp = k[:cut + len(Delimiter)] if cut >= 0 else None
+                if cp is not None and common and common[-1] == cp:
+                    continue
+                if len(contents) + len(common) == MaxKeys:
+                    more = True
+                    break
+                if cp is not None:
+                    common.append(cp)
+                    last = cp + "\U0010ffff"  # resume after the whole common prefix
+                else:
+                    contents.append((k, b[k], self.modified.get((Bucket, k))))
+                    last = k
+        resp = {"KeyCount": len(contents) + len(common), "IsTruncated": more}
+        if more:
+            resp["NextContinuationToken"] = last
+        if contents:
+            resp["Contents"] = []
+            for k, data, ts in contents:
+                entry = {"Key": k, "Size": len(data), "ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+                if ts is not None:
+                    entry["LastModified"] = datetime.fromtimestamp(ts, timezone.utc)
+                resp["Contents"].append(entry)
+        if common:
+            resp["CommonPrefixes"] = [{"Prefix": cp} for cp in common]
+        return resp
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.faults("get_object", "SlowDown")
+        b = self._existing(Bucket, "GetObject")
+        with self._lock:
+            data = b.get(Key)
+        if data is None:
+            raise self.exceptions.NoSuchKey(
+                {"Error": {"Code": "NoSuchKey", "Message": f"{Key} not found"}}, "GetObject")
+        resp = {"Body": _Body(data), "ContentLength": len(data)}
+        resp.update(self.headers.get((Bucket, Key), {}))
+        return resp
+
+    def put_object(self, Bucket: str, Key: str, Body, **kwargs) -> dict:
+        self.faults("put_object", "SlowDown")
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        b = self.bucket(Bucket)
+        headers = {h: kwargs[h] for h in ("ContentType", "ContentEncoding") if h in kwargs}
+        with self._lock:
+            b[Key] = data
+            self.modified[(Bucket, Key)] = time.time()
+            if headers:
+                self.headers[(Bucket, Key)] = headers
+            else:
+                self.headers.pop((Bucket, Key), None)
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def _forget(self, bucket: str, key: str) -> None:
+        """Drop a deleted key's metadata (caller holds the lock)."""
+        self.headers.pop((bucket, key), None)
+        self.modified.pop((bucket, key), None)
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.faults("delete_object", "SlowDown")
+        b = self._existing(Bucket, "DeleteObject")
+        with self._lock:
+            b.pop(Key, None)
+            self._forget(Bucket, Key)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: dict, **kwargs) -> dict:
+        self.faults("delete_objects", "SlowDown")
+        b = self._existing(Bucket, "DeleteObjects")
+        with self._lock:
+            for o in Delete["Objects"]:
+                b.pop(o["Key"], None)
+                self._forget(Bucket, o["Key"])
+        return {} if Delete.get("Quiet") else {"Deleted": [{"Key": o["Key"]} for o in Delete["Objects"]]}
+
+
+class FakeDynamoClient:
+    """Tables are dicts of hash-key value -> item (attribute-value form)."""
+
+    def __init__(self, faults: Optional[Faults] = None, hash_key: str = "widgetId"):
+        self.faults = faults or Faults()
+        self.hash_key = hash_key
+        self.tables: Dict[str, Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> Dict[str, dict]:
+        with self._lock:
+            return self.tables.setdefault(name, {})
+
+    def _id(self, key: dict) -> str:
+        return key[self.hash_key]["S"]
+
+    def put_item(self, TableName: str, Item: dict, **kwargs) -> dict:
+        self.faults("put_item", "ProvisionedThroughputExceededException")
+        t = self.table(TableName)
+        with self._lock:
+            t[self._id(Item)] = dict(Item)
+        return {}
+
+    def get_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        self.faults("get_item", "ProvisionedThroughputExceededException")
+        t = self.table(TableName)
+        with self._lock:
+            item = t.get(self._id(Key))
+        return {"Item": dict(item)} if item is not None else {}
+
+    def update_item(self, TableName: str, Key: dict, UpdateExpression: str,
+                    ExpressionAttributeNames: Optional[dict] = None,
+                    ExpressionAttributeValues: Optional[dict] = None,
+                    ConditionExpression: str = "", ReturnValues: str = "NONE", **kwargs) -> dict:
+        """Supports ``SET #n = :v, ...`` and ``REMOVE #n, ...`` clauses and an
+        ``attribute_exists(...)`` condition on the hash key."""
+        self.faults("update_item", "ProvisionedThroughputExceededException")
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        sets, removes = [], []
+        for clause in re.split(r"\s(?=SET |REMOVE )", " " + UpdateExpression.strip()):
+            action, _, rest = clause.strip().partition(" ")
+            parts = [p.strip() for p in rest.split(",") if p.strip()]
+            if action == "SET":
+                sets += [tuple(x.strip() for x in p.split("=")) for p in parts]
+            elif action == "REMOVE":
+                removes += parts
+        t = self.table(TableName)
+        with self._lock:
+            item = t.get(self._id(Key))
+            if item is None and ConditionExpression.startswith("attribute_exists"):
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException",
+                                             "Message": "The conditional request failed"}}, "UpdateItem")
+            item = dict(item) if item is not None else dict(Key)
+            for name, value in sets:
+                item[names.get(name, name)] = values[value]
+            for name in removes:
+                item.pop(names.get(name, name), None)
+            t[self._id(Key)] = item
+        return {"Attributes": dict(item)} if ReturnValues == "ALL_NEW" else {}
+
+    def delete_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        self.faults("delete_item", "ProvisionedThroughputExceededException")
+        t = self.table(TableName)
+        with self._lock:
+            t.pop(self._id(Key), None)
+        return {}
+
+    def scan(self, TableName: str, Limit: int = 1000, ExclusiveStartKey: Optional[dict] = None,
+             **kwargs) -> dict:
+        self.faults("scan", "ProvisionedThroughputExceededException")
+        t = self.table(TableName)
+        after = self._id(ExclusiveStartKey) if ExclusiveStartKey else ""
+        with self._lock:
+            ids = sorted(i for i in t if i > after)
+            items = [dict(t[i]) for i in ids[:Limit]]
+        resp = {"Items": items, "Count": len(items)}
+        if len(ids) > Limit:
+            resp["LastEvaluatedKey"] = {self.hash_key: {"S": ids[Limit - 1]}}
+        return resp
+
+    def batch_write_item(self, RequestItems: dict, **kwargs) -> dict:
+        self.faults("batch_write_item", "ProvisionedThroughputExceededException")
+        for name, requests in RequestItems.items():
+            t = self.table(name)
+            with self._lock:
+                for r in requests:
+                    if "PutRequest" in r:
+                        item = r["PutRequest"]["Item"]
+                        t[self._id(item)] = dict(item)
+                    else:
+                        t.pop(self._id(r["DeleteRequest"]["Key"]), None)
+        return {"UnprocessedItems": {}}
+
+
+class FakeAWS:
+    """One fake S3 and one fake DynamoDB client sharing a fault profile."""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0,
+                 error_ops: Optional[Iterable[str]] = None, seed: Optional[int] = 0):
+        self.faults = Faults(latency_ms, error_rate, error_ops, seed)
+        self.s3 = FakeS3Client(self.faults)
+        self.dynamodb = FakeDynamoClient(self.faults)
+
+    def client(self, service_name: str, *args, **kwargs):
+        if service_name == "s3":
+            return self.s3
+        if service_name == "dynamodb":
+            return self.dynamodb
+        raise ValueError(f"no fake for service {service_name!r}")
+
+    @contextmanager
+    def installed(self):
+        """Route ``boto3.client`` to these fakes for the duration of the block."""
+        original = boto3.client
+        boto3.client = self.client
+        try:
+            yield self
+        finally:
+            boto3.client = original
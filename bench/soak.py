@@ -0,0 +1,370 @@
+# bench/soak.py
+"""
+End-to-end load generator and soak test against the in-memory AWS fakes.
+
+A producer thread writes synthetic WidgetRequests into Bucket 2 at a target
+rate while consumer.main runs in the foreground against the same fakes
+(bench/fakes.py), so the whole path producer -> Bucket 2 -> consumer ->
+Bucket 3 / DynamoDB is exercised in one process. The mix is 80% creates,
+15% updates and 5% deletes over a fixed pool of widget ids (so the stores
+stop growing once every widget exists); ``otherAttributes`` counts and
+``description`` lengths are drawn from long-tailed (log-normal)
+distributions.
+
+Every create/update carries its enqueue time as the ``enqueuedAt``
+attribute. A probe on the fake sink clients reads it back when the write
+lands, which gives the end-to-end latency of each request per target.
+Once a second the harness samples queue lag (objects waiting in Bucket 2
+and the age of the oldest), progress and process RSS.
+
+The report (printed, and written as JSON) has sustained throughput,
+p50/p95/p99/max latency, the lag time series and memory growth after
+warm-up. The exit status is 1 if an SLO is missed (--slo-p99-ms,
+--slo-min-throughput). Run from the repository root:
+
+    python -m bench.soak --rate 500 --duration-s 3600 --latency-ms 2
+    python -m bench.soak --rate 200 --duration-s 60 --consumer-args "--engine pipeline --writers 4"
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import consumer
+from bench.bench_suite import BUCKET2, TABLE, _close_root_handlers, _quiet_logs
+from bench.fakes import FakeAWS
+from metrics import Histogram
+from models import OtherAttribute, WidgetRequest, to_json_bytes
+
+BUCKET3 = "bench-widgets"
+STAMP = "enqueuedAt"
+
+# End-to-end latency buckets: 1 ms to ~2 min, ~10% apart
+LATENCY_BUCKETS = tuple(0.001 * 1.1 ** i for i in range(124))
+
+OWNERS = ("Mary Matthews", "Alice Smith", "Bob Jones", "Carol White", "Dan Brown")
+
+
+def _lognormal_int(rng: random.Random, median: float, sigma: float, cap: int) -> int:
+    return min(cap, int(rng.lognormvariate(0.0, sigma) * median))
+
+
+class LoadGenerator:
+    """
+    Writes requests into Bucket 2 at ``rate`` per second for ``total`` requests.
+
+    Sends are scheduled on an absolute timetable (start + i / rate), so a
+    slow put delays one request instead of lowering the rate. Keys are the
+    sequence number, so the consumer sees them in enqueue order.
+    """
+
+    def __init__(self, fakes: FakeAWS, rate: float, total: int, widgets: int = 10_000,
+                 attrs_median: float = 5, description_median: float = 200, seed: int = 0):
+        self.fakes = fakes
+        self.rate = rate
+        self.total = total
+        self.widgets = widgets
+        self.attrs_median = attrs_median
+        self.description_median = description_median
+        self.rng = random.Random(seed)
+        self.sent = 0
+        self.deletes = 0
+        self.bytes = 0
+        self._owners: Dict[str, str] = {}  # widgetId -> owner, so updates keep the S3 key
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loadgen", daemon=True)
+
+    def start(self) -> "LoadGenerator":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def make_request(self, i: int) -> WidgetRequest:
+        rng = self.rng
+        widget_id = f"widget-{rng.randrange(self.widgets):08d}"
+        owner = self._owners.setdefault(widget_id, rng.choice(OWNERS))
+        roll = rng.random()
+        kind = "WidgetCreateRequest" if roll < 0.80 else "WidgetUpdateRequest" if roll < 0.95 else "WidgetDeleteRequest"
+        if kind == "WidgetDeleteRequest":
+            return WidgetRequest(type=kind, requestId=f"req-{i:010d}", widgetId=widget_id, owner=owner)
+        n_attrs = _lognormal_int(rng, self.attrs_median, 1.0, 100)
+        attrs = [OtherAttribute(f"attr{a}", f"value-{rng.randrange(1 << 30):x}") for a in range(n_attrs)]
+        attrs.append(OtherAttribute(STAMP, f"{time.time():.6f}"))
+        description = None
+        if rng.random() < 0.7:
+            description = "x" * _lognormal_int(rng, self.description_median, 1.0, 4000)
+        return WidgetRequest(type=kind, requestId=f"req-{i:010d}", widgetId=widget_id, owner=owner,
+                             label=f"L{rng.randrange(1000)}", description=description, otherAttributes=attrs)
+
+    def _run(self) -> None:
+        start = time.monotonic()
+        for i in range(self.total):
+            delay = start + i / self.rate - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            req = self.make_request(i)
+            body = to_json_bytes(req)
+            self.fakes.s3.put_object(Bucket=BUCKET2, Key=f"{i:012d}", Body=body)
+            self.sent += 1
+            self.bytes += len(body)
+            self.deletes += req.type == "WidgetDeleteRequest"
+
+
+class SinkProbe:
+    """
+    Wraps the fake sink calls and records ``now - enqueuedAt`` per target for
+    every create/update that lands in Bucket 3 or the table.
+    """
+
+    def __init__(self, fakes: FakeAWS):
+        self.latency = {"s3": Histogram(LATENCY_BUCKETS), "dynamodb": Histogram(LATENCY_BUCKETS)}
+        self.max = {"s3": 0.0, "dynamodb": 0.0}
+        self._lock = threading.Lock()
+        s3, ddb = fakes.s3, fakes.dynamodb
+        s3.put_object = self._wrap(s3.put_object, self._s3_stamps, "s3")
+        ddb.put_item = self._wrap(ddb.put_item, self._item_stamps, "dynamodb")
+        ddb.update_item = self._wrap(ddb.update_item, self._update_stamps, "dynamodb")
+        ddb.batch_write_item = self._wrap(ddb.batch_write_item, self._batch_stamps, "dynamodb")
+
+    def _wrap(self, fn, stamps, target: str):
+        def call(**kwargs):
+            resp = fn(**kwargs)
+            now = time.time()
+            for stamp in stamps(kwargs):
+                self._observe(target, now - float(stamp))
+            return resp
+        return call
+
+    def _observe(self, target: str, seconds: float) -> None:
+        self.latency[target].observe(seconds)
+        with self._lock:
+            self.max[target] = max(self.max[target], seconds)
+
+    @staticmethod
+    def _s3_stamps(kw: dict) -> List[str]:
+        if kw["Bucket"] == BUCKET2:
+            return []
+        stamp = json.loads(kw["Body"]).get(STAMP)
+        return [stamp] if stamp else []
+
+    @staticmethod
+    def _item_stamps(kw: dict) -> List[str]:
+        attr = kw["Item"].get(STAMP)
+        return [attr["S"]] if attr else []
+
+    @staticmethod
+    def _update_stamps(kw: dict) -> List[str]:
+        names = kw.get("ExpressionAttributeNames") or {}
+        values = kw.get("ExpressionAttributeValues") or {}
+        # DynamoWidgetStore pairs #aN with :vN
+        return [values[":v" + k[2:]]["S"] for k, name in names.items()
+                if name == STAMP and ":v" + k[2:] in values]
+
+    @classmethod
+    def _batch_stamps(cls, kw: dict) -> List[str]:
+        return [s for reqs in kw["RequestItems"].values() for r in reqs if "PutRequest" in r
+                for s in cls._item_stamps({"Item": r["PutRequest"]["Item"]})]
+
+
+def rss_bytes() -> int:
+    """Current resident set size (falls back to the peak where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Sampler:
+    """Once per ``interval_s``: queue depth, oldest waiting age, progress and RSS."""
+
+    def __init__(self, fakes: FakeAWS, gen: LoadGenerator, probe: SinkProbe, interval_s: float = 1.0):
+        self.fakes = fakes
+        self.gen = gen
+        self.probe = probe
+        self.interval = interval_s
+        self.samples: List[Dict[str, Any]] = []
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="soak-sampler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        s3 = self.fakes.s3
+        bucket = s3.bucket(BUCKET2)
+        with s3._lock:
+            waiting = list(bucket)
+            oldest = s3.modified.get((BUCKET2, min(waiting))) if waiting else None
+        now = time.time()
+        self.samples.append({
+            "t_s": round(time.monotonic() - self._start, 2),
+            "sent": self.gen.sent,
+            "stored": sum(h.count for h in self.probe.latency.values()),
+            "queue_depth": len(waiting),
+            "queue_lag_s": round(now - oldest, 3) if oldest else 0.0,
+            "rss_mb": round(rss_bytes() / 2 ** 20, 1),
+        })
+
+
+def _slope_per_hour(points: List[tuple]) -> float:
+    """Least-squares slope of (seconds, value) points, per hour."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / var * 3600 if var else 0.0
+
+
+def report(gen: LoadGenerator, probe: SinkProbe, sampler: Sampler, elapsed: float, rc: int,
+           warmup: float = 0.1) -> Dict[str, Any]:
+    latency = {}
+    for target, h in probe.latency.items():
+        if h.count:
+            latency[target] = {"stored": h.count, "throughput_per_s": round(h.count / elapsed, 1),
+                               **{f"p{q}_ms": round(h.quantile(q / 100) * 1000, 1) for q in (50, 95, 99)},
+                               "max_ms": round(probe.max[target] * 1000, 1)}
+    samples = sampler.samples
+    steady = [s for s in samples if s["t_s"] >= warmup * samples[-1]["t_s"]] if samples else []
+    return {
+        "rc": rc,
+        "sent": gen.sent,
+        "deletes": gen.deletes,
+        "mean_request_bytes": round(gen.bytes / gen.sent) if gen.sent else 0,
+        "elapsed_s": round(elapsed, 2),
+        "processed_per_s": round(gen.sent / elapsed, 1) if elapsed else 0.0,
+        "latency": latency,
+        "queue": {"max_depth": max((s["queue_depth"] for s in samples), default=0),
+                  "max_lag_s": max((s["queue_lag_s"] for s in samples), default=0.0)},
+        "memory": {"start_mb": samples[0]["rss_mb"] if samples else 0.0,
+                   "after_warmup_mb": steady[0]["rss_mb"] if steady else 0.0,
+                   "end_mb": samples[-1]["rss_mb"] if samples else 0.0,
+                   # A slope from less than a minute of samples says nothing about an hour
+                   "growth_mb_per_hour": (round(_slope_per_hour([(s["t_s"], s["rss_mb"]) for s in steady]), 1)
+                                          if steady and steady[-1]["t_s"] - steady[0]["t_s"] >= 60 else None)},
+        "timeline": samples,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fakes = FakeAWS(latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed)
+    fakes.s3.bucket(BUCKET2)
+    total = int(args.rate * args.duration_s)
+    gen = LoadGenerator(fakes, args.rate, total, widgets=args.widgets, attrs_median=args.attrs_median,
+                        description_median=args.description_median, seed=args.seed)
+    probe = SinkProbe(fakes)
+    sampler = Sampler(fakes, gen, probe, args.sample_s)
+
+    targets = args.target.split(",")
+    consumer_args = ["--bucket2", BUCKET2, "--target", args.target, "--sleep-ms", "1",
+                     "--stop-after", str(total), "--metrics-interval-s", "0"]
+    if "s3" in targets:
+        consumer_args += ["--bucket3", BUCKET3]
+    if "dynamodb" in targets:
+        consumer_args += ["--table", TABLE]
+
+    with tempfile.TemporaryDirectory() as tmp, fakes.installed():
+        _quiet_logs()
+        start = time.monotonic()
+        sampler.start()
+        gen.start()
+        try:
+            rc = consumer.main(consumer_args + ["--log-file", os.path.join(tmp, "consumer.log")]
+                               + shlex.split(args.consumer_args))
+        finally:
+            gen.stop()
+            elapsed = time.monotonic() - start
+            sampler.stop()
+            _close_root_handlers()
+    return report(gen, probe, sampler, elapsed, rc)
+
+
+def slo_violations(result: Dict[str, Any], p99_ms: float, min_throughput: float) -> List[str]:
+    out = []
+    if result["rc"] != 0:
+        out.append(f"consumer exited with {result['rc']}")
+    if result["processed_per_s"] < min_throughput:
+        out.append(f"throughput {result['processed_per_s']}/s < {min_throughput}/s")
+    for target, lat in result["latency"].items():
+        if lat["p99_ms"] > p99_ms:
+            out.append(f"{target} p99 {lat['p99_ms']}ms > {p99_ms}ms")
+    return out
+
+
+def _print_report(result: Dict[str, Any]) -> None:
+    print(f"sent={result['sent']} in {result['elapsed_s']}s -> {result['processed_per_s']}/s "
+          f"(mean request {result['mean_request_bytes']} bytes, {result['deletes']} deletes)")
+    for target, lat in result["latency"].items():
+        print(f"  {target:<9} stored={lat['stored']} p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms "
+              f"p99={lat['p99_ms']}ms max={lat['max_ms']}ms")
+    q, m = result["queue"], result["memory"]
+    print(f"  queue     max_depth={q['max_depth']} max_lag={q['max_lag_s']}s")
+    print(f"  memory    start={m['start_mb']}MB after_warmup={m['after_warmup_mb']}MB end={m['end_mb']}MB "
+          f"growth={m['growth_mb_per_hour'] if m['growth_mb_per_hour'] is not None else '-'}MB/h")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="End-to-end soak test of consumer.main against in-memory AWS fakes")
+    p.add_argument("--rate", type=float, default=200.0, help="Requests written to Bucket 2 per second (default: 200).")
+    p.add_argument("--duration-s", type=float, default=60.0, help="How long the producer runs (default: 60).")
+    p.add_argument("--target", default="dynamodb", help="Consumer --target value (default: dynamodb).")
+    p.add_argument("--consumer-args", default="", help="Extra consumer.main arguments, e.g. \"--engine pipeline\".")
+    p.add_argument("--widgets", type=int, default=10_000, help="Size of the widget id pool (default: 10000).")
+    p.add_argument("--attrs-median", type=float, default=5, help="Median otherAttributes count (default: 5).")
+    p.add_argument("--description-median", type=float, default=200,
+                   help="Median description length in characters (default: 200).")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every fake AWS call (default: 0).")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake AWS calls that fail (default: 0).")
+    p.add_argument("--sample-s", type=float, default=1.0, help="Queue/memory sampling interval (default: 1).")
+    p.add_argument("--seed", type=int, default=0, help="Random seed for the request mix (default: 0).")
+    p.add_argument("--slo-p99-ms", type=float, default=1000.0, help="p99 end-to-end latency SLO (default: 1000).")
+    p.add_argument("--slo-min-throughput", type=float, default=None,
+                   help="Minimum sustained requests/s (default: 95%% of --rate).")
+    p.add_argument("--output", default="soak_results.json", help="Where to write the JSON report.")
+    args = p.parse_args(argv)
+    if args.rate <= 0 or args.duration_s <= 0:
+        p.error("--rate and --duration-s must be > 0")
+
+    result = run(args)
+    min_throughput = args.slo_min_throughput if args.slo_min_throughput is not None else 0.95 * args.rate
+    violations = slo_violations(result, args.slo_p99_ms, min_throughput)
+    with open(args.output, "w") as f:
+        json.dump({"meta": {"python": sys.version.split()[0], "platform": platform.platform(),
+                            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                            "args": {k: v for k, v in vars(args).items() if k != "output"}},
+                   "result": result, "slo_violations": violations}, f, indent=2)
+
+    _print_report(result)
+    print(f"\nWrote report to {args.output}")
+    for v in violations:
+        print(f"SLO MISSED: {v}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+# clients.py
+import logging
+import threading
+from typing import Any, Dict
+
+DEFAULT_POOL_CONNECTIONS = 10  # botocore's own default
+RETRY_MODES = ("legacy", "standard", "adaptive")
+
+
+class ClientFactory:
+    """
+    Creates the boto3 clients for one consumer process.
+
+    Every component asks the same factory for its clients, so the poller and
+    the S3 store share one S3 client (and connection pool) and all clients
+    come from boto3's default session with one botocore ``Config``: pool size,
+    retry mode/attempts, timeouts and TCP keep-alive. ``client(name)`` returns
+    a LazyClient; the real client (and the ``boto3`` import) is only created
+    on its first call, so ``--help`` and argument errors never pay for it.
+
+    Clients are created through ``boto3.client`` so tests that monkeypatch it
+    keep working. Factories are cheap and are not shared between runs.
+    """
+
+    def __init__(self, max_pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 retry_mode: str = "standard", max_attempts: int = 3,
+                 connect_timeout_s: float = 5.0, read_timeout_s: float = 30.0,
+                 tcp_keepalive: bool = True):
+        if max_pool_connections < 1:
+            raise ValueError("max_pool_connections must be >= 1")
+        if retry_mode not in RETRY_MODES:
+            raise ValueError(f"retry_mode must be one of {', '.join(RETRY_MODES)}")
+        self.max_pool_connections = max_pool_connections
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self.connect_timeout = connect_timeout_s
+        self.read_timeout = read_timeout_s
+        self.tcp_keepalive = tcp_keepalive
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name: str) -> "LazyClient":
+        return LazyClient(self, service_name)
+
+    def get(self, service_name: str):
+        """Return the real client for ``service_name``, creating it once."""
+        client = self._clients.get(service_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(service_name)
+                if client is None:
+                    client = self._clients[service_name] = self._create(service_name)
+        return client
+
+    def describe(self) -> str:
+        return (f"pool={self.max_pool_connections} retries={self.retry_mode}/{self.max_attempts} "
+                f"timeouts={self.connect_timeout:g}s/{self.read_timeout:g}s keepalive={self.tcp_keepalive}")
+
+    def _create(self, service_name: str):
+        import boto3
+        from botocore.config import Config
+
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            retries={"mode": self.retry_mode, "max_attempts": self.max_attempts},
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+        self.log.info(f"Created {service_name} client ({self.describe()})")
+        return boto3.client(service_name, config=config)
+
+
+class LazyClient:
+    """Stands in for a boto3 client and creates it on first attribute access."""
+
+    def __init__(self, factory: ClientFactory, service_name: str):
+        self._factory = factory
+        self._service = service_name
+
+    @property
+    def created(self) -> bool:
+        return self._service in self._factory._clients
+
+    def __getattr__(self, name: str):
+        value = getattr(self._factory.get(self._service), name)
+        # Cache on the instance so later calls skip __getattr__ entirely
+        self.__dict__[name] = value
+        return value
+
+
+def pool_size_for(concurrency: int, writers: int = 0) -> int:
+    """Connections needed so concurrent fetches and writes never queue for a socket."""
+    return max(DEFAULT_POOL_CONNECTIONS, concurrency + writers + 2)
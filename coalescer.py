@@ -0,0 +1,148 @@
+# coalescer.py
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+from batching import FlushTimer
+from models import WidgetRequest, merge_update
+
+# Pending operation per widget: ("put" | "delete" | "update", request)
+Op = Tuple[str, WidgetRequest]
+
+
+def fold(prev: Optional[Op], new: Op) -> Op:
+    """Combine two successive operations on the same widget into one.
+
+    The result leaves the store in the same state as running both in order:
+    put/delete replace whatever came before; an update merges into an earlier
+    put or update; an update after a delete is a no-op (there is no widget to
+    update), so the delete stands.
+    """
+    if prev is None or new[0] in ("put", "delete"):
+        return new
+    kind, base = prev
+    if kind == "delete":
+        return prev
+    return kind, merge_update(base, new[1])
+
+
+class CoalescingStore:
+    """
+    Collects writes over a short window and issues one final operation per widget.
+
+    Wraps a store with the put/delete/update interface. Operations are folded
+    per store key (``store.widget_key`` when available, so an S3 owner change
+    is not merged into another object) and flushed when ``max_batch``
+    operations have arrived, when the window (``window_ms``) expires, or on
+    close(). Keys are flushed in the order they were first seen; folding only
+    ever combines operations on one key, so the result matches serial
+    processing. ``received``, ``issued`` and ``saved`` report the effect. A
+    failure during a timed flush is re-raised on the next call or on close().
+    When a store call fails, it and the operations not yet issued go back in
+    front of the buffer (folded under anything newer for the same key), so
+    the next flush retries them instead of losing them.
+    """
+
+    def __init__(self, store, window_ms: int = 50, max_batch: int = 100):
+        self.store = store
+        self.window = max(1, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._key = getattr(store, "widget_key", lambda r: r.widgetId)
+
+        self.received = 0
+        self.issued = 0
+
+        self._pending: dict[str, Op] = {}
+        self._error: Optional[BaseException] = None
+        self._batch_ops = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = FlushTimer(self.window / 2, self._flush_if_due, name="coalesce-flush").start()
+
+    @property
+    def saved(self) -> int:
+        return self.received - self.issued - self.pending()
+
+    def widget_key(self, req: WidgetRequest) -> str:
+        return self._key(req)
+
+    def put_widget(self, req: WidgetRequest) -> str:
+        return self._add("put", req)
+
+    def delete_widget(self, req: WidgetRequest) -> str:
+        return self._add("delete", req)
+
+    def update_widget(self, req: WidgetRequest) -> str:
+        return self._add("update", req)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                ops, self._pending = list(self._pending.items()), {}
+                self._batch_ops = 0
+            for i, (key, (kind, req)) in enumerate(ops):
+                try:
+                    getattr(self.store, f"{kind}_widget")(req)
+                except Exception:
+                    self._requeue(ops[i:])
+                    raise
+                self.issued += 1
+
+    def _requeue(self, ops: list) -> None:
+        """Put unissued operations back in front, under any newer ones for the same key."""
+        with self._lock:
+            if not self._pending:
+                self._opened = time.monotonic()
+            requeued = {}
+            for key, op in ops:
+                requeued[key] = fold(op, self._pending.pop(key)) if key in self._pending else op
+            requeued.update(self._pending)
+            self._pending = requeued
+
+    def close(self) -> None:
+        self._timer.stop()
+        try:
+            self.flush()
+            self._raise_pending_error()
+        finally:
+            self.log.info(f"Coalescer: received={self.received} issued={self.issued} saved={self.saved}")
+            close = getattr(self.store, "close", None)
+            if close is not None:
+                close()
+
+    def _add(self, kind: str, req: WidgetRequest) -> str:
+        self._raise_pending_error()
+        key = self._key(req)
+        with self._lock:
+            if not self._pending:
+                self._opened = time.monotonic()
+            self._pending[key] = fold(self._pending.get(key), (kind, req))
+            self.received += 1
+            self._batch_ops += 1
+            full = self._batch_ops >= self.max_batch
+        if full:
+            self.flush()
+        return key
+
+    def _flush_if_due(self) -> None:
+        with self._lock:
+            due = bool(self._pending) and time.monotonic() - self._opened >= self.window
+        if not due:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            self.log.error(f"Timed flush failed: {e}")
+            self._error = e
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
@@ -1,27 +1,52 @@
 # consumer.py
 import argparse
+import copy
+import functools
 import logging
+import logging.handlers
+import os
 import sys
-from typing import Optional
+from typing import Callable, Optional
 
-from poller_s3 import S3RequestPoller
+from poller_s3 import FairS3RequestPoller, S3RequestPoller, MAX_LIST_KEYS, MAX_DELETE_KEYS, parse_prefix_weights
 from storage_s3 import S3WidgetStore
-from storage_dynamodb import DynamoWidgetStore
+from storage_dynamodb import DynamoWidgetStore, BatchedDynamoWidgetStore, MAX_BATCH_WRITE
 from router import handle_request
+from idle import AdaptiveIdle, FixedIdle
+from pipeline import PipelineEngine
+from async_engine import AsyncioEngine
+from writer_pool import PartitionedWriterPool
+from supervisor import Supervisor
+from coalescer import CoalescingStore
+from metrics import REGISTRY, MetricsServer, ThroughputReporter
+from clients import ClientFactory, RETRY_MODES, pool_size_for
+from ratelimit import AdaptiveRateLimiter, RateLimitedStore
+from idempotency import RequestIdCache
+from content_cache import ContentHashCache, WidgetDocumentCache
+from spool import SegmentSpool, SpoolDrain
+from fanout import FanOutError, FanOutStore
+import logqueue
 
 
-def setup_logging(log_path: str) -> logging.Logger:
+def setup_logging(log_path: str, mode: str = "sync", fmt: str = "text",
+                  sample_rate: float = 1.0) -> logging.Logger:
     """Configure root logger to write to both file and stdout.
 
     Important for tests: we always (re)create the FileHandler for the requested
     log_path, removing any prior FileHandlers that may point elsewhere.
+
+    ``mode="queue"`` hands records to a background thread (see logqueue.py)
+    that formats and writes them; ``fmt="json"`` writes JSON lines; with
+    ``sample_rate`` < 1 only that share of per-request INFO lines is kept.
     """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
+    logqueue.stop()
 
-    # Remove any existing FileHandlers so we can guarantee the target path
+    # Remove any existing FileHandlers (and a previous run's queue) so we can
+    # guarantee the target path
     for h in list(logger.handlers):
-        if isinstance(h, logging.FileHandler):
+        if isinstance(h, (logging.FileHandler, logging.handlers.QueueHandler)):
             try:
                 h.flush()
                 h.close()
@@ -29,90 +54,589 @@ def setup_logging(log_path: str) -> logging.Logger:
                 pass
             logger.removeHandler(h)
 
+    formatter = logqueue.make_formatter(fmt)
+    logqueue.set_sample_rate(sample_rate)
+
     # Fresh file handler for the requested path
     fh = logging.FileHandler(log_path)
     fh.setLevel(logging.INFO)
-    fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    fh.setFormatter(formatter)
     logger.addHandler(fh)
+    handlers = [fh]
 
     # Ensure there is exactly one console handler
     has_stream = any(isinstance(h, logging.StreamHandler) for h in logger.handlers)
     if not has_stream:
         sh = logging.StreamHandler(sys.stdout)
         sh.setLevel(logging.INFO)
-        sh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+        sh.setFormatter(formatter)
         logger.addHandler(sh)
+        handlers.append(sh)
+
+    if mode == "queue":
+        logqueue.start(logger, handlers)
 
     return logging.getLogger("consumer")
 
 
+class SerialEngine:
+    """The original loop: list -> get -> delete -> parse -> store, one at a time.
+
+    With ``retry_on`` (exception types) the poller must defer acks: a request
+    is deleted from Bucket 2 only after the handler returns, and a handler
+    error of those types requeues it for a later retry instead of stopping.
+    """
+
+    def __init__(self, poller, handler, retry_on: tuple = ()):
+        self.poller = poller
+        self.handler = handler
+        self.retry_on = retry_on
+        self.processed = 0
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def run(self, stop_after: int = 0) -> int:
+        while not (stop_after and self.processed >= stop_after):
+            req = self.poller.get_next_request()
+            if req is None:
+                # poller already slept; just continue
+                continue
+
+            if not self.retry_on:
+                self.handler(req)
+                self.processed += 1
+                continue
+            try:
+                self.handler(req)
+            except self.retry_on as e:
+                self.log.error(f"Request {req.requestId} not stored everywhere; left in Bucket 2 to retry: {e}")
+                self.poller.settle(False)
+                continue
+            except Exception:
+                self.poller.settle(False)
+                raise
+            self.poller.settle(True)
+            self.processed += 1
+        return self.processed
+
+
+TARGETS = ("s3", "dynamodb")
+
+
+def _target_list(value: str) -> list[str]:
+    targets = [t.strip() for t in value.split(",") if t.strip()]
+    bad = [t for t in targets if t not in TARGETS]
+    if not targets or bad or len(set(targets)) != len(targets):
+        raise argparse.ArgumentTypeError(f"expected one or more of {', '.join(TARGETS)} without repeats, "
+                                         f"got {value!r}")
+    return targets
+
+
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="CS5270 HW6 Consumer")
     p.add_argument("--bucket2", required=True, help="S3 bucket name for incoming Widget Requests (Bucket 2).")
-    p.add_argument("--target", choices=("s3", "dynamodb"), required=True, help="Storage backend for widgets.")
+    p.add_argument("--target", type=_target_list, required=True,
+                   help="Storage backend(s) for widgets: s3, dynamodb, or a comma-separated list "
+                        "(e.g. s3,dynamodb) to write every request to each of them.")
+    p.add_argument("--target-attempts", type=int, default=3,
+                   help="With several targets, tries per target before a request fails (default: 3).")
     p.add_argument("--bucket3", help="S3 bucket name for widgets (Bucket 3) if --target=s3.")
     p.add_argument("--table", help="DynamoDB table name if --target=dynamodb.")
     p.add_argument("--sleep-ms", type=int, default=100, help="Poll sleep when no requests are found (default: 100).")
+    p.add_argument("--idle-strategy", choices=("fixed", "adaptive"), default="fixed",
+                   help="fixed: sleep --sleep-ms after every empty poll; adaptive: exponential backoff "
+                        "with jitter from --sleep-ms up to --idle-max-ms (default: fixed).")
+    p.add_argument("--idle-max-ms", type=int, default=5000,
+                   help="Backoff ceiling for --idle-strategy=adaptive (default: 5000).")
+    p.add_argument("--coalesce-window-ms", type=int, default=0,
+                   help="Fold create/update/delete bursts for the same widget over this window and "
+                        "write only the final state (default: 0 = off).")
+    p.add_argument("--coalesce-max-batch", type=int, default=100,
+                   help="Flush the coalescing window after this many operations (default: 100).")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Run N consumer processes, each owning a disjoint slice of Bucket 2 "
+                        "(default: 1 = this process only).")
+    p.add_argument("--shard-prefixes",
+                   help="Comma-separated key prefixes, one per worker, to shard by prefix "
+                        "instead of by key hash (requires --workers equal to the number of prefixes).")
+    p.add_argument("--fair-prefixes", metavar="SPEC",
+                   help="Serve these Bucket 2 prefixes with weighted round-robin instead of smallest key "
+                        "first: comma-separated PREFIX[=WEIGHT], and/or 'auto' to discover prefixes "
+                        "(e.g. 'auto,tenantA/=3').")
+    p.add_argument("--fair-rediscover-s", type=float, default=30.0,
+                   help="How often --fair-prefixes auto looks for new prefixes (default: 30).")
     p.add_argument("--stop-after", type=int, default=0, help="Stop after N processed requests (0 = run forever).")
     p.add_argument("--log-file", default="consumer.log", help="Path to the log file (default: consumer.log).")
+    p.add_argument("--log-mode", choices=("sync", "queue"), default="sync",
+                   help="sync: format and write log lines on the calling thread; queue: hand them to a "
+                        "background writer thread (default: sync).")
+    p.add_argument("--log-format", choices=("text", "json"), default="text",
+                   help="Log line format; json writes one compact JSON object per line (default: text).")
+    p.add_argument("--log-sample-rate", type=float, default=1.0,
+                   help="Keep this share (0-1) of per-request INFO lines, chosen per request; "
+                        "warnings, errors and lifecycle lines are always kept (default: 1).")
+    p.add_argument("--prefetch-keys", type=int, default=1,
+                   help=f"Keys listed per LIST call into the local buffer, 1-{MAX_LIST_KEYS} "
+                        "(default: 1 = one LIST per request).")
+    p.add_argument("--refill-threshold", type=int, default=None,
+                   help="Refill the prefetch buffer when it holds this many keys or fewer "
+                        "(default: a quarter of --prefetch-keys).")
+    p.add_argument("--engine", choices=("serial", "pipeline", "asyncio"), default="serial",
+                   help="serial: one request at a time; pipeline: concurrent GET/parse with "
+                        "in-order hand-off to the router; asyncio: coroutines over a shared executor "
+                        "with a cap on in-flight requests (default: serial).")
+    p.add_argument("--fetch-concurrency", type=int, default=4,
+                   help="Concurrent GET/parse workers for --engine=pipeline (default: 4).")
+    p.add_argument("--max-in-flight", type=int, default=64,
+                   help="Requests claimed but not yet stored for --engine=asyncio (default: 64).")
+    p.add_argument("--ack-batch-size", type=int, default=0,
+                   help=f"Delete consumed requests with delete_objects in batches of up to this many "
+                        f"keys, 1-{MAX_DELETE_KEYS} (default: 0 = one delete_object per request).")
+    p.add_argument("--ack-max-age-ms", type=int, default=1000,
+                   help="Flush a partial ack batch once its oldest key is this old (default: 1000).")
+    p.add_argument("--ddb-batch-size", type=int, default=0,
+                   help=f"Buffer widgets and write them with batch_write_item, 1-{MAX_BATCH_WRITE} per call "
+                        "(default: 0 = one put_item per widget).")
+    p.add_argument("--ddb-flush-ms", type=int, default=1000,
+                   help="Flush a partial DynamoDB batch once its oldest item is this old (default: 1000).")
+    p.add_argument("--writers", type=int, default=0,
+                   help="Store writes on N threads partitioned by widgetId; writes for one widget "
+                        "keep their order (default: 0 = write inline).")
+    p.add_argument("--dedupe-max-entries", type=int, default=0,
+                   help="Remember up to N recently processed requestIds and skip requests seen again "
+                        "(default: 0 = off).")
+    p.add_argument("--dedupe-ttl-s", type=float, default=3600.0,
+                   help="Forget a requestId this many seconds after it was last seen (default: 3600).")
+    p.add_argument("--dedupe-file",
+                   help="Persist the requestId cache to this file so restarts keep recent history; "
+                        "with --workers, worker i uses <file>.w<i>.")
+    p.add_argument("--skip-unchanged", type=int, default=0, metavar="N",
+                   help="Remember a hash of the last content written for up to N widgets and skip "
+                        "PUTs that would write identical content (default: 0 = off).")
+    p.add_argument("--skip-unchanged-warm", action="store_true",
+                   help="Fill the --skip-unchanged cache at start-up from existing objects (S3 ETags) "
+                        "or items (DynamoDB scan).")
+    p.add_argument("--widget-cache", type=int, default=0, metavar="N",
+                   help="With --target=s3, keep the last N widget documents written so updates merge "
+                        "locally instead of GETting the widget first (default: 0 = off).")
+    p.add_argument("--spool-dir",
+                   help="Write consumed requests to an on-disk spool in this directory and store them "
+                        "from a separate drain thread, so a slow store does not stall Bucket 2 "
+                        "(default: off). With --workers, worker i uses <dir>/w<i>.")
+    p.add_argument("--spool-segment-mb", type=int, default=64,
+                   help="Size of one spool segment file in MiB (default: 64).")
+    p.add_argument("--spool-max-mb", type=int, default=1024,
+                   help="Cap on spool disk usage in MiB; the poller waits when it is full (default: 1024).")
+    p.add_argument("--spool-fsync", action="store_true",
+                   help="fsync every spooled request (survives power loss, not only crashes).")
+    p.add_argument("--rate-limit-max", type=float, default=0.0,
+                   help="Pace store writes with an adaptive rate limiter starting at this many writes/s; "
+                        "throttling errors halve the rate and successes ramp it back up (default: 0 = off).")
+    p.add_argument("--rate-limit-min", type=float, default=1.0,
+                   help="Floor for the adaptive write rate in writes/s (default: 1).")
+    p.add_argument("--rate-limit-concurrency", type=int, default=None,
+                   help="Most store calls in flight under the rate limiter (default: --writers, else the "
+                        "asyncio engine's concurrency, else 1).")
+    p.add_argument("--max-pool-connections", type=int, default=None,
+                   help="HTTP connections per AWS client (default: enough for the engine's concurrency "
+                        "plus --writers, at least 10).")
+    p.add_argument("--retry-mode", choices=RETRY_MODES, default="standard",
+                   help="botocore retry mode for all AWS clients (default: standard).")
+    p.add_argument("--aws-max-attempts", type=int, default=3,
+                   help="Attempts per AWS call including the first, for --retry-mode (default: 3).")
+    p.add_argument("--metrics-port", type=int, default=0,
+                   help="Serve Prometheus metrics on this port at /metrics; with --workers, worker i "
+                        "uses port + i (default: 0 = off).")
+    p.add_argument("--metrics-host", default="127.0.0.1",
+                   help="Address the metrics endpoint binds to; use 0.0.0.0 to expose it to other hosts "
+                        "(default: 127.0.0.1).")
+    p.add_argument("--metrics-interval-s", type=float, default=60.0,
+                   help="Log a throughput and p50/p99 stage latency line this often (default: 60, 0 = off).")
     return p.parse_args(argv)
 
 
 def main(argv: Optional[list[str]] = None) -> int:
     args = parse_args(argv)
-    log = setup_logging(args.log_file)
+    if not 0 <= args.log_sample_rate <= 1:
+        log = setup_logging(args.log_file)
+        log.error("--log-sample-rate must be between 0 and 1")
+        _flush_logs()
+        return 2
+    log = setup_logging(args.log_file, args.log_mode, args.log_format, args.log_sample_rate)
 
     # Validate resource combo
-    if args.target == "s3" and not args.bucket3:
+    if "s3" in args.target and not args.bucket3:
         log.error("--bucket3 is required when --target=s3")
         _flush_logs()
         return 2
-    if args.target == "dynamodb" and not args.table:
+    if "dynamodb" in args.target and not args.table:
         log.error("--table is required when --target=dynamodb")
         _flush_logs()
         return 2
+    if args.workers < 1:
+        log.error("--workers must be >= 1")
+        _flush_logs()
+        return 2
+    prefixes = args.shard_prefixes.split(",") if args.shard_prefixes else []
+    if prefixes and len(prefixes) != args.workers:
+        log.error("--shard-prefixes needs exactly one prefix per worker")
+        _flush_logs()
+        return 2
+    if args.fair_prefixes:
+        try:
+            args.fair_discover, args.fair_weights = parse_prefix_weights(args.fair_prefixes)
+        except ValueError as e:
+            log.error(f"--fair-prefixes: {e}")
+            _flush_logs()
+            return 2
+    if (args.fair_prefixes or args.workers > 1 and not prefixes) and args.prefetch_keys == 1:
+        # Hash sharding skips other workers' keys and fair mode keeps a buffer
+        # per prefix; both list a page at a time
+        args.prefetch_keys = 100
+    if not 1 <= args.prefetch_keys <= MAX_LIST_KEYS:
+        log.error(f"--prefetch-keys must be between 1 and {MAX_LIST_KEYS}")
+        _flush_logs()
+        return 2
+    if args.refill_threshold is None:
+        args.refill_threshold = args.prefetch_keys // 4
+    if args.prefetch_keys > 1 and not 0 <= args.refill_threshold < args.prefetch_keys:
+        log.error("--refill-threshold must be >= 0 and smaller than --prefetch-keys")
+        _flush_logs()
+        return 2
+    if args.fetch_concurrency < 1:
+        log.error("--fetch-concurrency must be >= 1")
+        _flush_logs()
+        return 2
+    if args.max_in_flight < 1:
+        log.error("--max-in-flight must be >= 1")
+        _flush_logs()
+        return 2
+    if not 0 <= args.ack_batch_size <= MAX_DELETE_KEYS:
+        log.error(f"--ack-batch-size must be between 0 and {MAX_DELETE_KEYS}")
+        _flush_logs()
+        return 2
+    if not 0 <= args.ddb_batch_size <= MAX_BATCH_WRITE:
+        log.error(f"--ddb-batch-size must be between 0 and {MAX_BATCH_WRITE}")
+        _flush_logs()
+        return 2
+    if args.writers < 0:
+        log.error("--writers must be >= 0")
+        _flush_logs()
+        return 2
+    if args.coalesce_window_ms < 0 or args.coalesce_max_batch < 1:
+        log.error("--coalesce-window-ms must be >= 0 and --coalesce-max-batch >= 1")
+        _flush_logs()
+        return 2
+    if args.dedupe_max_entries < 0 or args.dedupe_ttl_s <= 0:
+        log.error("--dedupe-max-entries must be >= 0 and --dedupe-ttl-s > 0")
+        _flush_logs()
+        return 2
+    if args.spool_dir and (args.spool_segment_mb < 1 or args.spool_max_mb < 2 * args.spool_segment_mb):
+        log.error("--spool-segment-mb must be >= 1 and --spool-max-mb at least twice --spool-segment-mb")
+        _flush_logs()
+        return 2
+    if args.rate_limit_max and not 0 < args.rate_limit_min <= args.rate_limit_max:
+        log.error("--rate-limit-min must be > 0 and no larger than --rate-limit-max")
+        _flush_logs()
+        return 2
+    if args.skip_unchanged < 0 or args.widget_cache < 0:
+        log.error("--skip-unchanged and --widget-cache must be >= 0")
+        _flush_logs()
+        return 2
+    if args.max_pool_connections is not None and args.max_pool_connections < 1:
+        log.error("--max-pool-connections must be >= 1")
+        _flush_logs()
+        return 2
+    if args.target_attempts < 1:
+        log.error("--target-attempts must be >= 1")
+        _flush_logs()
+        return 2
+    if len(args.target) > 1 and (args.writers or args.coalesce_window_ms):
+        # Those report a failed write late, against another request that the
+        # poller or the spool drain would then retry instead of the failed one
+        log.error("--writers and --coalesce-window-ms cannot be combined with several targets")
+        _flush_logs()
+        return 2
+    if args.aws_max_attempts < 1:
+        log.error("--aws-max-attempts must be >= 1")
+        _flush_logs()
+        return 2
+    if not 0 <= args.metrics_port <= 65535 or args.metrics_interval_s < 0:
+        log.error("--metrics-port must be between 0 and 65535 and --metrics-interval-s >= 0")
+        _flush_logs()
+        return 2
 
-    # Build poller + store
-    poller = S3RequestPoller(bucket2_name=args.bucket2, sleep_ms=args.sleep_ms)
-    if args.target == "s3":
-        store = S3WidgetStore(bucket3_name=args.bucket3)
+    if args.workers > 1:
+        rc = _supervise(args, log)
     else:
-        store = DynamoWidgetStore(table_name=args.table)
+        rc = _run_consumer(args, log)
+    _flush_logs()
+    return rc
 
-    processed = 0
-    log.info(
-        f"Consumer starting: bucket2={args.bucket2}, target={args.target}, "
-        f"bucket3={args.bucket3 or '-'}, table={args.table or '-'}, sleep_ms={args.sleep_ms}"
-    )
 
+def _store_concurrency(args: argparse.Namespace) -> int:
+    """How many store calls the engine (or the writer pool) can make at once."""
+    if args.writers:
+        return args.writers
+    return min(args.max_in_flight, 64) if args.engine == "asyncio" else 1
+
+
+def _client_factory(args: argparse.Namespace) -> ClientFactory:
+    if args.max_pool_connections:
+        pool = args.max_pool_connections
+    elif args.engine == "pipeline":
+        pool = pool_size_for(args.fetch_concurrency, args.writers)
+    elif args.engine == "asyncio":
+        pool = pool_size_for(min(args.max_in_flight, 64), args.writers)
+    else:
+        pool = pool_size_for(1, args.writers)
+    return ClientFactory(max_pool_connections=pool, retry_mode=args.retry_mode,
+                         max_attempts=args.aws_max_attempts)
+
+
+def _build_target(target: str, args: argparse.Namespace, clients: ClientFactory, log: logging.Logger):
+    """The base store for one --target entry, with its own content and widget caches."""
+    content_cache = ContentHashCache(args.skip_unchanged) if args.skip_unchanged else None
+    widget_cache = None
+    if target == "s3":
+        if args.widget_cache:
+            widget_cache = WidgetDocumentCache(args.widget_cache)
+        store = S3WidgetStore(bucket3_name=args.bucket3, clients=clients, content_cache=content_cache,
+                              widget_cache=widget_cache)
+    elif args.ddb_batch_size:
+        store = BatchedDynamoWidgetStore(table_name=args.table, batch_size=args.ddb_batch_size,
+                                         flush_interval_ms=args.ddb_flush_ms, clients=clients,
+                                         content_cache=content_cache)
+    else:
+        store = DynamoWidgetStore(table_name=args.table, clients=clients, content_cache=content_cache)
+    if content_cache is not None and args.skip_unchanged_warm:
+        try:
+            store.warm_content_cache()
+        except Exception as e:
+            log.error(f"Could not warm the {target} content cache; starting cold: {e}")
+            content_cache.clear()
+    return store, content_cache, widget_cache
+
+
+def _run_consumer(args: argparse.Namespace, log: logging.Logger,
+                  on_processed: Optional[Callable[[], None]] = None) -> int:
+    # Build poller + store; they share one lazily created client per service
+    clients = _client_factory(args)
+    if args.idle_strategy == "adaptive":
+        idle = AdaptiveIdle(base_ms=args.sleep_ms, max_ms=args.idle_max_ms)
+    else:
+        idle = FixedIdle(args.sleep_ms)
+    poller_kwargs = {}
+    poller_cls = S3RequestPoller
+    if args.fair_prefixes:
+        poller_cls = FairS3RequestPoller
+        poller_kwargs = dict(weights=args.fair_weights, discover=args.fair_discover,
+                             rediscover_s=args.fair_rediscover_s)
+    # Without a spool, a fanned-out request leaves Bucket 2 only once every target has it
+    retry_on = (FanOutError,) if len(args.target) > 1 and not args.spool_dir else ()
+    if retry_on:
+        poller_kwargs["defer_ack"] = True
     try:
-        while True:
-            req = poller.get_next_request()
-            if req is None:
-                # poller already slept; just continue
-                continue
+        poller = poller_cls(
+            bucket2_name=args.bucket2,
+            sleep_ms=args.sleep_ms,
+            page_size=args.prefetch_keys,
+            refill_threshold=args.refill_threshold,
+            ack_batch_size=args.ack_batch_size,
+            ack_max_age_ms=args.ack_max_age_ms,
+            idle=idle,
+            prefix=getattr(args, "prefix", ""),
+            shard_index=getattr(args, "shard_index", 0),
+            shard_count=getattr(args, "shard_count", 1),
+            clients=clients,
+            **poller_kwargs,
+        )
+    except ValueError as e:
+        log.error(f"Invalid poller settings: {e}")  # e.g. --fair-prefixes that overlap discovered ones
+        return 2
+    targets = {}
+    caches = []  # (target, content cache, widget cache) for the shutdown summary
+    limiters = {}
+    for target in args.target:
+        store, content_cache, widget_cache = _build_target(target, args, clients, log)
+        if args.rate_limit_max:
+            limiters[target] = AdaptiveRateLimiter(
+                max_rate=args.rate_limit_max, min_rate=args.rate_limit_min,
+                max_concurrency=args.rate_limit_concurrency or _store_concurrency(args))
+            store = RateLimitedStore(store, limiters[target])
+        targets[target] = store
+        caches.append((target, content_cache, widget_cache))
+    if limiters:
+        REGISTRY.gauge("write_rate_limit", lambda: [({"target": t}, lim.rate) for t, lim in limiters.items()],
+                       help="Current adaptive store write rate (writes/s).")
+        REGISTRY.gauge("write_concurrency_limit",
+                       lambda: [({"target": t}, int(lim.limit)) for t, lim in limiters.items()],
+                       help="Current adaptive limit on concurrent store calls.")
+    if any(wc is not None for _, _, wc in caches):
+        widget_cache = next(wc for _, _, wc in caches if wc is not None)
+        REGISTRY.gauge("widget_cache_hit_ratio", lambda: widget_cache.hit_rate,
+                       help="Share of updates merged from the widget cache without a GET.")
+    if len(targets) > 1:
+        store = FanOutStore(targets, max_attempts=args.target_attempts, concurrency=_store_concurrency(args))
+    else:
+        store = targets[args.target[0]]
+    if args.writers:
+        store = PartitionedWriterPool(store, workers=args.writers)
+    if args.coalesce_window_ms:
+        store = CoalescingStore(store, window_ms=args.coalesce_window_ms, max_batch=args.coalesce_max_batch)
+
+    dedupe = None
+    if args.dedupe_max_entries:
+        dedupe = RequestIdCache(max_entries=args.dedupe_max_entries, ttl_s=args.dedupe_ttl_s,
+                                path=args.dedupe_file)
 
-            handle_request(req, store, log)
-            processed += 1
+    def route(req):
+        if dedupe is not None and dedupe.seen(req.requestId):
+            logqueue.log_request(log, req.requestId, "Skipped duplicate request %s (widgetId=%s)",
+                                 req.requestId, req.widgetId)
+            return
+        handle_request(req, store, log)
+        REGISTRY.inc("processed_total", help="Requests routed to the store.")
+        if dedupe is not None:
+            dedupe.add(req.requestId)
 
-            if args.stop_after and processed >= args.stop_after:
-                log.info(f"Stop-after reached ({processed}). Exiting.")
-                break
+    drain = None
+    if args.spool_dir:
+        spool = SegmentSpool(args.spool_dir, segment_bytes=args.spool_segment_mb << 20,
+                             max_bytes=args.spool_max_mb << 20, fsync=args.spool_fsync)
+        drain = SpoolDrain(spool, route).start()
+        REGISTRY.gauge("spool_backlog_bytes", spool.backlog_bytes, help="Spooled bytes not yet stored.")
+        REGISTRY.gauge("spool_disk_bytes", spool.disk_bytes, help="Disk used by spool segments.")
+
+    def handler(req):
+        if drain is not None:
+            drain.submit(req)
+        else:
+            route(req)
+        if on_processed is not None:
+            on_processed()
+
+    observers = _start_metrics(args, poller, store, log)
+
+    if args.engine == "pipeline":
+        engine = PipelineEngine(poller, handler, fetch_concurrency=args.fetch_concurrency, retry_on=retry_on)
+    elif args.engine == "asyncio":
+        engine = AsyncioEngine(poller, handler, max_in_flight=args.max_in_flight, retry_on=retry_on)
+    else:
+        engine = SerialEngine(poller, handler, retry_on=retry_on)
+
+    log.info(
+        f"Consumer starting: bucket2={args.bucket2}, target={','.join(args.target)}, "
+        f"bucket3={args.bucket3 or '-'}, table={args.table or '-'}, sleep_ms={args.sleep_ms}, "
+        f"idle_strategy={args.idle_strategy}, "
+        f"prefetch_keys={args.prefetch_keys}, engine={args.engine}, ack_batch_size={args.ack_batch_size}, "
+        f"writers={args.writers}, dedupe_max_entries={args.dedupe_max_entries}, "
+        f"spool={args.spool_dir or '-'}, rate_limit_max={args.rate_limit_max or '-'}, "
+        f"aws_clients=({clients.describe()})"
+    )
+
+    try:
+        processed = engine.run(args.stop_after)
+        if args.stop_after:
+            log.info(f"Stop-after reached ({processed}). Exiting.")
 
     except KeyboardInterrupt:
         log.info("Interrupted by user. Shutting down gracefully.")
     except Exception as e:
         log.exception(f"Fatal error in consumer loop: {e}")
-        _flush_logs()
+        _close_components(drain, store, poller, dedupe, *observers)
         return 1
 
-    log.info(f"Consumer stopped. Total processed: {processed}")
-    _flush_logs()
+    _close_components(drain, store, poller, dedupe, *observers)
+    for target, content_cache, widget_cache in caches:
+        if content_cache is not None:
+            log.info(f"Content cache ({target}): PUTs skipped={content_cache.skipped} "
+                     f"entries={len(content_cache)}")
+        if widget_cache is not None:
+            log.info(f"Widget cache: hits={widget_cache.hits} misses={widget_cache.misses} "
+                     f"hit_rate={widget_cache.hit_rate:.1%}")
+    log.info(f"Consumer stopped. Total processed: {engine.processed}")
     return 0
 
 
+def _start_metrics(args: argparse.Namespace, poller, store, log: logging.Logger) -> list:
+    """Register component gauges and start the metrics endpoint / summary line if enabled."""
+    if hasattr(poller, "inflight"):
+        REGISTRY.gauge("inflight_keys", poller.inflight, help="Bucket 2 keys claimed but not yet acked.")
+    if isinstance(poller, FairS3RequestPoller):
+        REGISTRY.gauge("prefix_backlog", poller.prefix_backlog, help="Listed but unclaimed Bucket 2 keys per prefix.")
+    if isinstance(store, CoalescingStore):
+        REGISTRY.gauge("coalescer_saved", lambda: store.saved, help="Store writes avoided by coalescing.")
+    pool = store.store if isinstance(store, CoalescingStore) else store
+    if isinstance(pool, PartitionedWriterPool):
+        REGISTRY.gauge("writer_queue_depth",
+                       lambda: [({"writer": str(i)}, d) for i, d in enumerate(pool.queue_depths())],
+                       help="Pending writes per writer thread.")
+
+    observers = []
+    if args.metrics_port:
+        try:
+            observers.append(MetricsServer(REGISTRY, args.metrics_port, host=args.metrics_host).start())
+        except OSError as e:
+            log.error(f"Could not serve metrics on {args.metrics_host}:{args.metrics_port}: {e}")
+    if args.metrics_interval_s:
+        observers.append(ThroughputReporter(REGISTRY, args.metrics_interval_s).start())
+    return observers
+
+
+def _supervise(args: argparse.Namespace, log: logging.Logger) -> int:
+    log.info(f"Supervisor starting {args.workers} workers: "
+             f"shard_by={'prefix' if args.shard_prefixes else 'hash'}, stop_after={args.stop_after}")
+    sup = Supervisor(functools.partial(_worker_main, args), workers=args.workers,
+                     stop_after=args.stop_after)
+    rc = sup.run()
+    log.info(f"Supervisor stopped. Total processed: {sup.processed} (restarts: {sum(sup.restarts)})")
+    return rc
+
+
+def _worker_main(args: argparse.Namespace, index: int, count: int, counter) -> int:
+    """Body of one --workers process: a normal consumer restricted to its shard."""
+    args = copy.copy(args)
+    if args.shard_prefixes:
+        args.prefix = args.shard_prefixes.split(",")[index]
+    else:
+        args.shard_index, args.shard_count = index, count
+    root, ext = os.path.splitext(args.log_file)
+    args.log_file = f"{root}.w{index}{ext}"
+    if args.dedupe_file:
+        args.dedupe_file = f"{args.dedupe_file}.w{index}"
+    if args.spool_dir:
+        args.spool_dir = os.path.join(args.spool_dir, f"w{index}")
+    args.stop_after = 0  # the supervisor enforces the combined limit
+    if args.metrics_port:
+        args.metrics_port += index
+    log = setup_logging(args.log_file, args.log_mode, args.log_format, args.log_sample_rate)
+
+    def on_processed():
+        with counter.get_lock():
+            counter.value += 1
+
+    rc = _run_consumer(args, log, on_processed)
+    _flush_logs()
+    return rc
+
+
+def _close_components(*components):
+    """Flush batched work (e.g. pending acks) before the logs are closed."""
+    log = logging.getLogger("consumer")
+    for c in components:
+        close = getattr(c, "close", None)
+        if close is None:
+            continue
+        try:
+            close()
+        except Exception as e:
+            log.error(f"Error while closing {c.__class__.__name__}: {e}")
+
+
 def _flush_logs():
     """Ensure file handlers are flushed/closed (important for tests)."""
+    # Queue mode: write out everything still queued before closing anything
+    logqueue.stop()
     root = logging.getLogger()
     # Flush all handlers
     for h in list(root.handlers):
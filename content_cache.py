@@ -0,0 +1,166 @@
+# content_cache.py
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import REGISTRY
+
+
+def body_digest(body: bytes) -> str:
+    """MD5 of an object body; equals the S3 ETag of a single-part PUT."""
+    return hashlib.md5(body).hexdigest()
+
+
+def item_digest(item_av: dict) -> str:
+    """Digest of a DynamoDB item in attribute-value form, independent of key order."""
+    return hashlib.md5(json.dumps(item_av, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ContentHashCache:
+    """
+    Remembers a digest of the last body written under each store key so that
+    re-sending an identical widget does not cost another PUT.
+
+    The stores call ``unchanged(key, digest)`` before a put and skip the write
+    on a match, ``remember`` after a successful write and ``forget`` on
+    delete. At most ``max_entries`` keys are kept; the least recently used key
+    is evicted first. ``skipped`` counts the PUTs avoided.
+
+    The cache trusts that this consumer is the only writer of the widgets it
+    remembers; anything else changing Bucket 3 or the table behind its back
+    would make it skip a write it should have made.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.skipped = 0
+        self._digests: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def unchanged(self, key: str, digest: str) -> bool:
+        with self._lock:
+            if self._digests.get(key) != digest:
+                return False
+            self._digests.move_to_end(key)
+            self.skipped += 1
+        REGISTRY.inc("writes_skipped_total", help="Widget PUTs skipped because the content was unchanged.")
+        return True
+
+    def remember(self, key: str, digest: str) -> None:
+        with self._lock:
+            self._digests[key] = digest
+            self._digests.move_to_end(key)
+            if len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._digests.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._digests.clear()
+
+    def full(self) -> bool:
+        return len(self._digests) >= self.max_entries
+
+
+class WidgetDocumentCache:
+    """
+    Write-through cache of the JSON documents most recently written to
+    Bucket 3, so an update can merge into the cached widget instead of
+    GETting it first.
+
+    The S3 store calls ``put`` after every successful write, ``get`` before an
+    update (a miss falls back to a GET) and ``forget`` on delete or failure.
+    At most ``max_entries`` documents are kept, least recently used evicted
+    first. ``hits`` / ``misses`` give the hit rate, also exported as
+    ``widget_cache_lookups_total``. Like ContentHashCache it assumes this
+    consumer is the only writer of the widgets it holds.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._docs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._docs.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self._docs.move_to_end(key)
+                self.hits += 1
+        REGISTRY.inc("widget_cache_lookups_total", help="Widget document cache lookups by result.",
+                     result="miss" if body is None else "hit")
+        return body
+
+    def put(self, key: str, body: bytes) -> None:
+        with self._lock:
+            self._docs[key] = body
+            self._docs.move_to_end(key)
+            if len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._docs.pop(key, None)
+
+
+def warm_from_s3(cache: ContentHashCache, s3, bucket: str, prefix: str = "widgets/") -> int:
+    """Seed the cache from the ETags of existing widget objects (no GETs needed).
+
+    Multipart ETags (containing "-") are not body MD5s and are skipped.
+    """
+    loaded = 0
+    params = {"Bucket": bucket, "Prefix": prefix}
+    while not cache.full():
+        resp = s3.list_objects_v2(**params)
+        for obj in resp.get("Contents", []):
+            etag = obj.get("ETag", "").strip('"')
+            if etag and "-" not in etag:
+                cache.remember(obj["Key"], etag)
+                loaded += 1
+        if not resp.get("IsTruncated"):
+            break
+        params["ContinuationToken"] = resp["NextContinuationToken"]
+    cache.log.info(f"Warmed content cache with {loaded} objects from {bucket}/{prefix}")
+    return loaded
+
+
+def warm_from_dynamodb(cache: ContentHashCache, ddb, table: str, key_attr: str = "widgetId") -> int:
+    """Seed the cache by scanning the table (consumes read capacity for every item)."""
+    loaded = 0
+    params = {"TableName": table}
+    while not cache.full():
+        resp = ddb.scan(**params)
+        for item in resp.get("Items", []):
+            cache.remember(item[key_attr]["S"], item_digest(item))
+            loaded += 1
+        if "LastEvaluatedKey" not in resp:
+            break
+        params["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    cache.log.info(f"Warmed content cache with {loaded} items from {table}")
+    return loaded
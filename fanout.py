@@ -0,0 +1,139 @@
+# fanout.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+from models import WidgetRequest
+
+
+class FanOutError(Exception):
+    """Raised when some targets still fail after retries; ``errors`` maps target name to error."""
+
+    def __init__(self, req: WidgetRequest, errors: Dict[str, BaseException]):
+        self.errors = errors
+        detail = ", ".join(f"{name}: {e}" for name, e in errors.items())
+        super().__init__(f"request {req.requestId} failed on {len(errors)} target(s): {detail}")
+
+
+class FanOutStore:
+    """
+    Writes every put/delete/update to several widget stores at once.
+
+    ``targets`` maps a name (``s3``, ``dynamodb``) to a store with the usual
+    interface. The call goes to all targets in parallel, one executor thread
+    each, and returns only when every target has succeeded; a target that
+    fails is retried on its own, up to ``max_attempts`` times with a doubling
+    delay, while the targets that already succeeded are left alone. If a
+    target still fails, FanOutError is raised so the request is not counted
+    (or, with a spool, not committed).
+
+    Which targets already took a request is remembered by ``requestId`` for
+    the last ``remember`` failed requests, so when the caller retries the same
+    request (the spool drain does) only the missing targets are written.
+
+    ``concurrency`` is how many callers may fan out at once (the engine's or
+    writer pool's parallelism); the executor gets one thread per target for
+    each of them, so no call waits for a free thread.
+
+    Per-target latency goes to ``target_seconds{target}`` and failed attempts
+    to ``target_failures_total{target}``.
+    """
+
+    def __init__(self, targets: Dict[str, object], max_attempts: int = 3, backoff_s: float = 0.05,
+                 remember: int = 10_000, concurrency: int = 1):
+        if not targets:
+            raise ValueError("at least one target is required")
+        self.targets = dict(targets)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff_s
+        self.remember = remember
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.writes = {name: 0 for name in self.targets}
+        self.failures = {name: 0 for name in self.targets}
+        self._done: "OrderedDict[str, set]" = OrderedDict()  # requestId -> targets already written
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if len(self.targets) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency) * len(self.targets), thread_name_prefix="fanout")
+
+    def widget_key(self, req: WidgetRequest) -> str:
+        # Coalescing must only merge operations every target sees as one widget
+        return "|".join(getattr(store, "widget_key", lambda r: r.widgetId)(req)
+                        for store in self.targets.values())
+
+    def put_widget(self, req: WidgetRequest) -> None:
+        self._fan_out("put_widget", req)
+
+    def delete_widget(self, req: WidgetRequest) -> None:
+        self._fan_out("delete_widget", req)
+
+    def update_widget(self, req: WidgetRequest) -> None:
+        self._fan_out("update_widget", req)
+
+    def _fan_out(self, method: str, req: WidgetRequest) -> None:
+        with self._lock:
+            done = self._done.pop(req.requestId, set())
+        pending = [name for name in self.targets if name not in done]
+        errors: Dict[str, BaseException] = {}
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            errors = self._attempt(method, req, pending)
+            done.update(name for name in pending if name not in errors)
+            pending = list(errors)
+            if not pending:
+                return
+            self.log.warning(f"{method} {req.widgetId} failed on {', '.join(pending)} "
+                             f"(attempt {attempt + 1}/{self.max_attempts})")
+        with self._lock:
+            self._done[req.requestId] = done
+            while len(self._done) > self.remember:
+                self._done.popitem(last=False)
+        raise FanOutError(req, errors)
+
+    def _attempt(self, method: str, req: WidgetRequest, names: list) -> Dict[str, BaseException]:
+        """One call per named target, in parallel; returns the errors by target."""
+        if self._executor is None or len(names) == 1:
+            results = {name: self._call(name, method, req) for name in names}
+        else:
+            futures = {name: self._executor.submit(self._call, name, method, req) for name in names}
+            wait(futures.values())
+            results = {name: f.result() for name, f in futures.items()}
+        return {name: e for name, e in results.items() if e is not None}
+
+    def _call(self, name: str, method: str, req: WidgetRequest) -> Optional[BaseException]:
+        start = time.perf_counter()
+        try:
+            getattr(self.targets[name], method)(req)
+        except Exception as e:
+            with self._lock:
+                self.failures[name] += 1
+            REGISTRY.inc("target_failures_total", help="Failed store calls per fan-out target.", target=name)
+            return e
+        finally:
+            REGISTRY.histogram("target_seconds", help="Store call latency per fan-out target.",
+                               target=name).observe(time.perf_counter() - start)
+        with self._lock:
+            self.writes[name] += 1
+        return None
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        error = None
+        for name, store in self.targets.items():
+            self.log.info(f"Target {name}: writes={self.writes[name]} failures={self.failures[name]}")
+            close = getattr(store, "close", None)
+            try:
+                if close is not None:
+                    close()
+            except Exception as e:
+                self.log.error(f"Closing target {name} failed: {e}")
+                error = error or e
+        if error is not None:
+            raise error
@@ -0,0 +1,125 @@
+# idempotency.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from batching import FlushTimer
+from metrics import REGISTRY
+
+
+class RequestIdCache:
+    """
+    Remembers recently processed ``requestId``s so redelivered requests can be
+    skipped instead of written again.
+
+    Entries are kept in an OrderedDict from requestId to the time it was last
+    seen, oldest first. The cache never holds more than ``max_entries`` ids
+    (roughly 150 bytes each), and ids older than ``ttl_s`` are dropped, so
+    memory stays flat however long the consumer runs. A hit refreshes the
+    entry, like an LRU.
+
+    With ``path`` set, the cache is loaded from that file at start-up and
+    rewritten every ``save_interval_s`` seconds and on close(). The file has
+    one ``<epoch seconds> <requestId>`` line per entry and is replaced
+    atomically, so a restarted consumer keeps its recent history. ``hits``
+    and ``misses`` count lookups.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl_s: float = 3600.0,
+                 path: Optional[str] = None, save_interval_s: float = 30.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self.path = path
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer: Optional[FlushTimer] = None
+        if path:
+            self.load()
+            if save_interval_s > 0:
+                self._timer = FlushTimer(save_interval_s, self.save, name="dedupe-save").start()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def seen(self, request_id: str) -> bool:
+        """True if ``request_id`` was processed within the TTL (counts a hit)."""
+        now = time.time()
+        with self._lock:
+            ts = self._seen.get(request_id)
+            if ts is not None and now - ts <= self.ttl:
+                self._seen[request_id] = now
+                self._seen.move_to_end(request_id)
+                self.hits += 1
+                hit = True
+            else:
+                self.misses += 1
+                hit = False
+        REGISTRY.inc("dedupe_lookups_total", help="Idempotency cache lookups by result.",
+                     result="hit" if hit else "miss")
+        return hit
+
+    def add(self, request_id: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._seen[request_id] = now
+            self._seen.move_to_end(request_id)
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        seen = self._seen
+        while len(seen) > self.max_entries:
+            seen.popitem(last=False)
+        while seen:
+            oldest = next(iter(seen.values()))
+            if now - oldest <= self.ttl:
+                break
+            seen.popitem(last=False)
+
+    def load(self) -> int:
+        """Read entries saved by a previous run; returns how many were kept."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        now = time.time()
+        entries = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                ts, _, request_id = line.rstrip("\n").partition(" ")
+                try:
+                    entries.append((float(ts), request_id))
+                except ValueError:
+                    continue  # a torn or foreign line; the rest of the file is still usable
+        entries.sort()
+        with self._lock:
+            for ts, request_id in entries:
+                if request_id and now - ts <= self.ttl:
+                    self._seen[request_id] = ts
+                    self._seen.move_to_end(request_id)
+            self._evict(now)
+            kept = len(self._seen)
+        self.log.info(f"Loaded {kept} recent request ids from {self.path}")
+        return kept
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            lines = [f"{ts:.0f} {request_id}\n" for request_id, ts in self._seen.items()]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.stop()
+        self.save()
+        self.log.info(f"Idempotency cache: entries={len(self)} hits={self.hits} misses={self.misses}")
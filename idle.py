@@ -0,0 +1,49 @@
+# idle.py
+import random
+import time
+
+
+class FixedIdle:
+    """Sleep the same interval after every empty poll (the original behaviour)."""
+
+    def __init__(self, sleep_ms: int = 100):
+        self.sleep = max(1, sleep_ms) / 1000.0
+
+    def next_delay(self) -> float:
+        return self.sleep
+
+    def wait(self) -> None:
+        time.sleep(self.next_delay())
+
+    def reset(self) -> None:
+        pass
+
+
+class AdaptiveIdle:
+    """
+    Exponential backoff with full jitter while Bucket 2 stays empty.
+
+    The first empty poll waits ``base_ms``; each further empty poll doubles the
+    ceiling up to ``max_ms`` and the actual delay is drawn uniformly between
+    ``base_ms`` and that ceiling, so an idle fleet does not LIST in lockstep.
+    reset() is called as soon as work appears and puts the poller straight
+    back into tight polling.
+    """
+
+    def __init__(self, base_ms: int = 100, max_ms: int = 5000, multiplier: float = 2.0):
+        self.base = max(1, base_ms) / 1000.0
+        self.max = max(self.base, max_ms / 1000.0)
+        self.multiplier = multiplier
+        self._empty_polls = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.max, self.base * self.multiplier ** self._empty_polls)
+        if ceiling < self.max:
+            self._empty_polls += 1
+        return random.uniform(self.base, ceiling) if ceiling > self.base else self.base
+
+    def wait(self) -> None:
+        time.sleep(self.next_delay())
+
+    def reset(self) -> None:
+        self._empty_polls = 0
@@ -0,0 +1,111 @@
+# logqueue.py
+import json
+import logging
+import logging.handlers
+import queue
+import zlib
+from typing import Optional
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# Set on per-request records by log_request(), so JSON lines can carry it
+REQUEST_ATTR = "request_id"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sampler: Optional["RequestSampler"] = None
+
+
+class RequestSampler:
+    """
+    Keeps ``rate`` of the requests' INFO lines.
+
+    The decision hashes the request id, so a sampled request keeps all of its
+    lines. ``dropped`` counts the lines skipped.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        if not 0 <= rate <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        self.rate = rate
+        self.threshold = int(rate * 0xFFFFFFFF)
+        self.dropped = 0
+
+    def keep(self, request_id: str) -> bool:
+        if zlib.crc32(request_id.encode("utf-8")) <= self.threshold:
+            return True
+        self.dropped += 1
+        return False
+
+
+def set_sample_rate(rate: float) -> None:
+    """Sample per-request lines at ``rate`` from now on (1 = keep everything)."""
+    global _sampler
+    _sampler = RequestSampler(rate) if rate < 1 else None
+
+
+def log_request(log, request_id: str, msg: str, *args) -> None:
+    """INFO line about one request: sampled before any record is built, formatted lazily."""
+    if _sampler is not None and not _sampler.keep(request_id):
+        return
+    log.info(msg, *args, extra={REQUEST_ATTR: request_id})
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record: ts, level, logger, msg, request_id, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+               "msg": record.getMessage()}
+        tag = getattr(record, REQUEST_ATTR, None)
+        if tag is not None:
+            out[REQUEST_ATTR] = tag
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, separators=(",", ":"), ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves all formatting to the listener thread.
+
+    The stdlib handler formats the message in the logging thread so records
+    can cross process boundaries; here the queue never leaves the process, so
+    the record is enqueued as is and ``%``-style arguments are only merged
+    when the listener writes it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def make_formatter(fmt: str) -> logging.Formatter:
+    return JsonLinesFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+def start(root: logging.Logger, handlers: list) -> None:
+    """Route the root logger through a queue; ``handlers`` are written by a background listener."""
+    global _listener
+    stop()
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    qh = DeferredQueueHandler(q)
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(qh)
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop() -> None:
+    """Write out everything queued so far, then close the listener's handlers."""
+    global _listener
+    listener, _listener = _listener, None
+    thread = listener._thread if listener is not None else None
+    if thread is None or not thread.is_alive():
+        return  # nothing running here (e.g. a listener inherited through fork)
+    listener.stop()  # enqueues a sentinel and waits for the backlog to drain
+    for h in listener.handlers:
+        try:
+            h.flush()
+            h.close()
+        except Exception:
+            pass
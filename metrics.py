@@ -0,0 +1,244 @@
+# metrics.py
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from batching import FlushTimer
+
+# Latency bucket upper bounds in seconds (Prometheus "le" values)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+GaugeValue = Union[float, Iterable[Tuple[Dict[str, str], float]]]
+
+
+def _labels(**kw: str) -> Labels:
+    return tuple(sorted(kw.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and two adds under a lock."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+class Registry:
+    """
+    Holds the consumer's counters, histograms and callback gauges and renders
+    them in the Prometheus text format. Everything is in-process, so tests can
+    create their own Registry and inspect it without any network.
+    """
+
+    def __init__(self, prefix: str = "consumer"):
+        self.prefix = prefix
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._gauges: Dict[str, Callable[[], GaugeValue]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, help: str = "", **labels: str) -> None:
+        key = (name, _labels(**labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            if help:
+                self._help.setdefault(name, help)
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, _labels(**labels)), 0)
+
+    def histogram(self, name: str, help: str = "", **labels: str) -> Histogram:
+        key = (name, _labels(**labels))
+        h = self._histograms.get(key)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(key, Histogram())
+                if help:
+                    self._help.setdefault(name, help)
+        return h
+
+    def gauge(self, name: str, fn: Callable[[], GaugeValue], help: str = "") -> None:
+        """Register a gauge read at render time; fn returns a number or (labels, value) pairs."""
+        with self._lock:
+            self._gauges[name] = fn
+            if help:
+                self._help[name] = help
+
+    def reset(self) -> None:
+        """Drop all counter and histogram values (gauges stay registered)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time a pipeline stage and count its outcome (ok / error)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("stage_total", stage=stage, outcome="error")
+            raise
+        finally:
+            self.histogram("stage_seconds", help="Latency of each consumer stage.", stage=stage).observe(
+                time.perf_counter() - start)
+        self.inc("stage_total", stage=stage, outcome="ok")
+
+    def render(self) -> str:
+        lines = []
+        p = self.prefix
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda kv: kv[0])
+            gauges = sorted(self._gauges.items())
+            help_ = dict(self._help)
+
+        last = None
+        for (name, labels), value in counters:
+            if name != last:
+                lines.append(f"# HELP {p}_{name} {help_.get(name, name)}")
+                lines.append(f"# TYPE {p}_{name} counter")
+                last = name
+            lines.append(f"{p}_{name}{_fmt_labels(labels)} {value:g}")
+
+        last = None
+        for (name, labels), h in histograms:
+            if name != last:
+                lines.append(f"# HELP {p}_{name} {help_.get(name, name)}")
+                lines.append(f"# TYPE {p}_{name} histogram")
+                last = name
+            with h._lock:
+                counts, total, sum_ = list(h.counts), h.count, h.sum
+            cumulative = 0
+            for bound, c in zip(h.bounds + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{p}_{name}_bucket{_fmt_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{p}_{name}_sum{_fmt_labels(labels)} {sum_:.6f}")
+            lines.append(f"{p}_{name}_count{_fmt_labels(labels)} {total}")
+
+        for name, fn in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {p}_{name} {help_.get(name, name)}")
+            lines.append(f"# TYPE {p}_{name} gauge")
+            if isinstance(value, (int, float)):
+                lines.append(f"{p}_{name} {value:g}")
+            else:
+                for labels, v in value:
+                    lines.append(f"{p}_{name}{_fmt_labels(_labels(**labels))} {v:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, stages: Iterable[str] = ("list", "get", "delete", "parse", "route", "store_put")) -> str:
+        parts = []
+        for s in stages:
+            h = self._histograms.get(("stage_seconds", _labels(stage=s)))
+            if h is not None and h.count:
+                parts.append(f"{s}={h.quantile(0.5) * 1000:.1f}/{h.quantile(0.99) * 1000:.1f}")
+        return " ".join(parts)
+
+
+# Process-wide registry used by the poller, router and stores
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """Serves ``registry.render()`` at /metrics from a background thread (loopback only by default)."""
+
+    def __init__(self, registry: Registry, port: int, host: str = "127.0.0.1"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.rstrip("/") not in ("", "/metrics"):
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass  # keep scrapes out of the consumer log
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        logging.getLogger(self.__class__.__name__).info(f"Serving metrics on :{self.port}/metrics")
+        return self
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ThroughputReporter:
+    """Logs a throughput + per-stage p50/p99 (ms) line every ``interval_s`` seconds."""
+
+    def __init__(self, registry: Registry, interval_s: float):
+        self.registry = registry
+        self.log = logging.getLogger("metrics")
+        self._last = (time.monotonic(), registry.counter("processed_total"))
+        self._timer = FlushTimer(interval_s, self.report, name="metrics-summary")
+
+    def start(self) -> "ThroughputReporter":
+        self._timer.start()
+        return self
+
+    def report(self) -> None:
+        now, processed = time.monotonic(), self.registry.counter("processed_total")
+        then, before = self._last
+        self._last = (now, processed)
+        rate = (processed - before) / max(now - then, 1e-9)
+        self.log.info(f"Throughput: {rate:.1f} req/s (processed={processed:g}); "
+                      f"p50/p99 ms: {self.registry.summary() or '-'}")
+
+    def close(self) -> None:
+        self._timer.stop()
@@ -1,8 +1,10 @@
 # models.py — stdlib version (no pydantic)
 
-from dataclasses import dataclass, field
-from typing import List, Optional, Literal, Dict, Any
+from dataclasses import dataclass, field, fields
+from typing import List, Optional, Literal, Dict, Any, Union
+import json
 import re
+from json.encoder import encode_basestring_ascii as _json_str
 
 SchemaType = Literal[
     "WidgetCreateRequest",
@@ -12,12 +14,71 @@ SchemaType = Literal[
 
 OWNER_RE = re.compile(r"[A-Za-z ]+$")
 
-@dataclass
+_SCHEMA_TYPES = frozenset(("WidgetCreateRequest", "WidgetDeleteRequest", "WidgetUpdateRequest"))
+
+@dataclass(slots=True)
 class OtherAttribute:
     name: str
     value: str
 
-@dataclass
+def _owner_ok(owner: str) -> bool:
+    # Same language as OWNER_RE (ASCII letters and spaces) without the regex
+    letters = owner.replace(" ", "")
+    return not letters or (letters.isascii() and letters.isalpha())
+
+def _validate(type_: Any, request_id: Any, widget_id: Any, owner: Any) -> None:
+    if type_ not in _SCHEMA_TYPES:
+        raise ValueError("type must be one of the schema values")
+    if not isinstance(request_id, str) or not request_id:
+        raise ValueError("requestId must be a non-empty string")
+    if not isinstance(widget_id, str) or not widget_id:
+        raise ValueError("widgetId must be a non-empty string")
+    if not isinstance(owner, str) or not owner:
+        raise ValueError("owner must be a non-empty string")
+    if not _owner_ok(owner):
+        raise ValueError("owner must contain only letters and spaces")
+
+def _to_attributes(items: Any) -> List[OtherAttribute]:
+    out: List[OtherAttribute] = []
+    append = out.append
+    for oa in items or ():
+        if isinstance(oa, dict):
+            name = oa.get("name")
+            value = oa.get("value")
+            if not isinstance(name, str) or not isinstance(value, str):
+                raise ValueError("each otherAttributes item must have string name and value")
+            append(OtherAttribute(name, value))
+        elif isinstance(oa, OtherAttribute):
+            append(oa)
+        else:
+            raise ValueError("otherAttributes items must be dicts or OtherAttribute objects")
+    return out
+
+def _attributes_from_json(items: Any) -> List[OtherAttribute]:
+    """_to_attributes for freshly decoded JSON: exact dict/str types only.
+
+    Fills the OtherAttribute slots directly, skipping the dataclass __init__;
+    anything unusual goes through the general path for its error message.
+    """
+    if type(items) is not list:
+        return _to_attributes(items)
+    out: List[OtherAttribute] = []
+    append = out.append
+    new = object.__new__
+    for oa in items:
+        if type(oa) is not dict:
+            return _to_attributes(items)
+        name = oa.get("name")
+        value = oa.get("value")
+        if type(name) is not str or type(value) is not str:
+            raise ValueError("each otherAttributes item must have string name and value")
+        attr = new(OtherAttribute)
+        attr.name = name
+        attr.value = value
+        append(attr)
+    return out
+
+@dataclass(slots=True)
 class WidgetRequest:
     type: SchemaType
     requestId: str
@@ -28,49 +89,178 @@ class WidgetRequest:
     otherAttributes: Optional[List[OtherAttribute]] = field(default_factory=list)
 
     def __post_init__(self) -> None:
-        # Validate type
-        if self.type not in (
-            "WidgetCreateRequest",
-            "WidgetDeleteRequest",
-            "WidgetUpdateRequest",
-        ):
-            raise ValueError("type must be one of the schema values")
-
-        # Validate required strings
-        for k in ("requestId", "widgetId", "owner"):
-            v = getattr(self, k, None)
-            if not isinstance(v, str) or not v:
-                raise ValueError(f"{k} must be a non-empty string")
-
-        # Validate owner pattern
-        if not OWNER_RE.fullmatch(self.owner):
-            raise ValueError("owner must contain only letters and spaces")
-
+        _validate(self.type, self.requestId, self.widgetId, self.owner)
         # Normalize/validate otherAttributes
-        fixed: List[OtherAttribute] = []
-        for oa in (self.otherAttributes or []):
-            if isinstance(oa, dict):
-                name = oa.get("name")
-                value = oa.get("value")
-                if not isinstance(name, str) or not isinstance(value, str):
-                    raise ValueError("each otherAttributes item must have string name and value")
-                fixed.append(OtherAttribute(name=name, value=value))
-            elif isinstance(oa, OtherAttribute):
-                fixed.append(oa)
-            else:
-                raise ValueError("otherAttributes items must be dicts or OtherAttribute objects")
-        self.otherAttributes = fixed
+        self.otherAttributes = _to_attributes(self.otherAttributes)
+
+    @classmethod
+    def from_json_bytes(cls, body: Union[bytes, str]) -> "WidgetRequest":
+        """Parse and validate a request body in one pass.
+
+        Equivalent to ``WidgetRequest(**json.loads(body))`` but fills the
+        slots directly instead of going through keyword binding and
+        __post_init__.
+        """
+        data = json.loads(body)
+        if type(data) is not dict:
+            raise ValueError("request body must be a JSON object")
+        if not data.keys() <= _FIELDS:
+            raise ValueError(f"unexpected fields: {sorted(data.keys() - _FIELDS)}")
+        get = data.get
+        type_, request_id, widget_id, owner = get("type"), get("requestId"), get("widgetId"), get("owner")
+        _validate(type_, request_id, widget_id, owner)
+
+        req = object.__new__(cls)
+        req.type = type_
+        req.requestId = request_id
+        req.widgetId = widget_id
+        req.owner = owner
+        req.label = get("label")
+        req.description = get("description")
+        req.otherAttributes = _attributes_from_json(get("otherAttributes"))
+        return req
+
+_FIELDS = frozenset(f.name for f in fields(WidgetRequest))
+
+def to_json_bytes(req: WidgetRequest) -> bytes:
+    """Serialize a request in the Bucket 2 wire format (inverse of from_json_bytes)."""
+    d: Dict[str, Any] = {"type": req.type, "requestId": req.requestId,
+                         "widgetId": req.widgetId, "owner": req.owner}
+    if req.label is not None:
+        d["label"] = req.label
+    if req.description is not None:
+        d["description"] = req.description
+    if req.otherAttributes:
+        d["otherAttributes"] = [{"name": oa.name, "value": oa.value} for oa in req.otherAttributes]
+    return json.dumps(d, separators=(",", ":")).encode("utf-8")
 
 def owner_slug(owner: str) -> str:
     return owner.lower().replace(" ", "-")
 
 def to_flat_widget_dict(req: WidgetRequest) -> Dict[str, Any]:
-    d: Dict[str, Any] = {
-        "widgetId": req.widgetId,
-        "owner": req.owner,
-        "label": req.label,
-        "description": req.description,
-    }
-    for oa in req.otherAttributes or []:
+    # Built in one pass: optional fields are only added when set, so there is
+    # no second dict to filter out Nones (attribute values are always strings).
+    d: Dict[str, Any] = {"widgetId": req.widgetId, "owner": req.owner}
+    if req.label is not None:
+        d["label"] = req.label
+    if req.description is not None:
+        d["description"] = req.description
+    for oa in req.otherAttributes or ():
         d[oa.name] = oa.value
-    return {k: v for k, v in d.items() if v is not None}
+    return d
+
+_FIXED_WIDGET_KEYS = frozenset(("widgetId", "owner", "label", "description"))
+
+def to_dynamodb_item(req: WidgetRequest) -> Optional[Dict[str, Dict[str, str]]]:
+    """The flattened widget as a DynamoDB Item of ``{"S": ...}`` attributes.
+
+    Same result as ``TypeSerializer().serialize(to_flat_widget_dict(req))["M"]``
+    without the per-value type dispatch. Returns None if a value is not a
+    plain string, so the caller can fall back to the generic serializer.
+    """
+    item = {"widgetId": {"S": req.widgetId}, "owner": {"S": req.owner}}
+    label, description = req.label, req.description
+    if label is not None:
+        if type(label) is not str:
+            return None
+        item["label"] = {"S": label}
+    if description is not None:
+        if type(description) is not str:
+            return None
+        item["description"] = {"S": description}
+    for oa in req.otherAttributes or ():
+        if type(oa.value) is not str:
+            return None
+        item[oa.name] = {"S": oa.value}
+    return item
+
+def to_widget_json_bytes(req: WidgetRequest) -> Optional[bytes]:
+    """The flattened widget as JSON bytes, identical to ``json.dumps(to_flat_widget_dict(req))``.
+
+    Written directly with the C string encoder. Returns None when the generic
+    path is needed: a non-string value, or an attribute name that repeats or
+    shadows a fixed field (json.dumps would keep only the last value).
+    """
+    parts = ['{"widgetId": ', _json_str(req.widgetId), ', "owner": ', _json_str(req.owner)]
+    append = parts.append
+    label, description = req.label, req.description
+    if label is not None:
+        if type(label) is not str:
+            return None
+        append(', "label": ')
+        append(_json_str(label))
+    if description is not None:
+        if type(description) is not str:
+            return None
+        append(', "description": ')
+        append(_json_str(description))
+    attrs = req.otherAttributes
+    if attrs:
+        names = {oa.name for oa in attrs}
+        if len(names) != len(attrs) or not names.isdisjoint(_FIXED_WIDGET_KEYS):
+            return None
+        for oa in attrs:
+            if type(oa.value) is not str:
+                return None
+            append(", ")
+            append(_json_str(oa.name))
+            append(": ")
+            append(_json_str(oa.value))
+    append("}")
+    return "".join(parts).encode("ascii")
+
+def update_changes(upd: WidgetRequest) -> Dict[str, Any]:
+    """Flattened fields a WidgetUpdateRequest touches: a value to set, or "" to remove.
+
+    Absent fields and ``widgetId`` are left out.
+    """
+    changes: Dict[str, Any] = {"owner": upd.owner, "label": upd.label, "description": upd.description}
+    for oa in upd.otherAttributes or []:
+        changes[oa.name] = oa.value
+    return {k: v for k, v in changes.items() if v is not None and k != "widgetId"}
+
+def apply_update(flat: Dict[str, Any], upd: WidgetRequest) -> Dict[str, Any]:
+    """Apply a WidgetUpdateRequest to a flattened widget dict.
+
+    Fields that are present replace the stored value; an empty string removes
+    it. ``widgetId`` is never changed.
+    """
+    out = dict(flat)
+    for k, v in update_changes(upd).items():
+        if v == "":
+            out.pop(k, None)
+        else:
+            out[k] = v
+    return out
+
+def merge_update(base: WidgetRequest, upd: WidgetRequest) -> WidgetRequest:
+    """Fold an update into an earlier create or update for the same widget.
+
+    Create + Update gives a Create with the update applied, so a single PUT
+    produces the same widget. Update + Update gives one Update whose empty
+    string removals are kept for the store to apply.
+    """
+    keep_removals = base.type == "WidgetUpdateRequest"
+
+    def pick(new, old):
+        if new is None:
+            return old
+        if new == "" and not keep_removals:
+            return None
+        return new
+
+    attrs = {oa.name: oa.value for oa in base.otherAttributes or []}
+    for oa in upd.otherAttributes or []:
+        if oa.value == "" and not keep_removals:
+            attrs.pop(oa.name, None)
+        else:
+            attrs[oa.name] = oa.value
+    return WidgetRequest(
+        type=base.type,
+        requestId=upd.requestId,
+        widgetId=base.widgetId,
+        owner=upd.owner,
+        label=pick(upd.label, base.label),
+        description=pick(upd.description, base.description),
+        otherAttributes=[OtherAttribute(name=n, value=v) for n, v in attrs.items()],
+    )
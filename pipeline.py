@@ -0,0 +1,210 @@
+# pipeline.py
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from models import WidgetRequest
+from logqueue import log_request
+from poller_s3 import RequestBatch, S3RequestPoller
+
+
+class PipelineEngine:
+    """
+    Pipelined consumer loop: list -> (GET + parse) x N -> ordered hand-off.
+
+    A lister thread claims keys from the poller smallest-first and submits each
+    one to a pool of ``fetch_concurrency`` threads that GET and parse the
+    object. Futures are queued in key order and the calling thread releases
+    them to ``handler`` strictly in that order, so the smallest-key-first
+    guarantee of the serial loop is kept while GET latency overlaps.
+
+    The hand-off queue is bounded (``queue_size``), so when the store side
+    falls behind the lister blocks instead of buffering bodies without limit.
+    A request is only deleted from Bucket 2 when it is handed off; anything
+    still queued at shutdown is released and stays in the bucket.
+
+    A batch object (see RequestBatch) is opened by a fetch thread and its
+    lines are streamed to ``handler`` on the calling thread; the object is
+    deleted after the last line. ``stop_after`` is checked between objects,
+    so a batch is always finished once started.
+
+    With ``retry_on`` (exception types) a request is deleted only after the
+    handler returns; a handler error of those types requeues the object (or
+    abandons the batch) so it is retried later, instead of stopping the run.
+    Until that retry succeeds, later requests for the same widget that were
+    already fetched are requeued behind it rather than applied out of order.
+    """
+
+    def __init__(self, poller: S3RequestPoller, handler: Callable[[WidgetRequest], None],
+                 fetch_concurrency: int = 4, queue_size: Optional[int] = None, retry_on: tuple = ()):
+        if fetch_concurrency < 1:
+            raise ValueError("fetch_concurrency must be >= 1")
+        self.poller = poller
+        self.handler = handler
+        self.fetch_concurrency = fetch_concurrency
+        self.queue_size = queue_size or 2 * fetch_concurrency
+        self.retry_on = retry_on
+        self._blocked: Dict[str, str] = {}  # widgetId -> key of its failed request
+        self.processed = 0
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def run(self, stop_after: int = 0) -> int:
+        """Process requests until stop_after is reached (0 = forever)."""
+        pool = ThreadPoolExecutor(max_workers=self.fetch_concurrency, thread_name_prefix="fetch")
+        lister = threading.Thread(target=self._list_loop, args=(pool,), name="lister", daemon=True)
+        lister.start()
+        try:
+            while not (stop_after and self.processed >= stop_after):
+                try:
+                    key, fut = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._error is not None:
+                        raise self._error
+                    continue
+                self._hand_off(key, fut)
+        finally:
+            self._stop.set()
+            lister.join()
+            self._drain()
+            pool.shutdown(wait=True, cancel_futures=True)
+        return self.processed
+
+    def _list_loop(self, pool: ThreadPoolExecutor) -> None:
+        while not self._stop.is_set():
+            try:
+                key = self.poller.next_key()
+            except Exception as e:
+                if self.poller.is_missing_bucket(e):
+                    self.log.error(f"Bucket {self.poller.bucket2} does not exist.")
+                    self._error = e
+                    return
+                self.log.error(f"Error listing requests: {e}")
+                key = None
+            if key is None:
+                self.poller.idle.wait()
+                continue
+            fut = pool.submit(self._fetch, key)
+            if not self._put(key, fut):
+                fut.cancel()
+                self.poller.release(key)
+
+    def _put(self, key: str, fut: Future) -> bool:
+        """Blocking put that still notices shutdown (backpressure point)."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put((key, fut), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, key: str):
+        body = self.poller.read_body(key)
+        if isinstance(body, RequestBatch):
+            return body, None
+        try:
+            return self.poller.parse(body), None
+        except Exception as e:
+            return None, e
+
+    def _hand_off(self, key: str, fut: Future) -> None:
+        try:
+            req, parse_error = fut.result()
+        except Exception as e:
+            self.log.error(f"Error retrieving request {key}: {e}")
+            self.poller.release(key)
+            self._unblock(key)
+            return
+
+        if isinstance(req, RequestBatch):
+            self._hand_off_batch(req)
+            return
+        if self.retry_on and parse_error is None:
+            self._hand_off_then_ack(key, req)
+            return
+
+        # Same delete-after-read semantics as the serial loop
+        try:
+            self.poller.ack(key)
+        except Exception as e:
+            self.log.error(f"Error deleting request {key}: {e}")
+            return
+        if parse_error is not None:
+            self.log.error(f"Error parsing request {key}: {parse_error}")
+            return
+        log_request(self.poller.log, req.requestId, "Consumed request from %s", key)
+
+        self.handler(req)
+        self.processed += 1
+
+    def _hand_off_then_ack(self, key: str, req: WidgetRequest) -> None:
+        if self._blocked.get(req.widgetId, key) != key:
+            self.poller.requeue(key)  # an earlier request for this widget goes first
+            return
+        try:
+            self.handler(req)
+        except self.retry_on as e:
+            self.log.error(f"Request {req.requestId} not stored everywhere; left in Bucket 2 to retry: {e}")
+            self._blocked[req.widgetId] = key
+            self.poller.requeue(key)
+            return
+        except Exception:
+            self.poller.release(key)
+            raise
+        self._blocked.pop(req.widgetId, None)
+        try:
+            self.poller.ack(key)
+        except Exception as e:
+            self.log.error(f"Error deleting request {key}: {e}")
+        log_request(self.poller.log, req.requestId, "Consumed request from %s", key)
+        self.processed += 1
+
+    def _unblock(self, key: str) -> None:
+        """A failed request that can no longer be read must not hold its widget forever."""
+        for widget_id, blocker in list(self._blocked.items()):
+            if blocker == key:
+                del self._blocked[widget_id]
+
+    def _hand_off_batch(self, batch: RequestBatch) -> None:
+        lines = iter(batch)
+        while True:
+            try:
+                req = next(lines, None)
+            except Exception as e:
+                self.poller.fail_batch(batch, e)
+                return
+            if req is None:
+                break
+            try:
+                self.handler(req)
+            except self.retry_on as e:
+                self.log.error(f"Batch {batch.key} stopped at line {batch.lines}; left in Bucket 2 to retry: {e}")
+                self.poller.abandon_batch(batch)
+                return
+            except Exception:
+                self.poller.abandon_batch(batch)
+                raise
+            self.processed += 1
+        try:
+            self.poller.finish_batch(batch)
+        except Exception as e:
+            self.log.error(f"Error deleting batch {batch.key}: {e}")
+
+    def _drain(self) -> None:
+        """Release everything fetched but not handed off; it stays in Bucket 2."""
+        while True:
+            try:
+                key, fut = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if not fut.cancel() and fut.exception() is None:
+                body = fut.result()[0]
+                if isinstance(body, RequestBatch):
+                    body.close()
+            self.poller.release(key)
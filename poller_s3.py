@@ -1,50 +1,789 @@
 # poller_s3.py
-import boto3
-import json
+import bisect
+import gzip
 import time
 import logging
-from typing import Optional
+import threading
+import zlib
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from batching import FlushTimer
+from clients import ClientFactory
+from idle import FixedIdle
+from logqueue import log_request
+from metrics import REGISTRY
 from models import WidgetRequest
 
+MAX_LIST_KEYS = 1000  # S3 hard limit for a single list_objects_v2 page
+MAX_DELETE_KEYS = 1000  # S3 hard limit for a single delete_objects call
+BATCH_SUFFIXES = (".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz")
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def is_gzipped(key: str, obj: dict) -> bool:
+    return key.endswith(".gz") or obj.get("ContentEncoding", "").lower() == "gzip"
+
+
+def is_batch(key: str, obj: dict) -> bool:
+    return key.endswith(BATCH_SUFFIXES) or obj.get("ContentType", "").split(";")[0] in NDJSON_CONTENT_TYPES
+
+
+class RequestBatch:
+    """
+    Streams the requests of one NDJSON batch object (one request per line).
+
+    Lines are read from the GET response ``body`` in ``chunk_bytes`` pieces
+    (through gzip when ``gzipped``), so the object is never held in memory as
+    a whole. Blank lines are skipped; a line that does not parse is logged
+    with its line number and counted in ``bad`` instead of aborting the
+    batch. The caller deletes the object once iteration is finished.
+
+    ``skip_lines`` resumes a batch that failed partway: the first lines were
+    already handled and are read past without being yielded again.
+    """
+
+    def __init__(self, key: str, body, gzipped: bool = False, chunk_bytes: int = 64 << 10,
+                 skip_lines: int = 0):
+        self.key = key
+        self.body = body
+        self.gzipped = gzipped
+        self.chunk_bytes = chunk_bytes
+        self.skip_lines = skip_lines
+        self.lines = 0
+        self.bad = 0
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def _raw_lines(self) -> Iterator[bytes]:
+        stream = gzip.GzipFile(fileobj=self.body, mode="rb") if self.gzipped else self.body
+        tail = b""
+        while True:
+            chunk = stream.read(self.chunk_bytes)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+    def __iter__(self) -> Iterator[WidgetRequest]:
+        for line in self._raw_lines():
+            self.lines += 1
+            if self.lines <= self.skip_lines or not line.strip():
+                continue
+            try:
+                with REGISTRY.stage("parse"):
+                    req = WidgetRequest.from_json_bytes(line)
+            except Exception as e:
+                self.bad += 1
+                REGISTRY.inc("batch_lines_total", help="Lines read from batch objects by result.", result="bad")
+                self.log.error(f"Bad request on line {self.lines} of {self.key}: {e}")
+                continue
+            REGISTRY.inc("batch_lines_total", help="Lines read from batch objects by result.", result="ok")
+            yield req
+
+    def close(self) -> None:
+        close = getattr(self.body, "close", None)
+        if close is not None:
+            close()
+
+
+class S3AckBatcher:
+    """
+    Collects consumed Bucket 2 keys and removes them with delete_objects.
+
+    A batch is flushed when it reaches ``max_batch`` keys, when its oldest key
+    is ``max_age_ms`` old, or on close(). Keys that come back in the response's
+    ``Errors`` list are retried up to ``max_attempts`` times with a short
+    backoff; anything still failing is logged and counted in ``failed``.
+    ``on_settled(key)`` is called once per key after its final attempt.
+    """
+
+    def __init__(self, s3, bucket: str, max_batch: int = MAX_DELETE_KEYS, max_age_ms: int = 1000,
+                 max_attempts: int = 3, on_settled: Optional[Callable[[str], None]] = None):
+        if not 1 <= max_batch <= MAX_DELETE_KEYS:
+            raise ValueError(f"max_batch must be between 1 and {MAX_DELETE_KEYS}")
+        self.s3 = s3
+        self.bucket = bucket
+        self.max_batch = max_batch
+        self.max_age = max(1, max_age_ms) / 1000.0
+        self.max_attempts = max(1, max_attempts)
+        self.on_settled = on_settled or (lambda key: None)
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.deleted = 0
+        self.failed = 0
+        self.calls = 0
+
+        self._keys: list[str] = []
+        self._oldest = 0.0
+        self._lock = threading.Lock()        # guards _keys/_oldest
+        self._flush_lock = threading.Lock()  # one delete_objects round at a time
+        self._timer = FlushTimer(self.max_age / 2, self._flush_if_due, name="ack-flush").start()
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            if not self._keys:
+                self._oldest = time.monotonic()
+            self._keys.append(key)
+            full = len(self._keys) >= self.max_batch
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def _flush_if_due(self) -> None:
+        with self._lock:
+            due = bool(self._keys) and time.monotonic() - self._oldest >= self.max_age
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch, self._keys = self._keys[:self.max_batch], self._keys[self.max_batch:]
+                    self._oldest = time.monotonic()
+                if not batch:
+                    return
+                self._delete(batch)
+
+    def close(self) -> None:
+        self._timer.stop()
+        self.flush()
+
+    def _delete(self, keys: list[str]) -> None:
+        errors: dict[str, str] = {}
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(0.05 * 2 ** (attempt - 1))
+            try:
+                self.calls += 1
+                with REGISTRY.stage("delete"):
+                    resp = self.s3.delete_objects(
+                        Bucket=self.bucket,
+                        Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True},
+                    )
+                errors = {e["Key"]: f"{e.get('Code')}: {e.get('Message')}" for e in resp.get("Errors", [])}
+            except Exception as e:
+                errors = {k: str(e) for k in keys}
+
+            for k in keys:
+                if k not in errors:
+                    self.deleted += 1
+                    self.on_settled(k)
+            keys = [k for k in keys if k in errors]
+            if not keys:
+                return
+
+        for k in keys:
+            self.failed += 1
+            REGISTRY.inc("acks_failed_total", help="Bucket 2 deletes that failed after all retries.")
+            self.log.error(f"Failed to delete {self.bucket}/{k} after {self.max_attempts} attempts: {errors[k]}")
+            self.on_settled(k)
+
+
 class S3RequestPoller:
     """
     Polls Bucket 2 for widget requests, one object at a time.
     Reads the smallest key, deletes it, parses JSON into a WidgetRequest.
-    Sleeps ~100ms when no requests are available.
+    Sleeps ~100ms when no requests are available; pass an ``idle`` strategy
+    (see idle.py) to back off adaptively instead. ``idle_polls`` and
+    ``busy_polls`` count empty and non-empty polls.
+
+    With ``page_size`` > 1 the poller runs in prefetch mode: it lists a page of
+    keys into a local ordered buffer and walks forward with ``StartAfter``
+    instead of issuing one LIST per request. The buffer is refilled once it
+    holds ``refill_threshold`` keys or fewer, so it does not run dry between
+    requests. Keys are still handed out smallest-first.
+
+    With ``ack_batch_size`` > 0, consumed keys are deleted in batches through an
+    S3AckBatcher instead of one delete_object per request; call close() on
+    shutdown to flush the last batch.
+
+    ``prefix`` restricts listing to one key prefix, and ``shard_index`` /
+    ``shard_count`` keep only keys whose crc32 hash falls in this shard, so
+    several consumer processes can split Bucket 2 without racing.
+
+    ``clients`` is the process's shared ClientFactory (see clients.py); the S3
+    client is created on first use.
+
+    Objects named ``*.ndjson`` / ``*.jsonl`` (or with an NDJSON content type)
+    are batch objects holding one request per line; ``*.gz`` names and
+    ``Content-Encoding: gzip`` are decompressed on the fly. read_body returns
+    a RequestBatch for those, and the key is deleted only after the last line
+    has been handled. A batch that fails while being read (e.g. a truncated
+    gzip object) is released with its progress remembered, so the next attempt
+    resumes after the last handled line; after ``max_batch_attempts`` failed
+    reads it is deleted and the last good line is logged.
+
+    With ``defer_ack`` get_next_request does not delete a single-request
+    object when it returns it; the caller calls settle() once the request has
+    been handled, which deletes it (or requeues it for a retry on failure).
+
+    requeue() gives a claimed key back for a retry: it is handed out again
+    before any key listed or buffered after it, so a retried request is not
+    overtaken by later requests for the same widget.
     """
 
-    def __init__(self, bucket2_name: str, sleep_ms: int = 100):
-        self.s3 = boto3.client("s3")
+    def __init__(self, bucket2_name: str, sleep_ms: int = 100,
+                 page_size: int = 1, refill_threshold: int = 0,
+                 ack_batch_size: int = 0, ack_max_age_ms: int = 1000, idle=None,
+                 prefix: str = "", shard_index: int = 0, shard_count: int = 1,
+                 clients: Optional[ClientFactory] = None, max_batch_attempts: int = 3,
+                 defer_ack: bool = False):
+        if not 1 <= page_size <= MAX_LIST_KEYS:
+            raise ValueError(f"page_size must be between 1 and {MAX_LIST_KEYS}")
+        if page_size > 1 and not 0 <= refill_threshold < page_size:
+            raise ValueError("refill_threshold must be >= 0 and smaller than page_size")
+        if not 0 <= shard_index < shard_count:
+            raise ValueError("shard_index must be >= 0 and smaller than shard_count")
+
+        self.s3 = (clients or ClientFactory()).client("s3")
         self.bucket2 = bucket2_name
-        self.sleep = max(1, sleep_ms) / 1000.0
+        self.idle = idle or FixedIdle(sleep_ms)
+        self.idle_polls = 0
+        self.busy_polls = 0
+        self.page_size = page_size
+        self.refill_threshold = refill_threshold
+        self.prefix = prefix
+        self.shard_index = shard_index
+        self.shard_count = shard_count
         self.log = logging.getLogger(self.__class__.__name__)
 
-    def get_next_request(self) -> Optional[WidgetRequest]:
-        """Return the next WidgetRequest object or None if bucket empty."""
-        try:
-            resp = self.s3.list_objects_v2(Bucket=self.bucket2, MaxKeys=1)
+        self._buffer: deque[str] = deque()
+        self._cursor: Optional[str] = None  # last key listed into the buffer
+        self._at_end = False                # last listing reached the end of the bucket
+        self._inflight: set[str] = set()    # handed out, not yet deleted
+        self._retry: List[str] = []         # requeued keys, sorted; served first
+        self._lock = threading.Lock()
+        self._batch: Optional[RequestBatch] = None  # get_next_request's open batch
+        self._batch_iter: Optional[Iterator[WidgetRequest]] = None
+        self.max_batch_attempts = max(1, max_batch_attempts)
+        self.defer_ack = defer_ack
+        self._held: Optional[str] = None  # defer_ack: returned, not yet settled
+        self._batch_failures: Dict[str, Tuple[int, int]] = {}  # key -> (failed reads, lines handled)
+
+        self._acks: Optional[S3AckBatcher] = None
+        if ack_batch_size:
+            self._acks = S3AckBatcher(self.s3, self.bucket2, max_batch=ack_batch_size,
+                                      max_age_ms=ack_max_age_ms, on_settled=self.release)
+
+    @property
+    def prefetch(self) -> bool:
+        return self.page_size > 1
+
+    # ---- key listing ----------------------------------------------------
+
+    def owns(self, key: str) -> bool:
+        return self.shard_count == 1 or zlib.crc32(key.encode("utf-8")) % self.shard_count == self.shard_index
+
+    def _list(self, max_keys: int, start_after: Optional[str], prefix: Optional[str] = None,
+              delimiter: str = "") -> dict:
+        params = {"Bucket": self.bucket2, "MaxKeys": max_keys}
+        prefix = self.prefix if prefix is None else prefix
+        if prefix:
+            params["Prefix"] = prefix
+        if delimiter:
+            params["Delimiter"] = delimiter
+        if start_after is not None:
+            params["StartAfter"] = start_after
+        with REGISTRY.stage("list"):
+            return self.s3.list_objects_v2(**params)
+
+    def next_key(self) -> Optional[str]:
+        """Return the smallest unclaimed key in Bucket 2, or None if empty.
+
+        The returned key is marked in-flight until ack() deletes it, so it is
+        never handed out twice.
+        """
+        key = self._pop_retry()
+        if key is not None:
+            return self._claim(key)
+        if self.prefetch:
+            # Once the listing has hit the end of the bucket, wait for the
+            # buffer to drain instead of re-listing an empty tail every call.
+            low = len(self._buffer) <= self.refill_threshold
+            if (low and not self._at_end) or not self._buffer:
+                self._refill()
+            key = self._buffer.popleft() if self._buffer else None
+        else:
+            key = self._list_smallest()
+
+        if key is None:
+            self.idle_polls += 1
+            REGISTRY.inc("polls_total", help="Polls of Bucket 2 by result.", result="empty")
+            return None
+        return self._claim(key)
+
+    def _pop_retry(self) -> Optional[str]:
+        with self._lock:
+            if not self._retry:
+                return None
+            key = self._retry.pop(0)
+            self._inflight.add(key)  # in the same step, so a concurrent listing skips it
+            return key
+
+    def _claim(self, key: str) -> str:
+        self.busy_polls += 1
+        REGISTRY.inc("polls_total", help="Polls of Bucket 2 by result.", result="busy")
+        self.idle.reset()
+        with self._lock:
+            self._inflight.add(key)
+        return key
+
+    def _list_smallest(self) -> Optional[str]:
+        """Legacy mode: one LIST with MaxKeys=1 per request.
+
+        Keys owned by other shards are stepped over one LIST at a time, so
+        sharded consumers should run with a prefetch page instead.
+        """
+        with self._lock:
+            start_after = max(self._inflight) if self._inflight else None
+        while True:
+            resp = self._list(1, start_after)
             contents = resp.get("Contents", [])
             if not contents:
-                time.sleep(self.sleep)
                 return None
-
             # Always pick the smallest key lexicographically
             key = sorted([c["Key"] for c in contents])[0]
+            if self.owns(key):
+                return key
+            if not resp.get("IsTruncated"):
+                return None
+            start_after = key
+
+    def _refill(self) -> None:
+        """Append the next page of keys after the cursor to the buffer.
+
+        When the cursor reaches the end of the bucket with nothing buffered,
+        the listing restarts from the beginning so keys written behind the
+        cursor are picked up on the next pass.
+        """
+        added = self._list_page(self._cursor)
+        if not added and not self._buffer and self._cursor is not None:
+            self._cursor = None
+            self._list_page(None)
+
+    def _list_page(self, start_after: Optional[str]) -> int:
+        wanted = self.page_size - len(self._buffer)
+        added = 0
+        while added < wanted:
+            resp = self._list(self.page_size, start_after)
+            keys = sorted(c["Key"] for c in resp.get("Contents", []))
+            with self._lock:
+                buffered = set(self._buffer)
+                for key in keys:
+                    if self.owns(key) and key not in self._inflight and key not in buffered \
+                            and key not in self._retry:
+                        self._buffer.append(key)
+                        added += 1
+            if keys:
+                start_after = self._cursor = keys[-1]
+            self._at_end = not resp.get("IsTruncated")
+            if self._at_end:
+                break
+        return added
+
+    # ---- object handling ------------------------------------------------
+
+    def read_body(self, key: str) -> Union[bytes, RequestBatch]:
+        """Body of a single-request object, or a streaming RequestBatch for a batch object."""
+        with REGISTRY.stage("get"):
             obj = self.s3.get_object(Bucket=self.bucket2, Key=key)
-            body = obj["Body"].read().decode("utf-8")
+            if is_batch(key, obj):
+                skip = self._batch_failures.get(key, (0, 0))[1]
+                return RequestBatch(key, obj["Body"], gzipped=is_gzipped(key, obj), skip_lines=skip)
+            body = obj["Body"].read()
+        return gzip.decompress(body) if is_gzipped(key, obj) else body
+
+    @staticmethod
+    def parse(body: bytes) -> WidgetRequest:
+        with REGISTRY.stage("parse"):
+            return WidgetRequest.from_json_bytes(body)
+
+    def ack(self, key: str) -> None:
+        """Delete a consumed request from Bucket 2 and release its claim.
+
+        In batched mode the key stays claimed until its batch is deleted, so a
+        re-list can never hand it out again in the meantime.
+        """
+        if self._acks is not None:
+            self._acks.add(key)
+            return
+        try:
+            with REGISTRY.stage("delete"):
+                self.s3.delete_object(Bucket=self.bucket2, Key=key)
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def release(self, key: str) -> None:
+        """Give up a claimed key without deleting it."""
+        with self._lock:
+            self._inflight.discard(key)
+
+    def requeue(self, key: str) -> None:
+        """Give up a claimed key for a retry that comes before every later key."""
+        with self._lock:
+            self._inflight.discard(key)
+            if key not in self._retry:
+                bisect.insort(self._retry, key)
+
+    def inflight(self) -> int:
+        """Number of keys handed out and not yet deleted or released."""
+        with self._lock:
+            return len(self._inflight)
+
+    def finish_batch(self, batch: RequestBatch) -> None:
+        """Delete a fully handled batch object."""
+        batch.close()
+        self._batch_failures.pop(batch.key, None)
+        self.ack(batch.key)
+        self.log.info(f"Consumed batch {batch.key}: lines={batch.lines} bad={batch.bad}")
+
+    def fail_batch(self, batch: RequestBatch, error: BaseException) -> None:
+        """Handle a batch whose body could not be read to the end.
+
+        Every line yielded so far has been handled. The key is released and
+        the next attempt resumes after ``batch.lines``; once the batch has
+        failed ``max_batch_attempts`` times it is deleted instead.
+        """
+        batch.close()
+        attempts = self._batch_failures.get(batch.key, (0, 0))[0] + 1
+        if attempts >= self.max_batch_attempts:
+            self._batch_failures.pop(batch.key, None)
+            REGISTRY.inc("batches_dropped_total", help="Unreadable batch objects deleted after retries.")
+            self.log.error(f"Deleting unreadable batch {batch.key} after {attempts} attempts; "
+                           f"last good line {batch.lines}: {error}")
+            self.ack(batch.key)
+            return
+        self._batch_failures[batch.key] = (attempts, batch.lines)
+        self.log.error(f"Error reading batch {batch.key} after line {batch.lines} "
+                       f"(attempt {attempts}/{self.max_batch_attempts}): {error}")
+        self.release(batch.key)
+
+    def abandon_batch(self, batch: RequestBatch) -> None:
+        """Leave a partly handled batch in Bucket 2; it is replayed in full later."""
+        batch.close()
+        self.release(batch.key)
+        self.log.info(f"Released unfinished batch {batch.key} after {batch.lines} lines")
+
+    def settle(self, ok: bool) -> None:
+        """With defer_ack: finish the request get_next_request last returned.
 
-            # Delete immediately after reading
-            self.s3.delete_object(Bucket=self.bucket2, Key=key)
-            self.log.info(f"Consumed request from {key}")
+        ``ok`` deletes its object; otherwise the object is requeued (a batch
+        is abandoned) and replayed later.
+        """
+        key, self._held = self._held, None
+        if key is not None:
+            if ok:
+                self.ack(key)
+            else:
+                self.requeue(key)
+        elif not ok and self._batch is not None:
+            batch, self._batch, self._batch_iter = self._batch, None, None
+            self.abandon_batch(batch)
 
-            # Parse JSON into a WidgetRequest
-            data = json.loads(body)
-            req = WidgetRequest(**data)
-            return req
+    def close(self) -> None:
+        """Flush any batched acks."""
+        if self._held is not None:
+            self.release(self._held)
+            self._held = None
+        if self._batch is not None:
+            self.abandon_batch(self._batch)
+            self._batch = self._batch_iter = None
+        if self._acks is not None:
+            self._acks.close()
+        self.log.info(f"Poll stats: busy={self.busy_polls} idle={self.idle_polls}")
 
-        except self.s3.exceptions.NoSuchBucket:
-            self.log.error(f"Bucket {self.bucket2} does not exist.")
-            raise
+    def is_missing_bucket(self, exc: BaseException) -> bool:
+        return isinstance(exc, self.s3.exceptions.NoSuchBucket)
+
+    def _next_from_batch(self) -> Optional[WidgetRequest]:
+        """Next line of the open batch; deletes the batch once it is exhausted.
+
+        Called only after the caller has handled the previous line, so the
+        delete happens after the last line has been processed.
+        """
+        batch = self._batch
+        try:
+            return next(self._batch_iter)
+        except StopIteration:
+            self._batch = self._batch_iter = None
+            self.finish_batch(batch)
         except Exception as e:
-            self.log.error(f"Error retrieving request: {e}")
+            self._batch = self._batch_iter = None
+            self.fail_batch(batch, e)
+        return None
+
+    def get_next_request(self) -> Optional[WidgetRequest]:
+        """Return the next WidgetRequest object or None if bucket empty.
+
+        Also returns None when a batch has just ended (finished or failed), so
+        a batch that keeps failing can never hold the caller in this call.
+        """
+        while True:
+            if self._batch is not None:
+                return self._next_from_batch()
+
+            key = None
+            try:
+                key = self.next_key()
+                if key is None:
+                    self.idle.wait()
+                    return None
+
+                body = self.read_body(key)
+                if isinstance(body, RequestBatch):
+                    # Stays claimed until the last line has been handled
+                    self._batch, self._batch_iter = body, iter(body)
+                    continue
+
+                if self.defer_ack:
+                    try:
+                        req = self.parse(body)
+                    except Exception:
+                        self.ack(key)  # a body that does not parse never will
+                        raise
+                    self._held = key
+                    log_request(self.log, req.requestId, "Consumed request from %s", key)
+                    return req
+
+                # Delete immediately after reading
+                self.ack(key)
+
+                # Parse JSON into a WidgetRequest; sampled by requestId like every later line
+                req = self.parse(body)
+                log_request(self.log, req.requestId, "Consumed request from %s", key)
+                return req
+
+            except self.s3.exceptions.NoSuchBucket:
+                self.log.error(f"Bucket {self.bucket2} does not exist.")
+                raise
+            except Exception as e:
+                self.log.error(f"Error retrieving request: {e}")
+                if key is not None:
+                    self.release(key)
+                return None
+
+
+def parse_prefix_weights(spec: str) -> Tuple[bool, Dict[str, int]]:
+    """Parse ``auto,tenantA/=3,tenantB/`` into (discover, {prefix: weight}).
+
+    ``auto`` turns on prefix discovery; a prefix without ``=weight`` gets 1.
+    Prefixes may not contain one another (``a`` and ``ab``): each lane lists
+    on its own, so a key under both would be handed out twice.
+    """
+    discover = False
+    weights: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        if item == "auto":
+            discover = True
+            continue
+        prefix, _, weight = item.rpartition("=") if "=" in item else (item, "", "1")
+        if not prefix or not weight.isdigit() or int(weight) < 1:
+            raise ValueError(f"bad prefix weight {item!r}; expected PREFIX or PREFIX=N with N >= 1")
+        weights[prefix] = int(weight)
+    if not discover and not weights:
+        raise ValueError("no prefixes given")
+    check_disjoint_prefixes(weights)
+    return discover, weights
+
+
+def check_disjoint_prefixes(prefixes) -> None:
+    """Raise ValueError if one prefix starts with another."""
+    ordered = sorted(prefixes)
+    for shorter, longer in zip(ordered, ordered[1:]):
+        # Sorted order puts every extension of a prefix right after it
+        if longer.startswith(shorter):
+            raise ValueError(f"prefixes {shorter!r} and {longer!r} overlap; use disjoint prefixes")
+
+
+def _page_end(resp: dict) -> Optional[str]:
+    """StartAfter value that continues a delimited listing past this page."""
+    ends = [c["Key"] for c in resp.get("Contents", [])[-1:]]
+    # A common prefix stands for all keys under it: skip past the whole group
+    ends += [cp["Prefix"] + "\U0010ffff" for cp in resp.get("CommonPrefixes", [])[-1:]]
+    return max(ends) if ends else None
+
+
+class PrefixLane:
+    """One prefix's share of Bucket 2: its own ordered key buffer and listing cursor."""
+
+    def __init__(self, prefix: str, weight: int = 1, delimiter: str = ""):
+        self.prefix = prefix
+        self.weight = weight
+        self.delimiter = delimiter  # set on the discovery root lane: top-level keys only
+        self.current = 0            # smooth weighted round-robin credit
+        self.served = 0
+        self.buffer: deque[Tuple[str, float]] = deque()  # (key, time it was written or first listed)
+        self.cursor: Optional[str] = None
+        self.at_end = False
+        self.next_check = 0.0       # when an exhausted lane may be listed again
+        self.wait = REGISTRY.histogram("prefix_wait_seconds",
+                                       help="Age of Bucket 2 keys when claimed, per prefix.", prefix=prefix)
+
+
+class FairS3RequestPoller(S3RequestPoller):
+    """
+    S3RequestPoller that shares Bucket 2 fairly between key prefixes (tenants).
+
+    The plain poller always takes the smallest key in the bucket, so one busy
+    producer with small keys can starve the others. Here every prefix gets a
+    PrefixLane with its own buffer of up to ``page_size`` keys and its own
+    listing cursor, and next_key picks among the lanes that have keys with
+    smooth weighted round-robin: a lane of weight 3 is served three times as
+    often as a lane of weight 1 while both have a backlog. Within a lane keys
+    are still handed out smallest-first.
+
+    ``weights`` maps prefixes to weights. With ``discover`` the prefixes one
+    ``delimiter`` level below ``prefix`` are listed at start and again every
+    ``rediscover_s`` seconds (new ones get weight 1), and keys directly under
+    ``prefix`` are served by a lane of their own. Keys outside every lane are
+    not consumed. Configured prefixes must not contain one another, and with
+    ``discover`` each must be a single ``delimiter`` level below ``prefix``
+    (the level discovery works at), so no key belongs to two lanes.
+
+    A lane whose listing reached its end is not listed again for
+    ``sleep_ms``, so idle tenants cost one LIST each per poll interval.
+    ``prefix_backlog()`` and the ``prefix_wait_seconds`` histogram (claim time
+    minus LastModified) are there to tune the weights.
+    """
+
+    def __init__(self, bucket2_name: str, weights: Optional[Dict[str, int]] = None,
+                 discover: bool = False, delimiter: str = "/", rediscover_s: float = 30.0,
+                 **kwargs):
+        super().__init__(bucket2_name, **kwargs)
+        if not weights and not discover:
+            raise ValueError("give prefix weights, discover=True, or both")
+        check_disjoint_prefixes(p for p in weights or {} if not (discover and p == self.prefix))
+        if discover:
+            for p in weights or {}:
+                rest = p[len(self.prefix):]
+                if p != self.prefix and not (p.startswith(self.prefix) and rest.endswith(delimiter)
+                                             and rest.count(delimiter) == 1):
+                    raise ValueError(f"prefix {p!r} is not one {delimiter!r} level below {self.prefix!r}, "
+                                     "so it would overlap a discovered prefix")
+        self.delimiter = delimiter
+        self.discover = discover
+        self.rediscover_s = rediscover_s
+        self.recheck_s = kwargs.get("sleep_ms", 100) / 1000.0
+        self.lanes: Dict[str, PrefixLane] = {}
+        for prefix, weight in (weights or {}).items():
+            if not (discover and prefix == self.prefix):  # that weight goes to the top-level lane below
+                self.lanes[prefix] = PrefixLane(prefix, weight)
+        self._weights = dict(weights or {})
+        self._discovered_at: Optional[float] = None
+        if discover:
+            self.lanes.setdefault(self.prefix, PrefixLane(self.prefix, self._weights.get(self.prefix, 1),
+                                                          delimiter=delimiter))
+
+    # ---- prefix discovery -----------------------------------------------
+
+    def _discover(self) -> None:
+        found: List[str] = []
+        start_after = None
+        while True:
+            resp = self._list(MAX_LIST_KEYS, start_after, delimiter=self.delimiter)
+            found += [cp["Prefix"] for cp in resp.get("CommonPrefixes", [])]
+            if not resp.get("IsTruncated"):
+                break
+            start_after = _page_end(resp)
+        for prefix in found:
+            if prefix not in self.lanes:
+                self.lanes[prefix] = PrefixLane(prefix, self._weights.get(prefix, 1))
+                self.log.info(f"Discovered prefix {prefix} (weight {self.lanes[prefix].weight})")
+
+    def _maybe_discover(self, now: float) -> None:
+        if self.discover and (self._discovered_at is None or now - self._discovered_at >= self.rediscover_s):
+            self._discovered_at = now
+            self._discover()
+
+    # ---- key listing ----------------------------------------------------
+
+    def next_key(self) -> Optional[str]:
+        """Claim the smallest key of the next lane in weighted round-robin order."""
+        key = self._pop_retry()
+        if key is not None:
+            return self._claim(key)
+        now = time.monotonic()
+        self._maybe_discover(now)
+        for lane in self.lanes.values():
+            low = len(lane.buffer) <= self.refill_threshold
+            if (low and not lane.at_end) or (not lane.buffer and now >= lane.next_check):
+                self._refill_lane(lane)
+                if not lane.buffer:
+                    lane.next_check = now + self.recheck_s
+
+        lane = self._pick()
+        if lane is None:
+            self.idle_polls += 1
+            REGISTRY.inc("polls_total", help="Polls of Bucket 2 by result.", result="empty")
             return None
+        key, since = lane.buffer.popleft()
+        lane.served += 1
+        lane.wait.observe(max(0.0, time.time() - since))
+        REGISTRY.inc("prefix_requests_total", help="Bucket 2 keys claimed per prefix.", prefix=lane.prefix)
+        return self._claim(key)
+
+    def _pick(self) -> Optional[PrefixLane]:
+        """Smooth weighted round-robin (as in nginx) over the lanes with keys."""
+        ready = [lane for lane in self.lanes.values() if lane.buffer]
+        if not ready:
+            return None
+        total = 0
+        best = None
+        for lane in ready:
+            lane.current += lane.weight
+            total += lane.weight
+            if best is None or lane.current > best.current:
+                best = lane
+        best.current -= total
+        return best
+
+    def _refill_lane(self, lane: PrefixLane) -> None:
+        """Top up one lane's buffer; wraps to the lane's start like _refill does for the bucket."""
+        added = self._list_lane(lane, lane.cursor)
+        if not added and not lane.buffer and lane.cursor is not None:
+            lane.cursor = None
+            self._list_lane(lane, None)
+
+    def _list_lane(self, lane: PrefixLane, start_after: Optional[str]) -> int:
+        wanted = self.page_size - len(lane.buffer)
+        added = 0
+        now = time.time()
+        while added < wanted:
+            resp = self._list(self.page_size, start_after, prefix=lane.prefix, delimiter=lane.delimiter)
+            contents = sorted(resp.get("Contents", []), key=lambda c: c["Key"])
+            with self._lock:
+                buffered = {k for k, _ in lane.buffer}
+                for c in contents:
+                    key = c["Key"]
+                    if self.owns(key) and key not in self._inflight and key not in buffered \
+                            and key not in self._retry:
+                        modified = c.get("LastModified")
+                        lane.buffer.append((key, modified.timestamp() if modified is not None else now))
+                        added += 1
+            end = _page_end(resp)
+            if end is not None:
+                start_after = lane.cursor = end
+            lane.at_end = not resp.get("IsTruncated")
+            if lane.at_end:
+                break
+        return added
+
+    # ---- stats ----------------------------------------------------------
+
+    def prefix_backlog(self) -> List[Tuple[Dict[str, str], float]]:
+        """Listed but unclaimed keys per prefix (at most page_size; a lower bound while listing is truncated)."""
+        return [({"prefix": lane.prefix}, len(lane.buffer)) for lane in list(self.lanes.values())]
+
+    def close(self) -> None:
+        super().close()
+        for lane in list(self.lanes.values()):
+            self.log.info(f"Prefix {lane.prefix or '(top level)'}: weight={lane.weight} served={lane.served} "
+                          f"backlog={len(lane.buffer)} wait_p50={lane.wait.quantile(0.5) * 1000:.0f}ms "
+                          f"wait_p99={lane.wait.quantile(0.99) * 1000:.0f}ms")
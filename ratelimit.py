@@ -0,0 +1,147 @@
+# ratelimit.py
+import logging
+import threading
+import time
+from typing import Optional
+
+from metrics import REGISTRY
+from models import WidgetRequest
+
+# Error codes AWS uses to say "slow down" (DynamoDB, S3 and the generic ones)
+THROTTLE_CODES = frozenset((
+    "ProvisionedThroughputExceededException", "ThrottlingException", "Throttling",
+    "RequestLimitExceeded", "RequestThrottled", "TooManyRequestsException",
+    "SlowDown", "503 SlowDown",
+))
+
+
+def is_throttle(exc: BaseException) -> bool:
+    response = getattr(exc, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLE_CODES
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket plus an AIMD concurrency window, tuned by throttling signals.
+
+    ``acquire()`` waits for a token (refilled at ``rate`` per second, with a
+    burst of a tenth of a second's worth) and for a free slot under the
+    concurrency ``limit``; ``release(throttled)`` returns the slot. Each
+    success adds to the rate so it grows by ``increase`` requests/second per
+    second of clean calls, and widens the window by about one slot per
+    window's worth of successes. A throttle multiplies both by ``decrease``,
+    at most once per ``cooldown_s`` so one burst of rejections counts once.
+    ``rate`` and ``limit`` stay within their min/max bounds.
+    """
+
+    def __init__(self, max_rate: float = 1000.0, min_rate: float = 1.0, initial_rate: Optional[float] = None,
+                 max_concurrency: int = 16, increase: float = 10.0, decrease: float = 0.5,
+                 cooldown_s: float = 0.2):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("rates must satisfy 0 < min_rate <= max_rate")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max_rate, max(min_rate, initial_rate or max_rate))
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown_s
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.throttles = 0
+        self.inflight = 0
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                burst = max(1.0, self.rate / 10)
+                self._tokens = min(burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1.0 and self.inflight < int(self.limit):
+                    self._tokens -= 1.0
+                    self.inflight += 1
+                    return
+                wait = (1.0 - self._tokens) / self.rate if self._tokens < 1.0 else 0.05
+                self._cond.wait(max(wait, 0.001))
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.inflight -= 1
+            if throttled:
+                self._on_throttle()
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _on_throttle(self) -> None:
+        self.throttles += 1
+        now = time.monotonic()
+        if now - self._last_cut < self.cooldown:
+            return
+        self._last_cut = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.limit = max(1.0, self.limit * self.decrease)
+        self._tokens = min(self._tokens, 0.0)
+        self.log.warning(f"Throttled: write rate cut to {self.rate:.1f}/s, concurrency to {int(self.limit)}")
+
+
+class RateLimitedStore:
+    """
+    Wraps a widget store so every put/delete/update goes through an
+    AdaptiveRateLimiter. Throttling errors (see THROTTLE_CODES) slow the
+    limiter down and the call is retried, up to ``max_attempts`` times, so a
+    burst of ProvisionedThroughputExceeded/SlowDown becomes a slowdown rather
+    than a failed request. Other errors are raised at once.
+    """
+
+    def __init__(self, store, limiter: AdaptiveRateLimiter, max_attempts: int = 8):
+        self.store = store
+        self.limiter = limiter
+        self.max_attempts = max(1, max_attempts)
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def widget_key(self, req: WidgetRequest) -> str:
+        return getattr(self.store, "widget_key", lambda r: r.widgetId)(req)
+
+    def put_widget(self, req: WidgetRequest):
+        return self._call(self.store.put_widget, req)
+
+    def delete_widget(self, req: WidgetRequest):
+        return self._call(self.store.delete_widget, req)
+
+    def update_widget(self, req: WidgetRequest):
+        return self._call(self.store.update_widget, req)
+
+    def _call(self, fn, req: WidgetRequest):
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire()
+            try:
+                result = fn(req)
+            except Exception as e:
+                throttled = is_throttle(e)
+                self.limiter.release(throttled=throttled)
+                if not throttled or attempt == self.max_attempts:
+                    raise
+                REGISTRY.inc("write_throttles_total", help="Store calls rejected with a throttling error.")
+                self.log.info(f"Throttled writing {req.widgetId} (attempt {attempt}); retrying")
+                continue
+            self.limiter.release()
+            return result
+
+    def close(self) -> None:
+        self.log.info(f"Rate limiter: rate={self.limiter.rate:.1f}/s limit={int(self.limiter.limit)} "
+                      f"throttles={self.limiter.throttles}")
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
@@ -1,14 +1,22 @@
 # router.py
 import logging
+from logqueue import log_request
+from metrics import REGISTRY
 from models import WidgetRequest
 
 def handle_request(req: WidgetRequest, store, log: logging.Logger) -> None:
-    if req.type == "WidgetCreateRequest":
-        store.put_widget(req)
-        log.info(f"CREATE processed: widgetId={req.widgetId} owner={req.owner}")
-    elif req.type == "WidgetDeleteRequest":
-        log.warning("DELETE request received — not implemented in HW6")
-    elif req.type == "WidgetUpdateRequest":
-        log.warning("UPDATE request received — not implemented in HW6")
-    else:
-        log.error(f"Unknown request type: {req.type}")
+    with REGISTRY.stage("route"):
+        if req.type == "WidgetCreateRequest":
+            with REGISTRY.stage("store_put"):
+                store.put_widget(req)
+            log_request(log, req.requestId, "CREATE processed: widgetId=%s owner=%s", req.widgetId, req.owner)
+        elif req.type == "WidgetDeleteRequest":
+            with REGISTRY.stage("store_delete"):
+                store.delete_widget(req)
+            log_request(log, req.requestId, "DELETE processed: widgetId=%s owner=%s", req.widgetId, req.owner)
+        elif req.type == "WidgetUpdateRequest":
+            with REGISTRY.stage("store_update"):
+                store.update_widget(req)
+            log_request(log, req.requestId, "UPDATE processed: widgetId=%s owner=%s", req.widgetId, req.owner)
+        else:
+            log.error(f"Unknown request type: {req.type}")
@@ -0,0 +1,325 @@
+# spool.py
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import REGISTRY
+from models import WidgetRequest, to_json_bytes
+
+# Record framing: payload length and crc32 of the payload, then the payload
+_HEADER = struct.Struct(">II")
+_SEGMENT_FMT = "spool-{:012d}.log"
+_CHECKPOINT = "checkpoint"
+
+Position = Tuple[int, int]  # (segment number, byte offset)
+
+
+class SegmentSpool:
+    """
+    Append-only on-disk queue of request bodies, split into segment files.
+
+    ``append`` writes a framed record to the newest segment (rolling to a new
+    file once ``segment_bytes`` is reached); a single reader walks the
+    segments with ``read`` and reports progress with ``commit``. The committed
+    position is persisted to a ``checkpoint`` file every ``commit_every``
+    records, whenever the reader moves on to a new segment, while append is
+    waiting for space, and on close(); segments entirely before it are
+    deleted. After
+    a restart, reading resumes at the last persisted checkpoint, so records
+    can be replayed (at-least-once) but never lost; a torn record at the end
+    of the newest segment (crash mid-write) is truncated away.
+
+    Disk usage is capped at ``max_bytes``: append blocks while the spool is
+    full, which pushes back on the poller exactly like a slow store would
+    have, but only once the local buffer is exhausted. With ``fsync`` every
+    append is also forced to disk (survives power loss, not just a crash).
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 << 20, max_bytes: int = 1 << 30,
+                 commit_every: int = 100, fsync: bool = False):
+        if max_bytes < 2 * segment_bytes:
+            raise ValueError("max_bytes must be at least twice segment_bytes")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.commit_every = max(1, commit_every)
+        self.fsync = fsync
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.appended = 0
+        self.read_count = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+        self._committed = self._saved = self._load_checkpoint()
+        self._uncommitted = 0
+        self._sizes: Dict[int, int] = {}
+        for seq in self._segments():
+            if seq < self._committed[0]:
+                os.remove(self._path(seq))  # finished before the last checkpoint
+            else:
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+        if not self._sizes:
+            self._sizes[self._committed[0]] = 0
+        if self._committed[0] not in self._sizes or self._committed[1] > self._sizes[self._committed[0]]:
+            self.log.warning(f"Spool checkpoint {self._committed} does not match the segments on disk; "
+                             "replaying from the oldest segment")
+            self._committed = (min(self._sizes), 0)
+        self._write_seq = max(self._sizes)
+        self._recover_tail()
+        self._writer = open(self._path(self._write_seq), "ab")
+        self._read_pos: Position = self._committed
+        self._reader: Optional[Tuple[int, object]] = None
+
+        backlog = self.backlog_bytes()
+        if backlog:
+            self.log.info(f"Spool {directory}: resuming at {self._committed} with {backlog} bytes to replay")
+
+    # ---- paths & recovery ------------------------------------------------
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, _SEGMENT_FMT.format(seq))
+
+    def _segments(self) -> list:
+        out = []
+        for name in os.listdir(self.directory):
+            if name.startswith("spool-") and name.endswith(".log"):
+                out.append(int(name[6:-4]))
+        return sorted(out)
+
+    def _load_checkpoint(self) -> Position:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT), encoding="utf-8") as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except FileNotFoundError:
+            segments = self._segments()
+            return (segments[0] if segments else 0), 0
+
+    def _save_checkpoint(self, pos: Position) -> None:
+        path = os.path.join(self.directory, _CHECKPOINT)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(f"{pos[0]} {pos[1]}\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _recover_tail(self) -> None:
+        """Truncate the newest segment after its last complete record."""
+        path = self._path(self._write_seq)
+        if not os.path.exists(path):
+            return
+        good = 0
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                good = f.tell()
+        if good < self._sizes[self._write_seq]:
+            self.log.warning(f"Truncating torn record in {path} at offset {good}")
+            with open(path, "r+b") as f:
+                f.truncate(good)
+            self._sizes[self._write_seq] = good
+
+    # ---- writer side -----------------------------------------------------
+
+    def disk_bytes(self) -> int:
+        with self._cond:
+            return sum(self._sizes.values())
+
+    def backlog_bytes(self) -> int:
+        """Bytes appended but not yet committed by the reader."""
+        with self._cond:
+            seq, pos = self._committed
+            return sum(size for s, size in self._sizes.items() if s >= seq) - pos
+
+    def append(self, payload: bytes) -> None:
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if len(record) > self.segment_bytes:
+            raise ValueError(f"record of {len(record)} bytes does not fit in a spool segment")
+        with self._cond:
+            while sum(self._sizes.values()) + len(record) > self.max_bytes:
+                if self._closed:
+                    raise RuntimeError("spool is closed")
+                # Free segments the reader finished since the last checkpoint
+                self.flush_checkpoint()
+                if sum(self._sizes.values()) + len(record) <= self.max_bytes:
+                    break
+                self._cond.wait(0.1)
+            if self._sizes[self._write_seq] and self._sizes[self._write_seq] + len(record) > self.segment_bytes:
+                self._roll()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._sizes[self._write_seq] += len(record)
+            self.appended += 1
+            self._cond.notify_all()
+
+    def _roll(self) -> None:
+        self._writer.close()
+        self._write_seq += 1
+        self._sizes[self._write_seq] = 0
+        self._writer = open(self._path(self._write_seq), "ab")
+
+    # ---- reader side -----------------------------------------------------
+
+    def read(self, timeout: float = 0.1) -> Optional[Tuple[bytes, Position]]:
+        """Next record and the position just after it, or None if none arrived in time."""
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while True:
+                seq, pos = self._read_pos
+                if pos < self._sizes.get(seq, 0):  # gone: flushed as finished
+                    break
+                if seq < self._write_seq:
+                    self._read_pos = (seq + 1, 0)
+                    continue
+                remaining = deadline - time.monotonic()
+                if self._closed or remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+        f = self._reader_for(seq)
+        f.seek(pos)
+        length, crc = _HEADER.unpack(f.read(_HEADER.size))
+        payload = f.read(length)
+        if zlib.crc32(payload) != crc:
+            raise IOError(f"corrupt spool record in {self._path(seq)} at offset {pos}")
+        end = (seq, pos + _HEADER.size + length)
+        with self._cond:
+            self._read_pos = end
+            self.read_count += 1
+        return payload, end
+
+    def _reader_for(self, seq: int):
+        if self._reader is None or self._reader[0] != seq:
+            if self._reader is not None:
+                self._reader[1].close()
+            self._reader = (seq, open(self._path(seq), "rb"))
+        return self._reader[1]
+
+    def commit(self, pos: Position, force: bool = False) -> None:
+        """Mark everything before ``pos`` as done; persist every commit_every records or new segment."""
+        with self._cond:
+            new_segment = pos[0] != self._committed[0]
+            self._committed = pos
+            self._uncommitted += 1
+            if not force and not new_segment and self._uncommitted < self.commit_every:
+                return
+            self._uncommitted = 0
+        self.flush_checkpoint()
+
+    def flush_checkpoint(self) -> None:
+        with self._cond:
+            pos = self._committed
+            if pos[0] < self._write_seq and pos[1] >= self._sizes[pos[0]]:
+                # Fully read and no longer written: the next segment's start is the same place
+                pos = self._committed = (pos[0] + 1, 0)
+            if pos == self._saved:
+                return
+            self._save_checkpoint(pos)
+            self._saved = pos
+            finished = [s for s in self._sizes if s < pos[0]]
+            for s in finished:
+                del self._sizes[s]
+            self._cond.notify_all()
+        for s in finished:
+            try:
+                os.remove(self._path(s))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush_checkpoint()
+        with self._cond:
+            self._writer.close()
+            if self._reader is not None:
+                self._reader[1].close()
+                self._reader = None
+        self.log.info(f"Spool closed: appended={self.appended} replayed={self.read_count} "
+                      f"backlog_bytes={self.backlog_bytes()}")
+
+
+class SpoolDrain:
+    """
+    Replays spooled requests into the store on a background thread.
+
+    ``handler(req)`` is the normal routing function. A failed store call is
+    retried with a growing delay (up to ``max_backoff_s``) rather than
+    skipped, so a throttled store slows the drain down without losing or
+    reordering requests; the poller keeps filling the spool meanwhile.
+    """
+
+    def __init__(self, spool: SegmentSpool, handler: Callable[[WidgetRequest], None],
+                 max_backoff_s: float = 5.0, drain_timeout_s: float = 30.0):
+        self.spool = spool
+        self.handler = handler
+        self.max_backoff = max_backoff_s
+        self.drain_timeout = drain_timeout_s
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.drained = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-drain", daemon=True)
+
+    def start(self) -> "SpoolDrain":
+        self._thread.start()
+        return self
+
+    def submit(self, req: WidgetRequest) -> None:
+        """Engine-side handler: persist the request and return immediately."""
+        self.spool.append(to_json_bytes(req))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rec = self.spool.read(timeout=0.1)
+            if rec is None:
+                continue
+            payload, pos = rec
+            try:
+                req = WidgetRequest.from_json_bytes(payload)
+            except Exception as e:
+                self.log.error(f"Dropping unreadable spool record before {pos}: {e}")
+                self.spool.commit(pos)
+                continue
+            if not self._deliver(req):
+                return  # stopped while retrying; the record stays uncommitted
+            self.drained += 1
+            self.spool.commit(pos)
+
+    def _deliver(self, req: WidgetRequest) -> bool:
+        delay = 0.05
+        while True:
+            try:
+                self.handler(req)
+                return True
+            except Exception as e:
+                REGISTRY.inc("spool_retries_total", help="Store calls retried by the spool drain.")
+                self.log.error(f"Store call failed for {req.requestId}; retrying in {delay:.2f}s: {e}")
+                if self._stop.wait(delay):
+                    return False
+                delay = min(delay * 2, self.max_backoff)
+
+    def close(self) -> None:
+        """Give the drain up to drain_timeout_s to catch up, then stop it."""
+        deadline = time.monotonic() + self.drain_timeout
+        while self.spool.backlog_bytes() and self._thread.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._stop.set()
+        self._thread.join()
+        self.spool.close()
+        self.log.info(f"Spool drain stopped: drained={self.drained}")
@@ -1,30 +1,299 @@
 # storage_dynamodb.py
 import logging
-import boto3
-from boto3.dynamodb.types import TypeSerializer
-from models import WidgetRequest, to_flat_widget_dict
+import random
+import threading
+import time
+from typing import Optional
+from batching import FlushTimer
+from clients import ClientFactory
+from content_cache import ContentHashCache, item_digest, warm_from_dynamodb
+from logqueue import log_request
+from models import WidgetRequest, to_dynamodb_item, to_flat_widget_dict, update_changes
+
+MAX_BATCH_WRITE = 25  # DynamoDB hard limit for a single batch_write_item call
+
 
 class DynamoWidgetStore:
     """
     Saves widgets to a DynamoDB table with *flattened* attributes.
     Every field (including otherAttributes) becomes a top-level attribute.
+
+    With a ``content_cache`` (see content_cache.py), a put whose item equals
+    the last one written for that widgetId is skipped.
+
+    Updates are a single conditional ``update_item`` (SET for new values,
+    REMOVE for empty strings), so no read of the stored item is needed.
     """
 
-    def __init__(self, table_name: str):
-        self.ddb = boto3.client("dynamodb")
+    def __init__(self, table_name: str, clients: Optional[ClientFactory] = None,
+                 content_cache: Optional[ContentHashCache] = None):
+        from boto3.dynamodb.types import TypeSerializer
+
+        self.ddb = (clients or ClientFactory()).client("dynamodb")
         self.table = table_name
+        self.content_cache = content_cache
         self.serializer = TypeSerializer()
         self.log = logging.getLogger(self.__class__.__name__)
 
+    def widget_key(self, req: WidgetRequest) -> str:
+        return req.widgetId
+
+    def _key(self, req: WidgetRequest) -> dict:
+        return {"widgetId": {"S": req.widgetId}}
+
+    def _to_item(self, req: WidgetRequest) -> dict:
+        item_av = to_dynamodb_item(req)  # direct {"S": ...} attributes
+        if item_av is None:
+            # A value that is not a plain string: convert generically
+            item_av = self.serializer.serialize(to_flat_widget_dict(req))["M"]
+        return item_av
+
+    def _digest(self, item_av: dict) -> Optional[str]:
+        return item_digest(item_av) if self.content_cache is not None else None
+
+    def _skip(self, req: WidgetRequest, digest: Optional[str]) -> bool:
+        if digest is not None and self.content_cache.unchanged(req.widgetId, digest):
+            log_request(self.log, req.requestId, "Widget %s unchanged in DynamoDB table %s; PUT skipped",
+                        req.widgetId, self.table)
+            return True
+        return False
+
+    def _remember(self, req: WidgetRequest, digest: Optional[str]) -> None:
+        """Record what the table now holds for this widget (None = unknown / gone)."""
+        if self.content_cache is None:
+            return
+        if digest is None:
+            self.content_cache.forget(req.widgetId)
+        else:
+            self.content_cache.remember(req.widgetId, digest)
+
     def put_widget(self, req: WidgetRequest) -> str:
-        item_py = to_flat_widget_dict(req)  # plain Python dict
-        # Convert to DynamoDB AttributeValue format
-        item_av = self.serializer.serialize(item_py)["M"]
+        item_av = self._to_item(req)
+        digest = self._digest(item_av)
+        if self._skip(req, digest):
+            return req.widgetId
 
         try:
             self.ddb.put_item(TableName=self.table, Item=item_av)
-            self.log.info(f"Stored widget {item_py['widgetId']} in DynamoDB table {self.table}")
-            return item_py["widgetId"]
+            self._remember(req, digest)
+            log_request(self.log, req.requestId, "Stored widget %s in DynamoDB table %s",
+                        req.widgetId, self.table)
+            return req.widgetId
         except Exception as e:
+            self._remember(req, None)
             self.log.error(f"Failed to store widget in DynamoDB: {e}")
             raise
+
+    def delete_widget(self, req: WidgetRequest) -> str:
+        self._remember(req, None)
+        try:
+            self.ddb.delete_item(TableName=self.table, Key=self._key(req))
+            log_request(self.log, req.requestId, "Deleted widget %s from DynamoDB table %s",
+                        req.widgetId, self.table)
+            return req.widgetId
+        except Exception as e:
+            self.log.error(f"Failed to delete widget from DynamoDB: {e}")
+            raise
+
+    def _update_expression(self, req: WidgetRequest) -> dict:
+        """update_item parameters that apply the request's changes in place."""
+        names, values, sets, removes = {}, {}, [], []
+        for i, (field, value) in enumerate(update_changes(req).items()):
+            names[f"#a{i}"] = field
+            if value == "":
+                removes.append(f"#a{i}")
+            else:
+                values[f":v{i}"] = self.serializer.serialize(value)
+                sets.append(f"#a{i} = :v{i}")
+        clauses = []
+        if sets:
+            clauses.append("SET " + ", ".join(sets))
+        if removes:
+            clauses.append("REMOVE " + ", ".join(removes))
+        params = {"UpdateExpression": " ".join(clauses), "ExpressionAttributeNames": names}
+        if values:
+            params["ExpressionAttributeValues"] = values
+        return params
+
+    def update_widget(self, req: WidgetRequest) -> Optional[str]:
+        """Apply the update to the stored item in place (None if the widget is missing)."""
+        if not update_changes(req):
+            self.log.info(f"Update for widget {req.widgetId} changes nothing; skipped")
+            return req.widgetId
+        params = self._update_expression(req)
+        if self.content_cache is not None:
+            params["ReturnValues"] = "ALL_NEW"  # to keep the content cache exact
+        self._remember(req, None)
+
+        try:
+            resp = self.ddb.update_item(TableName=self.table, Key=self._key(req),
+                                        ConditionExpression="attribute_exists(widgetId)", **params)
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                self.log.warning(f"Update for missing widget {req.widgetId} in {self.table}; skipped")
+                return None
+            self.log.error(f"Failed to update widget in DynamoDB: {e}")
+            raise
+        if "Attributes" in resp:
+            self._remember(req, self._digest(resp["Attributes"]))
+        log_request(self.log, req.requestId, "Updated widget %s in DynamoDB table %s",
+                    req.widgetId, self.table)
+        return req.widgetId
+
+    def warm_content_cache(self) -> int:
+        """Scan the table into the content cache (reads every item once)."""
+        if self.content_cache is None:
+            return 0
+        return warm_from_dynamodb(self.content_cache, self.ddb, self.table)
+
+
+class BatchedDynamoWidgetStore(DynamoWidgetStore):
+    """
+    Buffers widgets and writes them with batch_write_item, up to 25 per call.
+
+    A batch is flushed when it is full, when its oldest item is
+    ``flush_interval_ms`` old, or on close(). Items for the same widgetId are
+    deduplicated inside a batch (last write wins) because DynamoDB rejects
+    duplicate keys in one request. Deletes are batched the same way; an update
+    flushes the buffer first so it reads the latest state. ``UnprocessedItems``
+    are retried with exponential backoff and jitter; if they still fail the
+    error is raised to the caller (or, for a timed flush, on the next
+    write/close). Writes that did not land go back into the buffer (unless a
+    newer write for the same widget arrived meanwhile), so a caller that
+    retries, e.g. RateLimitedStore after a throttle, loses nothing.
+    """
+
+    def __init__(self, table_name: str, batch_size: int = MAX_BATCH_WRITE,
+                 flush_interval_ms: int = 1000, max_attempts: int = 5, backoff_ms: int = 50,
+                 clients: Optional[ClientFactory] = None, content_cache: Optional[ContentHashCache] = None):
+        super().__init__(table_name, clients, content_cache)
+        if not 1 <= batch_size <= MAX_BATCH_WRITE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_WRITE}")
+        self.batch_size = batch_size
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff_ms / 1000.0
+
+        self.calls = 0
+        self.written = 0
+
+        self._pending: dict[str, dict] = {}  # widgetId -> Put/DeleteRequest
+        self._oldest = 0.0
+        self._error = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = FlushTimer(self.flush_interval / 2, self._flush_if_due, name="ddb-flush").start()
+
+    def put_widget(self, req: WidgetRequest) -> str:
+        item_av = self._to_item(req)
+        digest = self._digest(item_av)
+        if self._skip(req, digest):
+            return req.widgetId
+        self._buffer(req.widgetId, {"PutRequest": {"Item": item_av}})
+        self._remember(req, digest)
+        return req.widgetId
+
+    def delete_widget(self, req: WidgetRequest) -> str:
+        self._buffer(req.widgetId, {"DeleteRequest": {"Key": self._key(req)}})
+        self._remember(req, None)
+        return req.widgetId
+
+    def update_widget(self, req: WidgetRequest) -> Optional[str]:
+        self.flush()
+        return super().update_widget(req)
+
+    def _buffer(self, widget_id: str, write: dict) -> None:
+        self._raise_pending_error()
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            # Re-insert so a superseded write moves to the end of the batch
+            self._pending.pop(widget_id, None)
+            self._pending[widget_id] = write
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    ids = list(self._pending)[:self.batch_size]
+                    writes = [self._pending.pop(i) for i in ids]
+                    self._oldest = time.monotonic()
+                self._write_batch(writes)
+
+    def close(self) -> None:
+        self._timer.stop()
+        self.flush()
+        self._raise_pending_error()
+
+    def _flush_if_due(self) -> None:
+        with self._lock:
+            due = bool(self._pending) and time.monotonic() - self._oldest >= self.flush_interval
+        if not due:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            self._error = e
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def _write_batch(self, writes: list) -> None:
+        requests = {self.table: writes}
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # Exponential backoff with full jitter
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            self.calls += 1
+            try:
+                resp = self.ddb.batch_write_item(RequestItems=requests)
+            except Exception as e:
+                self.log.error(f"Failed to batch-write widgets to DynamoDB: {e}")
+                self._drop_content_cache()
+                self._requeue(requests[self.table])
+                raise
+            unprocessed = resp.get("UnprocessedItems") or {}
+            done = len(requests[self.table]) - len(unprocessed.get(self.table, []))
+            self.written += done
+            if done:
+                self.log.info(f"Wrote {done} widgets to DynamoDB table {self.table}")
+            if not unprocessed.get(self.table):
+                return
+            requests = unprocessed
+
+        left = len(requests[self.table])
+        self.log.error(f"{left} widgets still unprocessed after {self.max_attempts} attempts")
+        self._drop_content_cache()
+        self._requeue(requests[self.table])
+        raise RuntimeError(f"batch_write_item left {left} unprocessed items in {self.table}")
+
+    def _requeue(self, writes: list) -> None:
+        """Put writes that did not land back in front of the buffer."""
+        with self._lock:
+            failed = {}
+            for w in writes:
+                item = w["PutRequest"]["Item"] if "PutRequest" in w else w["DeleteRequest"]["Key"]
+                widget_id = item["widgetId"]["S"]
+                if widget_id not in self._pending:  # a newer write supersedes it
+                    failed[widget_id] = w
+            if failed:
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                self._pending = {**failed, **self._pending}
+
+    def _drop_content_cache(self) -> None:
+        # Buffered puts were remembered when queued; after a failed batch we
+        # no longer know what the table holds.
+        if self.content_cache is not None:
+            self.content_cache.clear()
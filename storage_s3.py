@@ -1,27 +1,54 @@
 # storage_s3.py
 import json
-import boto3
 import logging
-from models import WidgetRequest, to_flat_widget_dict, owner_slug
+from typing import Optional
+from clients import ClientFactory
+from content_cache import ContentHashCache, WidgetDocumentCache, body_digest, warm_from_s3
+from logqueue import log_request
+from models import WidgetRequest, to_flat_widget_dict, to_widget_json_bytes, owner_slug, apply_update
 
 class S3WidgetStore:
     """
     Handles saving widgets to Bucket 3 in S3 as JSON objects.
     File path: widgets/{ownerSlug}/{widgetId}
+
+    With a ``content_cache`` (see content_cache.py), a put whose JSON body is
+    byte-identical to the last one written under that key is skipped.
+
+    With a ``widget_cache`` (see content_cache.py), documents this store wrote
+    are kept so an update can merge into them without a GET first.
     """
 
-    def __init__(self, bucket3_name: str):
-        self.s3 = boto3.client("s3")
+    def __init__(self, bucket3_name: str, clients: Optional[ClientFactory] = None,
+                 content_cache: Optional[ContentHashCache] = None,
+                 widget_cache: Optional[WidgetDocumentCache] = None):
+        self.s3 = (clients or ClientFactory()).client("s3")
         self.bucket3 = bucket3_name
+        self.content_cache = content_cache
+        self.widget_cache = widget_cache
         self.log = logging.getLogger(self.__class__.__name__)
 
+    def widget_key(self, req: WidgetRequest) -> str:
+        return f"widgets/{owner_slug(req.owner)}/{req.widgetId}"
+
     def put_widget(self, req: WidgetRequest) -> str:
         """
         Serialize and upload a WidgetRequest to S3.
         Returns the S3 key used for the object.
         """
-        key = f"widgets/{owner_slug(req.owner)}/{req.widgetId}"
-        body = json.dumps(to_flat_widget_dict(req))
+        key = self.widget_key(req)
+        body = to_widget_json_bytes(req)
+        if body is None:
+            body = json.dumps(to_flat_widget_dict(req)).encode("utf-8")
+        digest = None
+        if self.content_cache is not None:
+            digest = body_digest(body)
+            if self.content_cache.unchanged(key, digest):
+                log_request(self.log, req.requestId, "Widget %s unchanged in %s/%s; PUT skipped",
+                            req.widgetId, self.bucket3, key)
+                if self.widget_cache is not None:
+                    self.widget_cache.put(key, body)
+                return key
 
         try:
             self.s3.put_object(
@@ -30,8 +57,78 @@ class S3WidgetStore:
                 Body=body,
                 ContentType="application/json"
             )
-            self.log.info(f"Stored widget {req.widgetId} in {self.bucket3}/{key}")
+            if digest is not None:
+                self.content_cache.remember(key, digest)
+            if self.widget_cache is not None:
+                self.widget_cache.put(key, body)
+            log_request(self.log, req.requestId, "Stored widget %s in %s/%s", req.widgetId, self.bucket3, key)
             return key
         except Exception as e:
+            if digest is not None:
+                self.content_cache.forget(key)
+            if self.widget_cache is not None:
+                self.widget_cache.forget(key)
             self.log.error(f"Failed to store widget: {e}")
             raise
+
+    def delete_widget(self, req: WidgetRequest) -> str:
+        """Delete the widget object. Deleting a missing widget is not an error."""
+        key = self.widget_key(req)
+        if self.content_cache is not None:
+            self.content_cache.forget(key)
+        if self.widget_cache is not None:
+            self.widget_cache.forget(key)
+        try:
+            self.s3.delete_object(Bucket=self.bucket3, Key=key)
+            log_request(self.log, req.requestId, "Deleted widget %s from %s/%s",
+                        req.widgetId, self.bucket3, key)
+            return key
+        except Exception as e:
+            self.log.error(f"Failed to delete widget: {e}")
+            raise
+
+    def update_widget(self, req: WidgetRequest) -> Optional[str]:
+        """
+        Read the stored widget (from the widget cache if it holds it), apply
+        the update and write it back.
+        Returns the key, or None if there is no widget to update.
+        """
+        key = self.widget_key(req)
+        stored = self.widget_cache.get(key) if self.widget_cache is not None else None
+        if stored is None:
+            try:
+                obj = self.s3.get_object(Bucket=self.bucket3, Key=key)
+            except self.s3.exceptions.NoSuchKey:
+                self.log.warning(f"Update for missing widget {req.widgetId} ({self.bucket3}/{key}); skipped")
+                return None
+            stored = obj["Body"].read()
+        current = json.loads(stored)
+        body = json.dumps(apply_update(current, req)).encode("utf-8")
+        if self.content_cache is not None:
+            self.content_cache.forget(key)
+        if self.widget_cache is not None:
+            self.widget_cache.forget(key)
+
+        try:
+            self.s3.put_object(
+                Bucket=self.bucket3,
+                Key=key,
+                Body=body,
+                ContentType="application/json"
+            )
+            if self.content_cache is not None:
+                self.content_cache.remember(key, body_digest(body))
+            if self.widget_cache is not None:
+                self.widget_cache.put(key, body)
+            log_request(self.log, req.requestId, "Updated widget %s in %s/%s",
+                        req.widgetId, self.bucket3, key)
+            return key
+        except Exception as e:
+            self.log.error(f"Failed to update widget: {e}")
+            raise
+
+    def warm_content_cache(self) -> int:
+        """Load the ETags of existing widgets into the content cache."""
+        if self.content_cache is None:
+            return 0
+        return warm_from_s3(self.content_cache, self.s3, self.bucket3)
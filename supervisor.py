@@ -0,0 +1,130 @@
+# supervisor.py
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Callable
+
+
+def _sigterm_to_interrupt(signum, frame):
+    # Workers shut down through the same KeyboardInterrupt path as Ctrl-C,
+    # so acks and buffered writes are flushed before the process exits.
+    raise KeyboardInterrupt
+
+
+def _worker_entry(target: Callable, index: int, count: int, counter) -> None:
+    signal.signal(signal.SIGTERM, _sigterm_to_interrupt)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when to stop
+    raise SystemExit(target(index, count, counter))
+
+
+class Supervisor:
+    """
+    Runs N consumer worker processes and keeps them alive.
+
+    ``target(index, count, counter)`` is the worker body; each worker owns a
+    disjoint slice of the Bucket 2 keyspace chosen by its index and adds every
+    processed request to the shared ``counter``. The supervisor restarts a
+    worker that exits with an error (up to ``max_restarts`` times each, with a
+    growing delay) and, once the combined count reaches ``stop_after``, sends
+    SIGTERM to all workers so they drain and exit. Requests already in flight
+    when the limit is hit still finish, so the total can overshoot slightly.
+    """
+
+    def __init__(self, target: Callable, workers: int, stop_after: int = 0,
+                 max_restarts: int = 5, restart_delay_s: float = 1.0, poll_s: float = 0.2):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.target = target
+        self.workers = workers
+        self.stop_after = stop_after
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay_s
+        self.poll = poll_s
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self._ctx = multiprocessing.get_context()
+        self.counter = self._ctx.Value("q", 0)
+        self.restarts = [0] * workers
+        self._procs: list = [None] * workers
+        self._restart_at = [0.0] * workers
+
+    @property
+    def processed(self) -> int:
+        return self.counter.value
+
+    def run(self) -> int:
+        """Supervise until stop-after, interrupt, or every worker has given up.
+
+        Returns 0 on a clean stop and 1 if workers had to be abandoned.
+        """
+        for i in range(self.workers):
+            self._start(i)
+        try:
+            while True:
+                if self.stop_after and self.processed >= self.stop_after:
+                    self.log.info(f"Stop-after reached ({self.processed}). Stopping workers.")
+                    break
+                if not self._check_workers():
+                    self.log.error("All workers have exited; giving up.")
+                    return 1
+                time.sleep(self.poll)
+        except KeyboardInterrupt:
+            self.log.info("Interrupted by user. Stopping workers.")
+        finally:
+            self._stop_all()
+        return 0
+
+    def _start(self, i: int) -> None:
+        p = self._ctx.Process(target=_worker_entry, args=(self.target, i, self.workers, self.counter),
+                              name=f"consumer-w{i}")
+        p.start()
+        self._procs[i] = p
+        self.log.info(f"Started worker {i}/{self.workers} (pid {p.pid})")
+
+    def _check_workers(self) -> bool:
+        """Restart crashed workers; return False once none are left running."""
+        alive = False
+        now = time.monotonic()
+        for i, p in enumerate(self._procs):
+            if p is None:
+                if self._restart_at[i] and now >= self._restart_at[i]:
+                    self._restart_at[i] = 0.0
+                    self._start(i)
+                    alive = True
+                elif self._restart_at[i]:
+                    alive = True
+                continue
+            if p.is_alive():
+                alive = True
+                continue
+
+            p.join()
+            self._procs[i] = None
+            if p.exitcode == 0:
+                self.log.info(f"Worker {i} exited cleanly")
+                continue
+            if self.restarts[i] >= self.max_restarts:
+                self.log.error(f"Worker {i} exited with {p.exitcode}; restart limit reached")
+                continue
+            self.restarts[i] += 1
+            delay = self.restart_delay * self.restarts[i]
+            self.log.warning(f"Worker {i} exited with {p.exitcode}; restarting in {delay:.1f}s "
+                             f"(restart {self.restarts[i]}/{self.max_restarts})")
+            self._restart_at[i] = now + delay
+            alive = True
+        return alive
+
+    def _stop_all(self, timeout_s: float = 30.0) -> None:
+        for p in self._procs:
+            if p is not None and p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+        for p in self._procs:
+            if p is None:
+                continue
+            p.join(timeout_s)
+            if p.is_alive():
+                self.log.error(f"Worker pid {p.pid} did not stop; killing it")
+                p.kill()
+                p.join()
@@ -0,0 +1,37 @@
+# tests/conftest.py
+import json
+
+import pytest
+
+import consumer
+from bench.fakes import FakeAWS
+
+
+def seed_bucket2(fakes: FakeAWS, n: int, bucket: str = "bucket2") -> None:
+    """Put ``n`` create requests straight into the fake bucket (no injected faults)."""
+    objects = fakes.s3.bucket(bucket)
+    for i in range(n):
+        objects[f"{i:04d}.json"] = json.dumps({
+            "type": "WidgetCreateRequest", "requestId": f"r{i}", "widgetId": f"w{i}",
+            "owner": "Alice Smith", "otherAttributes": [{"name": "color", "value": "blue"}],
+        }).encode("utf-8")
+
+
+@pytest.fixture
+def run_consumer(monkeypatch, tmp_path):
+    """
+    Run consumer.main over ``n`` seeded requests against FakeAWS.
+
+    Extra CLI args are appended; the log goes to ``tmp_path / "c.log"``.
+    Returns the fakes once the consumer has exited cleanly.
+    """
+    def run(*args: str, fakes: FakeAWS = None, n: int = 20) -> FakeAWS:
+        fakes = fakes or FakeAWS()
+        seed_bucket2(fakes, n)
+        monkeypatch.setattr("boto3.client", fakes.client)
+        rc = consumer.main(["--bucket2", "bucket2", "--sleep-ms", "1", "--stop-after", str(n),
+                            "--log-file", str(tmp_path / "c.log"), *args])
+        assert rc == 0
+        return fakes
+
+    return run
@@ -0,0 +1,83 @@
+# tests/test_async_engine.py
+import json
+import logging
+import random
+import threading
+import time
+
+from async_engine import AsyncioEngine
+from idle import FixedIdle
+from models import WidgetRequest
+
+
+class FakePoller:
+    """In-memory Bucket 2 whose keys map onto a handful of widgets."""
+    def __init__(self, n: int, widgets: int = 3):
+        self.objects = {
+            f"{i:04d}.json": json.dumps({
+                "type": "WidgetCreateRequest",
+                "requestId": f"r{i}",
+                "widgetId": f"w{i % widgets}",
+                "owner": "Alice Smith",
+            }).encode("utf-8")
+            for i in range(n)
+        }
+        self.pending = sorted(self.objects)
+        self.deleted = []
+        self.released = []
+        self.idle = FixedIdle(1)
+        self.log = logging.getLogger("FakePoller")
+        self.lock = threading.Lock()
+
+    def next_key(self):
+        with self.lock:
+            return self.pending.pop(0) if self.pending else None
+
+    def read_body(self, key):
+        time.sleep(random.uniform(0, 0.003))
+        return self.objects[key]
+
+    parse = staticmethod(lambda body: WidgetRequest(**json.loads(body)))
+
+    def ack(self, key):
+        self.deleted.append(key)
+
+    def release(self, key):
+        self.released.append(key)
+
+    def is_missing_bucket(self, exc):
+        return False
+
+
+def test_asyncio_engine_keeps_per_widget_order_and_caps_in_flight():
+    poller = FakePoller(60)
+    lock = threading.Lock()
+    writes, active, peak = [], [0], [0]
+
+    def handler(req):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(random.uniform(0, 0.003))
+        with lock:
+            active[0] -= 1
+            writes.append((req.widgetId, int(req.requestId[1:])))
+
+    engine = AsyncioEngine(poller, handler, max_in_flight=8)
+    assert engine.run(stop_after=60) == 60
+
+    for w in ("w0", "w1", "w2"):
+        mine = [r for wid, r in writes if wid == w]
+        assert mine == sorted(mine)
+    assert 1 < peak[0] <= 3  # writes overlap across widgets, never within one
+    assert poller.deleted == sorted(poller.objects)
+
+
+def test_asyncio_engine_stop_after_releases_unhandled_keys():
+    poller = FakePoller(100)
+    engine = AsyncioEngine(poller, lambda req: None, max_in_flight=5)
+
+    assert engine.run(stop_after=10) == 10
+    assert len(poller.deleted) == 10
+    assert not set(poller.released) & set(poller.deleted)
+    assert len(poller.released) <= 5
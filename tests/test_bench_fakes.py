@@ -0,0 +1,53 @@
+# tests/test_bench_fakes.py
+import pytest
+from botocore.exceptions import ClientError
+
+import consumer
+from bench.bench_suite import BUCKET2, TABLE, compare, seed_requests
+from bench.fakes import FakeAWS
+
+
+def test_fake_s3_lists_in_key_order_with_pagination():
+    fakes = FakeAWS()
+    bucket = fakes.s3.bucket("b")
+    for k in ("c", "a", "b", "x/1"):
+        bucket[k] = b"{}"
+
+    first = fakes.s3.list_objects_v2(Bucket="b", MaxKeys=2)
+    rest = fakes.s3.list_objects_v2(Bucket="b", MaxKeys=2, StartAfter="b")
+
+    assert [c["Key"] for c in first["Contents"]] == ["a", "b"] and first["IsTruncated"]
+    assert [c["Key"] for c in rest["Contents"]] == ["c", "x/1"] and not rest["IsTruncated"]
+    with pytest.raises(fakes.s3.exceptions.NoSuchKey):
+        fakes.s3.get_object(Bucket="b", Key="missing")
+
+
+def test_fake_error_rate_raises_client_errors():
+    fakes = FakeAWS(error_rate=1.0, error_ops={"put_item"})
+    with pytest.raises(ClientError):
+        fakes.dynamodb.put_item(TableName="t", Item={"widgetId": {"S": "w1"}})
+    assert fakes.dynamodb.get_item(TableName="t", Key={"widgetId": {"S": "w1"}}) == {}
+    assert fakes.faults.errors == 1
+
+
+def test_consumer_main_runs_end_to_end_against_fakes(monkeypatch, tmp_path):
+    fakes = FakeAWS()
+    seed_requests(fakes, 20, n_attrs=3)
+    monkeypatch.setattr("boto3.client", fakes.client)
+
+    rc = consumer.main(["--bucket2", BUCKET2, "--target", "dynamodb", "--table", TABLE,
+                        "--sleep-ms", "1", "--stop-after", "20", "--prefetch-keys", "8",
+                        "--log-file", str(tmp_path / "c.log")])
+
+    assert rc == 0
+    assert len(fakes.dynamodb.table(TABLE)) == 20
+    assert fakes.s3.bucket(BUCKET2) == {}
+    assert fakes.dynamodb.table(TABLE)["widget-00000007"]["attr2"] == {"S": "value-2"}
+
+
+def test_compare_flags_throughput_regressions():
+    base = [{"name": "x", "params": {"n": 1}, "throughput_per_s": 100.0}]
+    now = [{"name": "x", "params": {"n": 1}, "throughput_per_s": 80.0}]
+
+    assert compare(now, base, tolerance=0.1) == now
+    assert now[0]["vs_baseline"] == -0.2
@@ -0,0 +1,53 @@
+# tests/test_clients.py
+import pytest
+
+import consumer
+from clients import ClientFactory, pool_size_for
+from poller_s3 import S3RequestPoller
+from storage_s3 import S3WidgetStore
+
+
+class RecordingClient:
+    def __init__(self, service_name, config):
+        self.service_name = service_name
+        self.config = config
+
+    def list_buckets(self):
+        return {"Buckets": []}
+
+
+def test_clients_are_created_lazily_once_per_service(monkeypatch):
+    created = []
+
+    def fake_client(service_name, *args, **kwargs):
+        created.append(RecordingClient(service_name, kwargs["config"]))
+        return created[-1]
+    monkeypatch.setattr("boto3.client", fake_client)
+
+    clients = ClientFactory(max_pool_connections=32, retry_mode="adaptive", max_attempts=5)
+    poller = S3RequestPoller("bucket2", clients=clients)
+    store = S3WidgetStore("bucket3", clients=clients)
+    assert created == []  # nothing is built until a call is made
+
+    poller.s3.list_buckets()
+    store.s3.list_buckets()
+
+    assert len(created) == 1 and created[0].service_name == "s3"
+    cfg = created[0].config
+    assert cfg.max_pool_connections == 32
+    assert cfg.retries == {"mode": "adaptive", "max_attempts": 5}
+    assert poller.s3.created and store.s3.created
+
+
+def test_factory_rejects_unknown_retry_mode():
+    with pytest.raises(ValueError):
+        ClientFactory(retry_mode="sometimes")
+
+
+def test_pool_size_follows_engine_concurrency():
+    args = consumer.parse_args(["--bucket2", "b", "--target", "s3", "--bucket3", "c",
+                                "--engine", "pipeline", "--fetch-concurrency", "16", "--writers", "8"])
+    assert consumer._client_factory(args).max_pool_connections == pool_size_for(16, 8) == 26
+
+    args = consumer.parse_args(["--bucket2", "b", "--target", "s3", "--bucket3", "c"])
+    assert consumer._client_factory(args).max_pool_connections == 10
@@ -0,0 +1,111 @@
+# tests/test_coalescer.py
+import random
+
+import pytest
+
+from coalescer import CoalescingStore
+from models import WidgetRequest, apply_update, to_flat_widget_dict
+
+
+class MemoryStore:
+    """Dict-backed store with the same put/delete/update semantics as the real ones."""
+    def __init__(self):
+        self.widgets = {}
+        self.calls = 0
+
+    def put_widget(self, req):
+        self.calls += 1
+        self.widgets[req.widgetId] = to_flat_widget_dict(req)
+
+    def delete_widget(self, req):
+        self.calls += 1
+        self.widgets.pop(req.widgetId, None)
+
+    def update_widget(self, req):
+        self.calls += 1
+        if req.widgetId in self.widgets:
+            self.widgets[req.widgetId] = apply_update(self.widgets[req.widgetId], req)
+
+
+class FailOnceStore(MemoryStore):
+    """Fails the ``fail_at``-th call (1-based), once."""
+    def __init__(self, fail_at):
+        super().__init__()
+        self.fail_at = fail_at
+
+    def put_widget(self, req):
+        if self.calls + 1 == self.fail_at:
+            self.fail_at = 0
+            self.calls += 1
+            raise RuntimeError("store down")
+        super().put_widget(req)
+
+
+KINDS = {"put": "WidgetCreateRequest", "delete": "WidgetDeleteRequest", "update": "WidgetUpdateRequest"}
+
+
+def _random_ops(rng, n):
+    ops = []
+    for i in range(n):
+        kind = rng.choice(list(KINDS))
+        attrs = [{"name": rng.choice("abc"), "value": rng.choice(["", "x", "y"])} for _ in range(rng.randint(0, 2))]
+        ops.append((kind, WidgetRequest(
+            type=KINDS[kind], requestId=f"r{i}", widgetId=rng.choice(["w1", "w2", "w3"]),
+            owner="Alice Smith", label=rng.choice([None, "", "L1", "L2"]),
+            description=rng.choice([None, "d"]), otherAttributes=attrs,
+        )))
+    return ops
+
+
+def test_coalesced_result_matches_serial_processing():
+    rng = random.Random(5270)
+    for _ in range(50):
+        ops = _random_ops(rng, rng.randint(1, 30))
+        serial, inner = MemoryStore(), MemoryStore()
+        coalescer = CoalescingStore(inner, window_ms=60_000, max_batch=rng.randint(1, 10))
+        for kind, req in ops:
+            getattr(serial, f"{kind}_widget")(req)
+            getattr(coalescer, f"{kind}_widget")(req)
+        coalescer.close()
+
+        assert inner.widgets == serial.widgets
+        assert coalescer.received == len(ops)
+        assert coalescer.issued == inner.calls
+        assert coalescer.saved == len(ops) - inner.calls
+
+
+def test_burst_for_one_widget_becomes_one_write():
+    inner = MemoryStore()
+    coalescer = CoalescingStore(inner, window_ms=60_000, max_batch=100)
+    coalescer.put_widget(WidgetRequest(type="WidgetCreateRequest", requestId="r1", widgetId="w1",
+                                       owner="Alice Smith", label="A"))
+    for i in range(2, 6):
+        coalescer.update_widget(WidgetRequest(type="WidgetUpdateRequest", requestId=f"r{i}", widgetId="w1",
+                                              owner="Alice Smith", otherAttributes=[{"name": "n", "value": str(i)}]))
+    coalescer.close()
+
+    assert inner.calls == 1
+    assert coalescer.saved == 4
+    assert inner.widgets["w1"] == {"widgetId": "w1", "owner": "Alice Smith", "label": "A", "n": "5"}
+
+
+def test_failed_flush_keeps_unissued_ops_for_the_next_flush():
+    inner = FailOnceStore(fail_at=2)
+    coalescer = CoalescingStore(inner, window_ms=60_000, max_batch=5)
+    reqs = [WidgetRequest(type="WidgetCreateRequest", requestId=f"r{i}", widgetId=f"w{i}",
+                          owner="Alice Smith", label="A") for i in range(5)]
+    for req in reqs[:4]:
+        coalescer.put_widget(req)
+    with pytest.raises(RuntimeError):
+        coalescer.put_widget(reqs[4])  # fills the batch; the second store call fails
+
+    assert list(inner.widgets) == ["w0"]
+    assert (coalescer.issued, coalescer.pending(), coalescer.saved) == (1, 4, 0)
+    # A newer update for a requeued widget folds into the retried put
+    coalescer.update_widget(WidgetRequest(type="WidgetUpdateRequest", requestId="r5", widgetId="w1",
+                                          owner="Alice Smith", label="B"))
+    coalescer.close()
+
+    assert sorted(inner.widgets) == ["w0", "w1", "w2", "w3", "w4"]
+    assert inner.widgets["w1"]["label"] == "B"
+    assert (coalescer.issued, coalescer.saved) == (5, 1)
@@ -1,4 +1,6 @@
 # tests/test_consumer.py
+import json
+import logging
 import types
 from pathlib import Path
 from models import WidgetRequest
@@ -11,7 +13,7 @@ import consumer
 
 class FakePoller:
     """Returns exactly one request, then None forever (like empty bucket)."""
-    def __init__(self, bucket2_name: str, sleep_ms: int = 100):
+    def __init__(self, bucket2_name: str, sleep_ms: int = 100, **kwargs):
         self.called = 0
         self.bucket2_name = bucket2_name
         self.sleep_ms = sleep_ms
@@ -31,7 +33,7 @@ class FakePoller:
 
 
 class FakeS3Store:
-    def __init__(self, bucket3_name: str):
+    def __init__(self, bucket3_name: str, **kwargs):
         self.bucket3_name = bucket3_name
         self.calls = []
 
@@ -40,7 +42,7 @@ class FakeS3Store:
 
 
 class FakeDdbStore:
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, **kwargs):
         self.table_name = table_name
         self.calls = []
 
@@ -85,3 +87,97 @@ def test_consumer_dynamodb_path(monkeypatch, tmp_path: Path):
     assert rc == 0
     assert log_file.exists()
     assert "Consumer starting" in log_file.read_text()
+
+
+class FakeKeyPoller(FakePoller):
+    """Exposes the key-level API the concurrent engines drive."""
+    def __init__(self, bucket2_name: str, sleep_ms: int = 100, **kwargs):
+        super().__init__(bucket2_name, sleep_ms)
+        self.idle = kwargs["idle"]
+        self.log = logging.getLogger("FakeKeyPoller")
+        self.acked = []
+
+    def next_key(self):
+        self.called += 1
+        return "0001.json" if self.called == 1 else None
+
+    def read_body(self, key):
+        return b'{"type": "WidgetCreateRequest", "requestId": "r1", "widgetId": "w1", "owner": "Alice Smith"}'
+
+    parse = staticmethod(lambda body: WidgetRequest(**json.loads(body)))
+
+    def ack(self, key):
+        self.acked.append(key)
+
+    def release(self, key):
+        pass
+
+    def is_missing_bucket(self, exc):
+        return False
+
+
+def test_consumer_asyncio_engine(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(consumer, "S3RequestPoller", FakeKeyPoller)
+    monkeypatch.setattr(consumer, "S3WidgetStore", FakeS3Store)
+
+    log_file = tmp_path / "log_aio.txt"
+    rc = consumer.main([
+        "--bucket2", "bucket2",
+        "--target", "s3",
+        "--bucket3", "bucket3",
+        "--sleep-ms", "1",
+        "--stop-after", "1",
+        "--engine", "asyncio",
+        "--log-file", str(log_file),
+    ])
+    assert rc == 0
+    text = log_file.read_text()
+    assert "Stop-after reached (1)" in text
+    assert "CREATE processed: widgetId=w1" in text
+
+
+def test_consumer_workers_combine_counts_for_stop_after(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(consumer, "S3RequestPoller", FakePoller)
+    monkeypatch.setattr(consumer, "S3WidgetStore", FakeS3Store)
+
+    log_file = tmp_path / "log_workers.txt"
+    rc = consumer.main([
+        "--bucket2", "bucket2",
+        "--target", "s3",
+        "--bucket3", "bucket3",
+        "--sleep-ms", "1",
+        "--stop-after", "2",
+        "--workers", "2",
+        "--log-file", str(log_file),
+    ])
+    assert rc == 0
+    # Each worker (one request each from FakePoller) logs to its own file
+    assert "Total processed: 2" in log_file.read_text()
+    assert (tmp_path / "log_workers.w0.txt").exists()
+    assert (tmp_path / "log_workers.w1.txt").exists()
+
+
+def test_consumer_fair_prefixes(monkeypatch, tmp_path: Path):
+    from bench.fakes import FakeAWS
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    for tenant, n in (("a", 30), ("b", 3)):
+        for i in range(n):
+            body = {"type": "WidgetCreateRequest", "requestId": f"{tenant}{i}", "widgetId": f"{tenant}-w{i}",
+                    "owner": "Alice Smith"}
+            fakes.s3.put_object(Bucket="bucket2", Key=f"{tenant}/{i:04d}", Body=json.dumps(body))
+
+    log_file = tmp_path / "log_fair.txt"
+    rc = consumer.main([
+        "--bucket2", "bucket2",
+        "--target", "dynamodb",
+        "--table", "widgets",
+        "--sleep-ms", "1",
+        "--stop-after", "6",
+        "--fair-prefixes", "auto",
+        "--log-file", str(log_file),
+    ])
+    assert rc == 0
+    # Tenant b is not stuck behind a's 30 smaller keys
+    assert not [k for k in fakes.s3.bucket("bucket2") if k.startswith("b/")]
+    assert "Prefix b/: weight=1 served=3" in log_file.read_text()
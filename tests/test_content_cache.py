@@ -0,0 +1,83 @@
+# tests/test_content_cache.py
+from bench.fakes import FakeAWS
+from content_cache import ContentHashCache, WidgetDocumentCache
+from models import WidgetRequest
+from storage_dynamodb import DynamoWidgetStore
+from storage_s3 import S3WidgetStore
+
+
+def _req(label="A", type_="WidgetCreateRequest"):
+    return WidgetRequest(type=type_, requestId="r1", widgetId="w1", owner="Alice Smith", label=label,
+                         otherAttributes=[{"name": "color", "value": "red"}])
+
+
+def test_lru_eviction_and_forget():
+    cache = ContentHashCache(max_entries=2)
+    cache.remember("a", "1")
+    cache.remember("b", "2")
+    assert cache.unchanged("a", "1")  # touches a, so b is now least recent
+    cache.remember("c", "3")
+
+    assert not cache.unchanged("b", "2")
+    cache.forget("a")
+    assert not cache.unchanged("a", "1")
+    assert cache.skipped == 1
+
+
+def test_s3_store_skips_identical_puts_until_delete(monkeypatch):
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    store = S3WidgetStore("bucket3", content_cache=ContentHashCache())
+
+    store.put_widget(_req())
+    store.put_widget(_req())          # identical: skipped
+    store.put_widget(_req(label="B"))  # changed: written
+    store.delete_widget(_req())
+    store.put_widget(_req(label="B"))  # gone, so written again
+
+    assert fakes.faults.calls["put_object"] == 3
+    assert store.content_cache.skipped == 1
+
+
+def test_s3_cache_warms_from_etags(monkeypatch):
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    S3WidgetStore("bucket3").put_widget(_req())  # written by an earlier run
+
+    store = S3WidgetStore("bucket3", content_cache=ContentHashCache())
+    assert store.warm_content_cache() == 1
+    store.put_widget(_req())
+
+    assert fakes.faults.calls["put_object"] == 1
+
+
+def test_dynamodb_cache_warms_from_scan_and_tracks_updates(monkeypatch):
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    DynamoWidgetStore("widgets").put_widget(_req())
+
+    store = DynamoWidgetStore("widgets", content_cache=ContentHashCache())
+    assert store.warm_content_cache() == 1
+    store.put_widget(_req())                                         # same item: skipped
+    store.update_widget(_req(label="B", type_="WidgetUpdateRequest"))
+    store.put_widget(_req(label="B"))                                # equals the updated item
+
+    assert fakes.faults.calls["put_item"] == 1  # only the first run's put
+    assert fakes.faults.calls["update_item"] == 1
+    assert store.content_cache.skipped == 2
+
+
+def test_s3_updates_merge_from_widget_cache_without_get(monkeypatch):
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    S3WidgetStore("bucket3").put_widget(_req(label="Old"))  # written before this store existed
+
+    store = S3WidgetStore("bucket3", widget_cache=WidgetDocumentCache(max_entries=10))
+    store.update_widget(_req(label="B", type_="WidgetUpdateRequest"))  # miss: GET then cached
+    store.update_widget(_req(label="C", type_="WidgetUpdateRequest"))  # hit
+    store.delete_widget(_req())
+    assert store.update_widget(_req(label="D", type_="WidgetUpdateRequest")) is None  # gone
+
+    assert fakes.faults.calls["get_object"] == 2
+    assert (store.widget_cache.hits, store.widget_cache.misses) == (1, 2)
+    assert store.widget_cache.hit_rate == 1 / 3
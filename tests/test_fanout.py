@@ -0,0 +1,163 @@
+# tests/test_fanout.py
+import json
+import threading
+
+import pytest
+
+import consumer
+from async_engine import AsyncioEngine
+from bench.fakes import FakeAWS
+from consumer import SerialEngine
+from fanout import FanOutError, FanOutStore
+from models import WidgetRequest
+from pipeline import PipelineEngine
+from poller_s3 import S3RequestPoller
+
+
+class FlakyStore:
+    def __init__(self, failures: int = 0, on_call=None):
+        self.failures = failures
+        self.on_call = on_call
+        self.calls = []
+
+    def put_widget(self, req):
+        self.calls.append(req.requestId)
+        if self.on_call is not None:
+            self.on_call()
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("boom")
+
+
+def _req(i):
+    return WidgetRequest(type="WidgetCreateRequest", requestId=f"r{i}", widgetId=f"w{i}", owner="Alice Smith")
+
+
+def test_failed_target_is_retried_alone():
+    good, flaky = FlakyStore(), FlakyStore(failures=2)
+    store = FanOutStore({"good": good, "flaky": flaky}, max_attempts=3, backoff_s=0)
+
+    store.put_widget(_req(1))
+
+    assert good.calls == ["r1"]
+    assert flaky.calls == ["r1", "r1", "r1"]
+    assert (store.writes, store.failures) == ({"good": 1, "flaky": 1}, {"good": 0, "flaky": 2})
+    store.close()
+
+
+def test_redelivered_request_only_writes_missing_targets():
+    good, down = FlakyStore(), FlakyStore(failures=2)
+    store = FanOutStore({"good": good, "down": down}, max_attempts=2, backoff_s=0)
+
+    with pytest.raises(FanOutError) as e:
+        store.put_widget(_req(1))
+    assert list(e.value.errors) == ["down"]
+
+    store.put_widget(_req(1))  # e.g. the spool drain retrying the same request
+    assert good.calls == ["r1"]
+    assert down.calls == ["r1", "r1", "r1"]
+    store.close()
+
+
+def test_executor_runs_every_concurrent_callers_targets_at_once():
+    barrier = threading.Barrier(4, timeout=5)  # 2 callers x 2 targets
+    store = FanOutStore({"a": FlakyStore(on_call=barrier.wait), "b": FlakyStore(on_call=barrier.wait)},
+                        max_attempts=1, concurrency=2)
+
+    callers = [threading.Thread(target=store.put_widget, args=(_req(i),)) for i in range(2)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join()
+
+    assert store.writes == {"a": 2, "b": 2}
+    store.close()
+
+
+class Sink:
+    """Widget store keeping the latest state per widget; the first ``failures`` puts fail."""
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.widgets = {}
+
+    def put_widget(self, req):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("throttled")
+        self.widgets[req.widgetId] = req.requestId
+
+    def delete_widget(self, req):
+        self.widgets.pop(req.widgetId, None)
+
+
+@pytest.mark.parametrize("engine_cls", [SerialEngine, PipelineEngine, AsyncioEngine])
+def test_retried_request_is_not_overtaken_by_a_later_one_for_the_same_widget(monkeypatch, engine_cls):
+    fakes = FakeAWS()
+    bucket = fakes.s3.bucket("bucket2")
+    for key, kind, rid in (("0001.json", "WidgetCreateRequest", "r1"), ("0002.json", "WidgetDeleteRequest", "r2"),
+                           ("0003.json", "WidgetCreateRequest", "r3")):
+        bucket[key] = json.dumps({"type": kind, "requestId": rid, "widgetId": "w1" if rid != "r3" else "w3",
+                                  "owner": "Alice Smith"}).encode()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    s3, ddb = Sink(), Sink(failures=1)  # the create of w1 fails once on ddb only
+    store = FanOutStore({"s3": s3, "dynamodb": ddb}, max_attempts=1, backoff_s=0)
+
+    def handler(req):
+        if req.type == "WidgetDeleteRequest":
+            store.delete_widget(req)
+        else:
+            store.put_widget(req)
+
+    poller = S3RequestPoller("bucket2", sleep_ms=1, page_size=10, defer_ack=engine_cls is SerialEngine)
+    engine = engine_cls(poller, handler, retry_on=(FanOutError,))
+    while engine.processed < 3:
+        engine.run(stop_after=3 - engine.processed)
+
+    assert s3.widgets == ddb.widgets == {"w3": "r3"}  # create then delete, on both sinks
+    assert not bucket and poller.inflight() == 0
+    store.close()
+
+
+@pytest.mark.parametrize("flag", [["--writers", "2"], ["--coalesce-window-ms", "50"]])
+def test_several_targets_reject_late_reporting_writes_even_with_a_spool(flag, tmp_path):
+    rc = consumer.main(["--bucket2", "bucket2", "--target", "s3,dynamodb", "--bucket3", "bucket3",
+                        "--table", "widgets", "--spool-dir", str(tmp_path / "spool"), *flag,
+                        "--log-file", str(tmp_path / "c.log")])
+
+    assert rc == 2
+    assert "cannot be combined with several targets" in (tmp_path / "c.log").read_text()
+
+
+def test_consumer_writes_every_request_to_both_targets(run_consumer, tmp_path):
+    fakes = run_consumer("--target", "s3,dynamodb", "--bucket3", "bucket3", "--table", "widgets")
+
+    widgets = fakes.s3.bucket("bucket3")
+    assert len(widgets) == len(fakes.dynamodb.table("widgets")) == 20
+    item = next(iter(fakes.dynamodb.table("widgets").values()))
+    doc = json.loads(next(v for k, v in widgets.items() if k.endswith("/" + item["widgetId"]["S"])))
+    assert doc == {k: v["S"] for k, v in item.items()}
+    assert "Target s3: writes=20 failures=0" in (tmp_path / "c.log").read_text()
+
+
+@pytest.mark.parametrize("engine_cls", [SerialEngine, PipelineEngine, AsyncioEngine])
+def test_request_stays_in_bucket2_until_every_target_stored_it(monkeypatch, engine_cls):
+    fakes = FakeAWS()
+    bucket = fakes.s3.bucket("bucket2")
+    bucket["0001.json"] = json.dumps({"type": "WidgetCreateRequest", "requestId": "r1",
+                                      "widgetId": "w1", "owner": "Alice Smith"}).encode()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    in_bucket2 = []
+    good = FlakyStore()
+    down = FlakyStore(failures=1, on_call=lambda: in_bucket2.append("0001.json" in bucket))
+    store = FanOutStore({"good": good, "down": down}, max_attempts=1, backoff_s=0)
+    poller = S3RequestPoller("bucket2", sleep_ms=1, defer_ack=engine_cls is SerialEngine)
+    engine = engine_cls(poller, store.put_widget, retry_on=(FanOutError,))
+
+    while engine.processed < 1:  # the asyncio engine stops after the failed dispatch
+        engine.run(stop_after=1)
+
+    assert in_bucket2 == [True, True]  # still there when the failed target was retried
+    assert good.calls == ["r1"]
+    assert "0001.json" not in bucket
+    assert poller.inflight() == 0
+    store.close()
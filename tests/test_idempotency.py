@@ -0,0 +1,54 @@
+# tests/test_idempotency.py
+import consumer
+from bench.bench_suite import BUCKET2, TABLE, request_body
+from bench.fakes import FakeAWS
+from idempotency import RequestIdCache
+
+
+def test_cache_is_bounded_and_counts_hits():
+    cache = RequestIdCache(max_entries=2)
+    for rid in ("r1", "r2", "r3"):
+        cache.add(rid)
+
+    assert len(cache) == 2
+    assert not cache.seen("r1")  # evicted, oldest first
+    assert cache.seen("r3")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl():
+    cache = RequestIdCache(ttl_s=10)
+    cache.add("old", now=0.0)  # far in the past
+    cache.add("new")
+
+    assert not cache.seen("old")
+    assert cache.seen("new")
+    assert len(cache) == 1
+
+
+def test_cache_survives_restart_through_file(tmp_path):
+    path = str(tmp_path / "dedupe.txt")
+    cache = RequestIdCache(path=path)
+    cache.add("r1")
+    cache.add("r2")
+    cache.close()
+
+    restarted = RequestIdCache(path=path, max_entries=1)
+    assert restarted.seen("r2")
+    assert not restarted.seen("r1")  # over the new bound
+    restarted.close()
+
+
+def test_consumer_skips_redelivered_request(monkeypatch, tmp_path):
+    fakes = FakeAWS()
+    bucket = fakes.s3.bucket(BUCKET2)
+    bucket["0001"] = bucket["0002"] = request_body(1, n_attrs=1)  # same requestId uploaded twice
+    monkeypatch.setattr("boto3.client", fakes.client)
+
+    rc = consumer.main(["--bucket2", BUCKET2, "--target", "dynamodb", "--table", TABLE,
+                        "--sleep-ms", "1", "--stop-after", "2", "--dedupe-max-entries", "100",
+                        "--log-file", str(tmp_path / "c.log")])
+
+    assert rc == 0
+    assert fakes.faults.calls["put_item"] == 1
+    assert "Skipped duplicate request req-00000001" in (tmp_path / "c.log").read_text()
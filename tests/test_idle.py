@@ -0,0 +1,20 @@
+# tests/test_idle.py
+from idle import AdaptiveIdle, FixedIdle
+
+
+def test_fixed_idle_always_uses_sleep_ms():
+    idle = FixedIdle(100)
+    assert [idle.next_delay() for _ in range(3)] == [0.1, 0.1, 0.1]
+
+
+def test_adaptive_idle_backs_off_to_ceiling_and_resets():
+    idle = AdaptiveIdle(base_ms=100, max_ms=1000)
+    delays = [idle.next_delay() for _ in range(20)]
+
+    assert delays[0] == 0.1
+    assert all(0.1 <= d <= 1.0 for d in delays)
+    # Ceiling doubles per empty poll: by the 5th poll it is capped at max_ms
+    assert idle.next_delay() <= 1.0 and max(delays) > 0.2
+
+    idle.reset()
+    assert idle.next_delay() == 0.1
@@ -0,0 +1,45 @@
+# tests/test_logqueue.py
+import json
+
+from logqueue import RequestSampler
+
+
+def _run(run_consumer, tmp_path, *extra):
+    run_consumer("--target", "dynamodb", "--table", "widgets", *extra)
+    return (tmp_path / "c.log").read_text().splitlines()
+
+
+def test_sampling_is_deterministic_per_request():
+    sampler = RequestSampler(rate=0.5)
+
+    kept = [rid for rid in (f"req-{i}" for i in range(1000)) if sampler.keep(rid)]
+    assert 400 < len(kept) < 600
+    assert all(sampler.keep(rid) for rid in kept)  # same request, same decision
+    assert sampler.dropped == 1000 - len(kept)
+
+
+def test_queue_mode_writes_every_line_by_shutdown(run_consumer, tmp_path):
+    lines = _run(run_consumer, tmp_path, "--log-mode", "queue")
+
+    assert sum("Stored widget" in line for line in lines) == 20
+    assert sum("CREATE processed" in line for line in lines) == 20
+    assert "Consumer stopped" in lines[-1]
+
+
+def test_json_lines_with_sampling_off_keeps_lifecycle_lines(run_consumer, tmp_path):
+    lines = _run(run_consumer, tmp_path, "--log-mode", "queue", "--log-format", "json",
+                 "--log-sample-rate", "0")
+
+    records = [json.loads(line) for line in lines]
+    assert not [r for r in records if "request_id" in r]
+    assert any(r["msg"].startswith("Consumer starting") for r in records)
+    assert records[-1]["msg"] == "Consumer stopped. Total processed: 20"
+
+
+def test_sampling_keeps_or_drops_a_request_trace_as_a_whole(run_consumer, tmp_path):
+    lines = _run(run_consumer, tmp_path, "--log-format", "json", "--log-sample-rate", "0.5")
+
+    records = [json.loads(line) for line in lines]
+    consumed = {r["request_id"] for r in records if r["msg"].startswith("Consumed request")}
+    stored = {r["request_id"] for r in records if r["msg"].startswith("Stored widget")}
+    assert consumed and consumed == stored
@@ -0,0 +1,65 @@
+# tests/test_metrics.py
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, MetricsServer, Registry
+
+
+def test_histogram_quantiles_follow_bucket_counts():
+    h = Histogram(buckets=(0.001, 0.01, 0.1))
+    for _ in range(90):
+        h.observe(0.0005)
+    for _ in range(10):
+        h.observe(0.05)
+
+    assert h.count == 100
+    assert h.quantile(0.5) <= 0.001
+    assert 0.01 < h.quantile(0.99) <= 0.1
+
+
+def test_stage_records_latency_and_outcome():
+    reg = Registry()
+    with reg.stage("get"):
+        pass
+    with pytest.raises(RuntimeError):
+        with reg.stage("get"):
+            raise RuntimeError("boom")
+
+    assert reg.counter("stage_total", stage="get", outcome="ok") == 1
+    assert reg.counter("stage_total", stage="get", outcome="error") == 1
+    assert reg.histogram("stage_seconds", stage="get").count == 2
+    assert reg.summary(["get"]).startswith("get=")
+
+
+def test_render_prometheus_text():
+    reg = Registry(prefix="c")
+    reg.inc("processed_total", 3, help="Requests routed.")
+    reg.histogram("stage_seconds", stage="parse").observe(0.002)
+    reg.gauge("writer_queue_depth", lambda: [({"writer": "0"}, 2)])
+
+    text = reg.render()
+    assert "# TYPE c_processed_total counter" in text
+    assert "c_processed_total 3" in text
+    assert 'c_stage_seconds_bucket{stage="parse",le="+Inf"} 1' in text
+    assert 'c_stage_seconds_count{stage="parse"} 1' in text
+    assert 'c_writer_queue_depth{writer="0"} 2' in text
+
+
+def test_metrics_server_serves_registry():
+    reg = Registry()
+    reg.inc("processed_total")
+    server = MetricsServer(reg, port=0, host="127.0.0.1").start()
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5).read()
+    finally:
+        server.close()
+    assert b"consumer_processed_total 1" in body
+
+
+def test_metrics_server_binds_loopback_by_default():
+    server = MetricsServer(Registry(), port=0).start()
+    try:
+        assert server.httpd.server_address[0] == "127.0.0.1"
+    finally:
+        server.close()
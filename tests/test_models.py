@@ -1,4 +1,9 @@
-from models import WidgetRequest, owner_slug, to_flat_widget_dict
+import json
+
+import pytest
+
+from models import (WidgetRequest, owner_slug, to_dynamodb_item, to_flat_widget_dict, to_json_bytes,
+                    to_widget_json_bytes)
 
 def test_schema():
     data = {
@@ -16,3 +21,67 @@ def test_schema():
     d = to_flat_widget_dict(req)
     assert d["color"] == "red"
     assert "widgetId" in d
+
+
+def test_from_json_bytes_matches_keyword_constructor():
+    data = {
+        "type": "WidgetUpdateRequest",
+        "requestId": "r2",
+        "widgetId": "w1",
+        "owner": "Alice Smith",
+        "description": "desc",
+        "otherAttributes": [{"name": f"a{i}", "value": str(i)} for i in range(20)],
+    }
+    fast = WidgetRequest.from_json_bytes(json.dumps(data).encode("utf-8"))
+    assert fast == WidgetRequest(**data)
+    assert to_flat_widget_dict(fast) == to_flat_widget_dict(WidgetRequest(**data))
+    assert not hasattr(fast, "__dict__")  # slotted
+
+
+def test_from_json_bytes_validates():
+    bad = [
+        b'{"type": "WidgetCreateRequest", "requestId": "r1", "widgetId": "w1", "owner": "Al1ce"}',
+        b'{"type": "Nope", "requestId": "r1", "widgetId": "w1", "owner": "Alice"}',
+        b'{"type": "WidgetCreateRequest", "requestId": "", "widgetId": "w1", "owner": "Alice"}',
+        b'{"type": "WidgetCreateRequest", "requestId": "r1", "widgetId": "w1", "owner": "Alice", "x": 1}',
+        b'{"type": "WidgetCreateRequest", "requestId": "r1", "widgetId": "w1", "owner": "Alice",'
+        b' "otherAttributes": [{"name": "a", "value": 1}]}',
+        b'[]',
+    ]
+    for body in bad:
+        with pytest.raises(ValueError):
+            WidgetRequest.from_json_bytes(body)
+
+
+def test_to_json_bytes_round_trips():
+    req = WidgetRequest(type="WidgetUpdateRequest", requestId="r1", widgetId="w1", owner="Alice Smith",
+                        description="", otherAttributes=[{"name": "color", "value": "red"}])
+    assert WidgetRequest.from_json_bytes(to_json_bytes(req)) == req
+
+
+@pytest.mark.parametrize("attrs,direct_json", [
+    ([], True),
+    ([{"name": "color", "value": "r\u00e9d \"x\"\n"}, {"name": "size", "value": ""}], True),
+    ([{"name": "label", "value": "shadows the label"}], False),
+    ([{"name": "color", "value": "red"}, {"name": "color", "value": "blue"}], False),
+])
+def test_direct_serializers_match_generic_path(attrs, direct_json):
+    from boto3.dynamodb.types import TypeSerializer
+    req = WidgetRequest(type="WidgetCreateRequest", requestId="r1", widgetId="w\u2603", owner="Alice Smith",
+                        label="A", description="tab\there", otherAttributes=attrs)
+    flat = to_flat_widget_dict(req)
+
+    assert to_dynamodb_item(req) == TypeSerializer().serialize(flat)["M"]
+    direct = to_widget_json_bytes(req)
+    if direct_json:
+        assert direct == json.dumps(flat).encode("utf-8")
+    else:
+        assert direct is None  # the store falls back to json.dumps
+
+
+def test_direct_serializers_fall_back_on_non_string_values():
+    req = WidgetRequest.from_json_bytes(
+        b'{"type": "WidgetCreateRequest", "requestId": "r1", "widgetId": "w1", "owner": "Al", "label": 5}')
+
+    assert to_dynamodb_item(req) is None
+    assert to_widget_json_bytes(req) is None
@@ -0,0 +1,72 @@
+# tests/test_pipeline.py
+import json
+import logging
+import random
+import threading
+import time
+
+from idle import FixedIdle
+from models import WidgetRequest
+from pipeline import PipelineEngine
+
+
+class FakePoller:
+    """In-memory Bucket 2: keys are claimed in order, GETs take a random time."""
+    def __init__(self, n: int):
+        self.objects = {
+            f"{i:04d}.json": json.dumps({
+                "type": "WidgetCreateRequest",
+                "requestId": f"r{i}",
+                "widgetId": f"w{i}",
+                "owner": "Alice Smith",
+            }).encode("utf-8")
+            for i in range(n)
+        }
+        self.pending = sorted(self.objects)
+        self.deleted = []
+        self.released = []
+        self.idle = FixedIdle(1)
+        self.log = logging.getLogger("FakePoller")
+        self.lock = threading.Lock()
+
+    def next_key(self):
+        with self.lock:
+            return self.pending.pop(0) if self.pending else None
+
+    def read_body(self, key):
+        time.sleep(random.uniform(0, 0.005))
+        return self.objects[key]
+
+    parse = staticmethod(lambda body: WidgetRequest(**json.loads(body)))
+
+    def ack(self, key):
+        self.deleted.append(key)
+
+    def release(self, key):
+        self.released.append(key)
+
+    def is_missing_bucket(self, exc):
+        return False
+
+
+def test_pipeline_hands_off_in_key_order():
+    poller = FakePoller(40)
+    seen = []
+    engine = PipelineEngine(poller, lambda req: seen.append(req.requestId), fetch_concurrency=8)
+
+    assert engine.run(stop_after=40) == 40
+    assert seen == [f"r{i}" for i in range(40)]
+    assert poller.deleted == sorted(poller.objects)
+
+
+def test_pipeline_stop_after_leaves_unhandled_requests_in_bucket():
+    poller = FakePoller(50)
+    engine = PipelineEngine(poller, lambda req: None, fetch_concurrency=4, queue_size=4)
+
+    engine.run(stop_after=10)
+
+    assert len(poller.deleted) == 10
+    # Prefetched-but-unhandled keys are released, never deleted
+    assert not set(poller.released) & set(poller.deleted)
+    # Bounded queue: the lister could not run far ahead of the router
+    assert len(poller.deleted) + len(poller.released) <= 10 + 4 + 4 + 1
@@ -1,9 +1,10 @@
 import json
 import io
 import boto3
+import pytest
 from botocore.stub import Stubber
 from botocore.response import StreamingBody
-from poller_s3 import S3RequestPoller
+from poller_s3 import RequestBatch, S3RequestPoller, S3AckBatcher
 
 def _streaming_body(s: str) -> StreamingBody:
     return StreamingBody(io.BytesIO(s.encode("utf-8")), len(s))
@@ -52,3 +53,307 @@ def test_poller_reads_and_deletes_object_with_stubber(monkeypatch):
         req = poller.get_next_request()
         assert req.type == "WidgetCreateRequest"
         assert req.owner == "Alice Smith"
+
+
+def _request_json(request_id: str) -> str:
+    return json.dumps({
+        "type": "WidgetCreateRequest",
+        "requestId": request_id,
+        "widgetId": "w" + request_id,
+        "owner": "Alice Smith"
+    })
+
+
+def test_prefetch_lists_once_per_page(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: s3)
+
+    poller = S3RequestPoller("bucket2", sleep_ms=1, page_size=3, refill_threshold=1)
+    keys = ["0001.json", "0002.json", "0003.json"]
+
+    with Stubber(s3) as stub:
+        # One LIST fills the buffer; the page is the whole bucket, so no refill.
+        stub.add_response(
+            "list_objects_v2",
+            {"KeyCount": 3, "IsTruncated": False, "Contents": [{"Key": k} for k in reversed(keys)]},
+            {"Bucket": "bucket2", "MaxKeys": 3}
+        )
+        for i, key in enumerate(keys, start=1):
+            stub.add_response("get_object", {"Body": _streaming_body(_request_json(f"r{i}"))},
+                              {"Bucket": "bucket2", "Key": key})
+            stub.add_response("delete_object", {}, {"Bucket": "bucket2", "Key": key})
+
+        ids = [poller.get_next_request().requestId for _ in keys]
+        stub.assert_no_pending_responses()
+
+    assert ids == ["r1", "r2", "r3"]
+
+
+def test_prefetch_refills_with_start_after_before_running_dry(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: s3)
+
+    poller = S3RequestPoller("bucket2", sleep_ms=1, page_size=2, refill_threshold=1)
+
+    with Stubber(s3) as stub:
+        stub.add_response(
+            "list_objects_v2",
+            {"IsTruncated": True, "Contents": [{"Key": "a"}, {"Key": "b"}]},
+            {"Bucket": "bucket2", "MaxKeys": 2}
+        )
+        stub.add_response(
+            "list_objects_v2",
+            {"IsTruncated": False, "Contents": [{"Key": "c"}]},
+            {"Bucket": "bucket2", "MaxKeys": 2, "StartAfter": "b"}
+        )
+        assert poller.next_key() == "a"
+        # Buffer is down to the threshold: refill from the cursor, keep order.
+        assert poller.next_key() == "b"
+        assert poller.next_key() == "c"
+        stub.assert_no_pending_responses()
+
+
+def _delete_params(*keys):
+    return {"Bucket": "bucket2", "Delete": {"Objects": [{"Key": k} for k in keys], "Quiet": True}}
+
+
+def test_ack_batcher_retries_per_key_errors_and_flushes_on_close():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    settled = []
+    batcher = S3AckBatcher(s3, "bucket2", max_batch=2, max_age_ms=60_000, on_settled=settled.append)
+
+    with Stubber(s3) as stub:
+        # Size flush: "b" fails once and is retried on its own
+        stub.add_response(
+            "delete_objects",
+            {"Errors": [{"Key": "b", "Code": "InternalError", "Message": "try again"}]},
+            _delete_params("a", "b"),
+        )
+        stub.add_response("delete_objects", {}, _delete_params("b"))
+        # Shutdown flush of the partial batch
+        stub.add_response("delete_objects", {}, _delete_params("c"))
+
+        batcher.add("a")
+        batcher.add("b")
+        batcher.add("c")
+        assert batcher.pending() == 1
+        batcher.close()
+        stub.assert_no_pending_responses()
+
+    assert settled == ["a", "b", "c"]
+    assert (batcher.deleted, batcher.failed, batcher.calls) == (3, 0, 3)
+
+
+def test_ack_batcher_reports_keys_that_keep_failing():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    batcher = S3AckBatcher(s3, "bucket2", max_batch=10, max_attempts=1)
+
+    with Stubber(s3) as stub:
+        stub.add_response(
+            "delete_objects",
+            {"Errors": [{"Key": "a", "Code": "AccessDenied", "Message": "nope"}]},
+            _delete_params("a"),
+        )
+        batcher.add("a")
+        batcher.close()
+
+    assert batcher.failed == 1
+    assert batcher.deleted == 0
+
+
+def test_poller_counts_idle_and_busy_polls(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: s3)
+
+    class RecordingIdle:
+        waits = resets = 0
+        def wait(self): self.waits += 1
+        def reset(self): self.resets += 1
+
+    idle = RecordingIdle()
+    poller = S3RequestPoller("bucket2", idle=idle)
+
+    with Stubber(s3) as stub:
+        stub.add_response("list_objects_v2", {"KeyCount": 0}, {"Bucket": "bucket2", "MaxKeys": 1})
+        stub.add_response("list_objects_v2", {"KeyCount": 0}, {"Bucket": "bucket2", "MaxKeys": 1})
+        stub.add_response("list_objects_v2", {"Contents": [{"Key": "k"}]}, {"Bucket": "bucket2", "MaxKeys": 1})
+
+        assert poller.get_next_request() is None
+        assert poller.get_next_request() is None
+        assert poller.next_key() == "k"
+
+    assert (poller.idle_polls, poller.busy_polls) == (2, 1)
+    assert (idle.waits, idle.resets) == (2, 1)
+
+
+def test_sharded_pollers_split_keys_without_overlap(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: s3)
+
+    keys = [f"tenantA/{i:04d}.json" for i in range(20)]
+    page = {"IsTruncated": False, "Contents": [{"Key": k} for k in keys]}
+    params = {"Bucket": "bucket2", "MaxKeys": 50, "Prefix": "tenantA/"}
+    owned = []
+    for index in range(2):
+        poller = S3RequestPoller("bucket2", page_size=50, refill_threshold=0,
+                                 prefix="tenantA/", shard_index=index, shard_count=2)
+        with Stubber(s3) as stub:
+            stub.add_response("list_objects_v2", page, params)
+            # Drained: nothing after the cursor, then a re-list from the start
+            # finds only keys this shard already claimed (or does not own)
+            stub.add_response("list_objects_v2", {"IsTruncated": False}, {**params, "StartAfter": keys[-1]})
+            stub.add_response("list_objects_v2", page, params)
+            mine = []
+            while (key := poller.next_key()) is not None:
+                mine.append(key)
+            stub.assert_no_pending_responses()
+        owned.append(mine)
+
+    assert owned[0] and owned[1]
+    assert sorted(owned[0] + owned[1]) == keys
+
+
+def _batch(n: int, bad_line: int = 0) -> bytes:
+    lines = [json.dumps({"type": "WidgetCreateRequest", "requestId": f"b{i}", "widgetId": f"w{i}",
+                         "owner": "Alice Smith"}) for i in range(n)]
+    if bad_line:
+        lines[bad_line - 1] = "{not json"
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def test_gzip_batch_is_streamed_and_deleted_after_last_line(monkeypatch):
+    import gzip
+    from bench.fakes import FakeAWS
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    fakes.s3.bucket("bucket2")["0001.ndjson.gz"] = gzip.compress(_batch(5, bad_line=3))
+
+    poller = S3RequestPoller("bucket2", sleep_ms=1)
+    seen = []
+    for _ in range(4):
+        seen.append(poller.get_next_request().requestId)
+        assert "0001.ndjson.gz" in fakes.s3.bucket("bucket2")  # kept until the batch is done
+
+    assert poller.get_next_request() is None
+    assert seen == ["b0", "b1", "b3", "b4"]  # line 3 reported and skipped
+    assert "0001.ndjson.gz" not in fakes.s3.bucket("bucket2")
+    assert poller.inflight() == 0
+
+    small_chunks = RequestBatch("k", io.BytesIO(_batch(3)), chunk_bytes=7)
+    assert [r.requestId for r in small_chunks] == ["b0", "b1", "b2"]
+
+
+def test_truncated_batch_resumes_then_is_deleted_without_replaying_lines(monkeypatch):
+    import gzip
+    from bench.fakes import FakeAWS
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    blob = gzip.compress(_batch(2000))
+    bucket = fakes.s3.bucket("bucket2")
+    bucket["0001.ndjson.gz"] = blob[:len(blob) // 2]
+    bucket["0002.json"] = _batch(1).strip()
+
+    from metrics import REGISTRY
+    dropped = REGISTRY.counter("batches_dropped_total")
+    poller = S3RequestPoller("bucket2", sleep_ms=1, max_batch_attempts=3)
+    seen = []
+    for _ in range(2000):  # every call returns; a failing batch cannot hold it
+        req = poller.get_next_request()
+        if req is not None:
+            seen.append(req.requestId)
+        if not bucket:
+            break
+
+    assert bucket == {}  # the bad batch was dropped after 3 attempts, the next object consumed
+    assert 0 < len(seen) - 1 < 2000
+    assert len(set(seen)) == len(seen) - 1  # only 0002.json's b0 repeats a batch id; no line replayed
+    assert seen[:-1] == [f"b{i}" for i in range(len(seen) - 1)]
+    assert poller.inflight() == 0
+    assert REGISTRY.counter("batches_dropped_total") == dropped + 1
+
+
+@pytest.mark.parametrize("engine", ["serial", "pipeline", "asyncio"])
+def test_consumer_handles_batches_alongside_single_objects(monkeypatch, tmp_path, engine):
+    import gzip
+    import consumer
+    from bench.fakes import FakeAWS
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    fakes.s3.put_object(Bucket="bucket2", Key="a.jsonl", Body=gzip.compress(_batch(30)),
+                        ContentEncoding="gzip")
+    fakes.s3.put_object(Bucket="bucket2", Key="b.json", Body=_batch(1).strip())
+
+    rc = consumer.main(["--bucket2", "bucket2", "--target", "dynamodb", "--table", "widgets",
+                        "--sleep-ms", "1", "--stop-after", "31", "--engine", engine,
+                        "--log-file", str(tmp_path / "c.log")])
+
+    assert rc == 0
+    assert len(fakes.dynamodb.table("widgets")) == 30  # b.json rewrites w0
+    assert fakes.s3.bucket("bucket2") == {}
+
+
+def _fair_bucket(monkeypatch, **counts):
+    from bench.fakes import FakeAWS
+    fakes = FakeAWS()
+    monkeypatch.setattr("boto3.client", fakes.client)
+    for prefix, n in counts.items():
+        for i in range(n):
+            fakes.s3.put_object(Bucket="bucket2", Key=f"{prefix}{i:04d}", Body=b"{}")
+    return fakes
+
+
+@pytest.mark.parametrize("page_size", [1, 10])
+def test_requeued_key_is_served_before_later_keys(monkeypatch, page_size):
+    _fair_bucket(monkeypatch, **{"k": 4})
+    poller = S3RequestPoller("bucket2", sleep_ms=1, page_size=page_size)
+
+    first, second = poller.next_key(), poller.next_key()
+    poller.requeue(first)
+    assert poller.next_key() == first
+    poller.ack(first)
+    poller.requeue(second)
+    assert [poller.next_key() for _ in range(3)] == ["k0001", "k0002", "k0003"]
+
+
+def test_fair_poller_weights_prefixes_and_keeps_key_order(monkeypatch):
+    from poller_s3 import FairS3RequestPoller
+    _fair_bucket(monkeypatch, **{"a/": 50, "b/": 10})
+
+    poller = FairS3RequestPoller("bucket2", weights={"a/": 3, "b/": 1}, sleep_ms=1, page_size=4)
+    keys = [poller.next_key() for _ in range(60)]
+
+    first = [k[0] for k in keys[:8]]
+    assert first.count("a") == 6 and first.count("b") == 2  # 3:1 while both have a backlog
+    assert [k for k in keys if k.startswith("b/")] == [f"b/{i:04d}" for i in range(10)]
+    assert [k for k in keys if k.startswith("a/")] == [f"a/{i:04d}" for i in range(50)]
+    assert poller.next_key() is None
+    assert dict((lbl["prefix"], n) for lbl, n in poller.prefix_backlog()) == {"a/": 0, "b/": 0}
+
+
+def test_fair_poller_discovers_prefixes_and_top_level_keys(monkeypatch):
+    from poller_s3 import FairS3RequestPoller, parse_prefix_weights
+    _fair_bucket(monkeypatch, **{"a/": 20, "b/": 2, "c/x/": 2, "top-": 1})
+
+    discover, weights = parse_prefix_weights("auto,b/=2")
+    poller = FairS3RequestPoller("bucket2", weights=weights, discover=discover, sleep_ms=1, page_size=3)
+    keys = [poller.next_key() for _ in range(6)]
+
+    assert set(poller.lanes) == {"", "a/", "b/", "c/"}
+    assert sorted(keys) == ["a/0000", "a/0001", "b/0000", "b/0001", "c/x/0000", "top-0000"]
+    with pytest.raises(ValueError):
+        parse_prefix_weights("a/=0")
+
+
+def test_fair_poller_rejects_prefixes_that_overlap(monkeypatch):
+    from poller_s3 import FairS3RequestPoller, parse_prefix_weights
+    _fair_bucket(monkeypatch, **{"a": 1})
+
+    with pytest.raises(ValueError, match="overlap"):
+        parse_prefix_weights("b/,a,ab")
+    assert parse_prefix_weights("a/,ab/") == (False, {"a/": 1, "ab/": 1})
+    with pytest.raises(ValueError, match="overlap"):
+        FairS3RequestPoller("bucket2", weights={"t/": 1, "t/x/": 1})
+    with pytest.raises(ValueError, match="level"):
+        FairS3RequestPoller("bucket2", weights={"t/x/": 2}, discover=True)
+    poller = FairS3RequestPoller("bucket2", weights={"": 2, "t/": 3}, discover=True)
+    assert (poller.lanes[""].weight, poller.lanes[""].delimiter) == (2, "/")
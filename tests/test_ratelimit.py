@@ -0,0 +1,87 @@
+# tests/test_ratelimit.py
+import pytest
+
+from bench.fakes import FakeAWS
+from models import WidgetRequest
+from ratelimit import AdaptiveRateLimiter, RateLimitedStore
+from storage_dynamodb import BatchedDynamoWidgetStore, DynamoWidgetStore
+
+
+def _req(i):
+    return WidgetRequest(type="WidgetCreateRequest", requestId=f"r{i}", widgetId=f"w{i}",
+                         owner="Alice Smith", label="A")
+
+
+def test_throttle_cuts_rate_once_per_burst_and_success_ramps_back():
+    limiter = AdaptiveRateLimiter(max_rate=100, min_rate=10, max_concurrency=8, increase=50, cooldown_s=60)
+    for throttled in (True, True):  # one burst of rejections
+        limiter.acquire()
+        limiter.release(throttled=throttled)
+    assert (limiter.rate, int(limiter.limit), limiter.throttles) == (50, 4, 2)
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release()
+    assert 50 < limiter.rate <= 100
+    assert int(limiter.limit) > 4
+
+
+def test_store_retries_throttled_writes_and_slows_down(monkeypatch):
+    fakes = FakeAWS(error_rate=0.3, error_ops={"put_item"}, seed=1)
+    monkeypatch.setattr("boto3.client", fakes.client)
+    limiter = AdaptiveRateLimiter(max_rate=1000, min_rate=200, cooldown_s=0)
+    store = RateLimitedStore(DynamoWidgetStore("widgets"), limiter, max_attempts=20)
+
+    for i in range(30):
+        store.put_widget(_req(i))
+
+    assert len(fakes.dynamodb.table("widgets")) == 30
+    assert limiter.throttles == fakes.faults.errors > 0
+    assert limiter.rate < 1000
+
+
+def test_throttled_batch_is_not_lost_when_limiter_wraps_batching(monkeypatch):
+    fakes = FakeAWS(error_rate=0.5, error_ops={"batch_write_item"}, seed=3)
+    monkeypatch.setattr("boto3.client", fakes.client)
+    limiter = AdaptiveRateLimiter(max_rate=1000, min_rate=200, cooldown_s=0)
+    batched = BatchedDynamoWidgetStore("widgets", batch_size=5, flush_interval_ms=60_000, max_attempts=1)
+    store = RateLimitedStore(batched, limiter, max_attempts=20)
+
+    for i in range(50):
+        store.put_widget(_req(i))
+    store.close()
+
+    assert fakes.faults.errors > 0
+    assert len(fakes.dynamodb.table("widgets")) == 50
+
+
+def test_non_throttle_errors_are_not_retried():
+    calls = []
+
+    class Broken:
+        def put_widget(self, req):
+            calls.append(req)
+            raise ValueError("bad widget")
+
+    limiter = AdaptiveRateLimiter()
+    with pytest.raises(ValueError):
+        RateLimitedStore(Broken(), limiter).put_widget(_req(1))
+    assert len(calls) == 1 and limiter.throttles == 0 and limiter.inflight == 0
+
+
+def test_consumer_stores_everything_under_s3_slowdown(run_consumer):
+    fakes = run_consumer("--target", "s3", "--bucket3", "out", "--prefetch-keys", "10",
+                         "--rate-limit-max", "500",
+                         fakes=FakeAWS(error_rate=0.2, error_ops={"put_object"}, seed=2))
+
+    assert len(fakes.s3.bucket("out")) == 20
+    assert fakes.faults.errors > 0
+
+
+def test_limiter_window_defaults_to_the_engine_concurrency(run_consumer):
+    from metrics import REGISTRY
+
+    run_consumer("--target", "dynamodb", "--table", "widgets", "--engine", "asyncio",
+                 "--max-in-flight", "16", "--rate-limit-max", "500")
+
+    assert 'consumer_write_concurrency_limit{target="dynamodb"} 16' in REGISTRY.render()
@@ -12,7 +12,7 @@ class FakeStore:
 class FakeLog:
     def __init__(self):
         self.lines = []
-    def info(self, m): self.lines.append(("INFO", m))
+    def info(self, m, *args, **kwargs): self.lines.append(("INFO", m % args))
     def warning(self, m): self.lines.append(("WARN", m))
     def error(self, m): self.lines.append(("ERR", m))
 
@@ -21,3 +21,21 @@ def test_router_calls_store_for_create():
     req = WidgetRequest(type="WidgetCreateRequest", requestId="r1", widgetId="w1", owner="Alice Smith")
     handle_request(req, store, log)
     assert store.called is True
+
+
+class FakeFullStore(FakeStore):
+    def __init__(self):
+        super().__init__()
+        self.ops = []
+    def delete_widget(self, req):
+        self.ops.append(("delete", req.widgetId))
+    def update_widget(self, req):
+        self.ops.append(("update", req.widgetId))
+
+
+def test_router_dispatches_delete_and_update():
+    store, log = FakeFullStore(), FakeLog()
+    for t in ("WidgetDeleteRequest", "WidgetUpdateRequest"):
+        handle_request(WidgetRequest(type=t, requestId="r1", widgetId="w1", owner="Alice Smith"), store, log)
+    assert store.ops == [("delete", "w1"), ("update", "w1")]
+    assert [level for level, _ in log.lines] == ["INFO", "INFO"]
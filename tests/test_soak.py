@@ -0,0 +1,28 @@
+# tests/test_soak.py
+import json
+
+from bench import soak
+
+
+def test_soak_reports_end_to_end_latency_for_every_target(tmp_path):
+    out = tmp_path / "soak.json"
+    rc = soak.main(["--rate", "200", "--duration-s", "0.5", "--target", "s3,dynamodb", "--widgets", "50",
+                    "--sample-s", "0.1", "--slo-p99-ms", "60000", "--slo-min-throughput", "0",
+                    "--output", str(out)])
+
+    assert rc == 0
+    report = json.loads(out.read_text())
+    result = report["result"]
+    assert result["sent"] == 100 and report["slo_violations"] == []
+    for target in ("s3", "dynamodb"):
+        lat = result["latency"][target]
+        assert 0 < lat["stored"] <= 100 - result["deletes"]
+        assert lat["p50_ms"] <= lat["p99_ms"] <= lat["max_ms"] + 1
+    assert result["timeline"][-1]["sent"] == 100 and result["timeline"][-1]["queue_depth"] == 0
+
+
+def test_slo_violations_are_listed():
+    result = {"rc": 0, "processed_per_s": 90.0, "latency": {"dynamodb": {"p99_ms": 1500.0}}}
+
+    assert soak.slo_violations(result, p99_ms=1000, min_throughput=95) == [
+        "throughput 90.0/s < 95/s", "dynamodb p99 1500.0ms > 1000ms"]
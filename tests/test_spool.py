@@ -0,0 +1,91 @@
+# tests/test_spool.py
+import os
+import threading
+
+import consumer
+from bench.bench_suite import BUCKET2, TABLE, seed_requests
+from bench.fakes import FakeAWS
+from spool import SegmentSpool
+
+
+def _drain(spool, n):
+    out = []
+    for _ in range(n):
+        payload, pos = spool.read(timeout=1)
+        out.append(payload)
+        spool.commit(pos)
+    return out
+
+
+def test_restart_resumes_from_last_checkpoint(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=4096, commit_every=2)
+    for i in range(5):
+        spool.append(b"req-%d" % i)
+    assert _drain(spool, 3) == [b"req-0", b"req-1", b"req-2"]
+    # Simulate a crash: no close(), so only the checkpoint after record 2 was saved
+    spool._writer.close()
+
+    restarted = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=4096, commit_every=2)
+    assert _drain(restarted, 3) == [b"req-2", b"req-3", b"req-4"]  # at-least-once replay
+    restarted.close()
+    assert restarted.backlog_bytes() == 0
+
+
+def test_torn_tail_record_is_truncated(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=4096)
+    spool.append(b"complete")
+    spool.close()
+    with open(tmp_path / "spool-000000000000.log", "ab") as f:
+        f.write(b"\x00\x00\x00\x10half")  # header promising 16 bytes, then a crash
+
+    restarted = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=4096)
+    assert _drain(restarted, 1) == [b"complete"]
+    assert restarted.read(timeout=0.01) is None
+    restarted.close()
+
+
+def test_finished_segments_are_deleted_and_disk_is_capped(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=64, max_bytes=128, commit_every=1)
+    payload = b"x" * 24  # 32 bytes framed: two per segment
+    for _ in range(4):
+        spool.append(payload)
+    assert spool.disk_bytes() == 128
+
+    blocked = threading.Thread(target=spool.append, args=(payload,))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()  # spool is full until the reader commits
+
+    _drain(spool, 3)  # moves into the second segment, so the first can go
+    blocked.join(2)
+    assert not blocked.is_alive()
+    assert not os.path.exists(tmp_path / "spool-000000000000.log")
+    spool.close()
+
+
+def test_consumer_stores_everything_through_the_spool(monkeypatch, tmp_path):
+    fakes = FakeAWS()
+    seed_requests(fakes, 20, n_attrs=2)
+    monkeypatch.setattr("boto3.client", fakes.client)
+
+    rc = consumer.main(["--bucket2", BUCKET2, "--target", "dynamodb", "--table", TABLE,
+                        "--sleep-ms", "1", "--stop-after", "20", "--prefetch-keys", "10",
+                        "--spool-dir", str(tmp_path / "spool"), "--log-file", str(tmp_path / "c.log")])
+
+    assert rc == 0
+    assert len(fakes.dynamodb.table(TABLE)) == 20
+    assert (tmp_path / "spool" / "checkpoint").exists()
+
+
+def test_writer_is_unblocked_when_segments_hold_fewer_than_commit_every_records(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=100_000, max_bytes=200_000, commit_every=100)
+    record = b"x" * 30_000  # 3 per segment, far below commit_every
+    writer = threading.Thread(target=lambda: [spool.append(record) for _ in range(12)], daemon=True)
+    writer.start()
+
+    assert _drain(spool, 12) == [record] * 12
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+    assert spool.disk_bytes() <= 200_000
+    spool.close()
+    assert spool.backlog_bytes() == 0
@@ -3,7 +3,7 @@ import json
 import boto3
 from botocore.stub import Stubber
 from boto3.dynamodb.types import TypeSerializer
-from storage_dynamodb import DynamoWidgetStore
+from storage_dynamodb import DynamoWidgetStore, BatchedDynamoWidgetStore
 from models import WidgetRequest
 
 def test_put_widget_flattens_attributes_and_calls_put_item(monkeypatch):
@@ -47,3 +47,113 @@ def test_put_widget_flattens_attributes_and_calls_put_item(monkeypatch):
 
         pk = store.put_widget(req)
         assert pk == "w1"
+
+
+def _req(widget_id, label=None):
+    return WidgetRequest(type="WidgetCreateRequest", requestId="r-" + widget_id,
+                         widgetId=widget_id, owner="Alice Smith", label=label)
+
+
+def _put(widget_id, label=None):
+    py_item = {"widgetId": widget_id, "owner": "Alice Smith"}
+    if label is not None:
+        py_item["label"] = label
+    return {"PutRequest": {"Item": TypeSerializer().serialize(py_item)["M"]}}
+
+
+def test_batched_store_dedupes_and_retries_unprocessed_items(monkeypatch):
+    ddb = boto3.client("dynamodb", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: ddb)
+
+    store = BatchedDynamoWidgetStore("widgets", batch_size=2, flush_interval_ms=60_000, backoff_ms=1)
+
+    with Stubber(ddb) as stub:
+        # w1 is written twice before the batch fills: only the last version is sent
+        stub.add_response(
+            "batch_write_item",
+            {"UnprocessedItems": {"widgets": [_put("w2")]}},
+            {"RequestItems": {"widgets": [_put("w1", "v2"), _put("w2")]}},
+        )
+        stub.add_response("batch_write_item", {"UnprocessedItems": {}},
+                          {"RequestItems": {"widgets": [_put("w2")]}})
+        # Partial batch is flushed on close
+        stub.add_response("batch_write_item", {}, {"RequestItems": {"widgets": [_put("w3")]}})
+
+        store.put_widget(_req("w1", "v1"))
+        store.put_widget(_req("w1", "v2"))
+        assert store.pending() == 1
+        store.put_widget(_req("w2"))
+        store.put_widget(_req("w3"))
+        store.close()
+        stub.assert_no_pending_responses()
+
+    assert store.written == 3
+
+
+class CountingDdbClient:
+    """Stub client that only counts round trips."""
+    def __init__(self):
+        self.put_item_calls = 0
+        self.batch_write_item_calls = 0
+
+    def put_item(self, **kwargs):
+        self.put_item_calls += 1
+        return {}
+
+    def batch_write_item(self, RequestItems):
+        self.batch_write_item_calls += 1
+        return {"UnprocessedItems": {}}
+
+
+def test_batched_store_needs_far_fewer_round_trips_than_put_item(monkeypatch):
+    n = 100
+    single_client, batch_client = CountingDdbClient(), CountingDdbClient()
+
+    # Clients are created on first use, so each store runs while its stub is installed
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: single_client)
+    single = DynamoWidgetStore("widgets")
+    for i in range(n):
+        single.put_widget(_req(f"w{i}"))
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: batch_client)
+    batched = BatchedDynamoWidgetStore("widgets", flush_interval_ms=60_000)
+    for i in range(n):
+        batched.put_widget(_req(f"w{i}"))
+    batched.close()
+
+    assert (single_client.put_item_calls, single_client.batch_write_item_calls) == (n, 0)
+    assert (batch_client.put_item_calls, batch_client.batch_write_item_calls) == (0, 4)  # ceil(100 / 25)
+    assert batched.calls == 4 and batched.written == n
+
+
+def test_delete_and_update_widget(monkeypatch):
+    ddb = boto3.client("dynamodb", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: ddb)
+    store = DynamoWidgetStore("widgets")
+    key = {"widgetId": {"S": "w1"}}
+    upd = WidgetRequest(type="WidgetUpdateRequest", requestId="r2", widgetId="w1", owner="Alice Smith",
+                        label="", otherAttributes=[{"name": "size", "value": "XL"}])
+
+    with Stubber(ddb) as stub:
+        # One conditional update_item, no read first
+        stub.add_response("update_item", {}, {
+            "TableName": "widgets", "Key": key, "ConditionExpression": "attribute_exists(widgetId)",
+            "UpdateExpression": "SET #a0 = :v0, #a2 = :v2 REMOVE #a1",
+            "ExpressionAttributeNames": {"#a0": "owner", "#a1": "label", "#a2": "size"},
+            "ExpressionAttributeValues": {":v0": {"S": "Alice Smith"}, ":v2": {"S": "XL"}}})
+        stub.add_response("delete_item", {}, {"TableName": "widgets", "Key": key})
+
+        assert store.update_widget(upd) == "w1"
+        assert store.delete_widget(upd) == "w1"
+        stub.assert_no_pending_responses()
+
+
+def test_update_of_missing_widget_is_skipped(monkeypatch):
+    ddb = boto3.client("dynamodb", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: ddb)
+    store = DynamoWidgetStore("widgets")
+    upd = WidgetRequest(type="WidgetUpdateRequest", requestId="r2", widgetId="w9", owner="Alice Smith")
+
+    with Stubber(ddb) as stub:
+        stub.add_client_error("update_item", service_error_code="ConditionalCheckFailedException")
+        assert store.update_widget(upd) is None
+        stub.assert_no_pending_responses()
@@ -2,6 +2,7 @@ import io
 import json
 import boto3
 from botocore.stub import Stubber
+from botocore.response import StreamingBody
 from storage_s3 import S3WidgetStore
 from models import WidgetRequest
 
@@ -32,7 +33,7 @@ def test_put_widget_uploads_correct_json(monkeypatch):
         "label": "Widget A",
         "description": "A red widget",
         "color": "red"
-    })
+    }).encode("utf-8")
 
     with Stubber(s3) as stub:
         stub.add_response(
@@ -48,3 +49,25 @@ def test_put_widget_uploads_correct_json(monkeypatch):
 
         key = store.put_widget(req)
         assert key == "widgets/alice-smith/w1"
+
+
+def test_update_widget_merges_into_stored_json(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    monkeypatch.setattr("boto3.client", lambda *a, **kw: s3)
+    store = S3WidgetStore("bucket3")
+
+    stored = json.dumps({"widgetId": "w1", "owner": "Alice Smith", "label": "Old", "color": "red"})
+    req = WidgetRequest(
+        type="WidgetUpdateRequest", requestId="r2", widgetId="w1", owner="Alice Smith",
+        description="new", otherAttributes=[{"name": "color", "value": ""}, {"name": "size", "value": "L"}],
+    )
+    expected_body = json.dumps({"widgetId": "w1", "owner": "Alice Smith", "label": "Old",
+                                "description": "new", "size": "L"}).encode("utf-8")
+
+    with Stubber(s3) as stub:
+        stub.add_response("get_object", {"Body": StreamingBody(io.BytesIO(stored.encode()), len(stored))},
+                          {"Bucket": "bucket3", "Key": "widgets/alice-smith/w1"})
+        stub.add_response("put_object", {}, {"Bucket": "bucket3", "Key": "widgets/alice-smith/w1",
+                                             "Body": expected_body, "ContentType": "application/json"})
+        assert store.update_widget(req) == "widgets/alice-smith/w1"
+        stub.assert_no_pending_responses()
@@ -0,0 +1,35 @@
+# tests/test_supervisor.py
+import functools
+import os
+import time
+
+from supervisor import Supervisor
+
+
+def _flaky_worker(marker_dir, index, count, counter):
+    """Worker 0 crashes on its first start; every worker counts until stopped."""
+    marker = os.path.join(marker_dir, f"started-{index}")
+    first_start = not os.path.exists(marker)
+    open(marker, "a").close()
+    if index == 0 and first_start:
+        return 3
+    try:
+        while True:
+            with counter.get_lock():
+                counter.value += 1
+            time.sleep(0.01)
+    except KeyboardInterrupt:
+        # SIGTERM from the supervisor arrives as KeyboardInterrupt
+        open(os.path.join(marker_dir, f"drained-{index}"), "a").close()
+        return 0
+
+
+def test_supervisor_restarts_crashed_worker_and_stops_on_combined_count(tmp_path):
+    sup = Supervisor(functools.partial(_flaky_worker, str(tmp_path)), workers=2,
+                     stop_after=50, restart_delay_s=0.05, poll_s=0.02)
+    assert sup.run() == 0
+
+    assert sup.processed >= 50
+    assert sup.restarts == [1, 0]
+    assert (tmp_path / "drained-0").exists()
+    assert (tmp_path / "drained-1").exists()
@@ -0,0 +1,59 @@
+# tests/test_writer_pool.py
+import random
+import threading
+import time
+
+import pytest
+
+from models import WidgetRequest
+from writer_pool import PartitionedWriterPool
+
+
+class RecordingStore:
+    def __init__(self, fail_on=None):
+        self.writes = []
+        self.threads = {}
+        self.closed = False
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def put_widget(self, req):
+        time.sleep(random.uniform(0, 0.002))
+        if req.requestId == self.fail_on:
+            raise RuntimeError("boom")
+        with self.lock:
+            self.writes.append((req.widgetId, req.requestId))
+            self.threads.setdefault(req.widgetId, set()).add(threading.current_thread().name)
+
+    def close(self):
+        self.closed = True
+
+
+def _req(widget_id, request_id):
+    return WidgetRequest(type="WidgetCreateRequest", requestId=request_id,
+                         widgetId=widget_id, owner="Alice Smith")
+
+
+def test_pool_keeps_per_widget_order_and_drains_on_close():
+    store = RecordingStore()
+    pool = PartitionedWriterPool(store, workers=4, queue_size=4)
+
+    for i in range(60):
+        pool.put_widget(_req(f"w{i % 5}", f"r{i}"))
+    pool.close()
+
+    assert store.closed
+    assert len(store.writes) == 60
+    for w in range(5):
+        mine = [int(r[1:]) for wid, r in store.writes if wid == f"w{w}"]
+        assert mine == sorted(mine)
+        assert len(store.threads[f"w{w}"]) == 1
+    assert pool.queue_depths() == [0, 0, 0, 0]
+
+
+def test_pool_surfaces_worker_errors():
+    pool = PartitionedWriterPool(RecordingStore(fail_on="r1"), workers=2)
+    pool.put_widget(_req("w1", "r1"))
+    with pytest.raises(RuntimeError):
+        pool.close()
+    assert pool.errors == 1
@@ -0,0 +1,104 @@
+# writer_pool.py
+import logging
+import queue
+import threading
+import zlib
+from typing import Optional
+
+from models import WidgetRequest
+
+_STOP = object()
+
+
+class PartitionedWriterPool:
+    """
+    Wraps a widget store and runs its writes on N worker threads.
+
+    Each request is routed by a stable hash of its ``widgetId``, so different
+    widgets are written in parallel while every operation for one widget runs
+    on the same worker, in submission order. The per-worker queues are bounded:
+    when a worker falls behind, put_widget blocks, which pushes back on the
+    poller instead of buffering without limit.
+
+    The pool exposes the same put/delete/update interface as the stores, so
+    ``router.handle_request`` does not know it is there. A write error on a
+    worker is logged and re-raised on the next call (or on close()).
+    """
+
+    def __init__(self, store, workers: int = 4, queue_size: int = 64):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.store = store
+        self.workers = workers
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.completed = 0
+        self.errors = 0
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), name=f"writer-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def partition(self, widget_id: str) -> int:
+        return zlib.crc32(widget_id.encode("utf-8")) % self.workers
+
+    def widget_key(self, req: WidgetRequest) -> str:
+        return getattr(self.store, "widget_key", lambda r: r.widgetId)(req)
+
+    def put_widget(self, req: WidgetRequest) -> str:
+        self._submit(req.widgetId, self.store.put_widget, req)
+        return req.widgetId
+
+    def delete_widget(self, req: WidgetRequest) -> str:
+        self._submit(req.widgetId, self.store.delete_widget, req)
+        return req.widgetId
+
+    def update_widget(self, req: WidgetRequest) -> str:
+        self._submit(req.widgetId, self.store.update_widget, req)
+        return req.widgetId
+
+    def queue_depths(self) -> list[int]:
+        return [q.qsize() for q in self._queues]
+
+    def close(self) -> None:
+        """Let every worker drain its queue, then close the wrapped store."""
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self.log.info(f"Writer pool drained: completed={self.completed} errors={self.errors}")
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
+        self._raise_pending_error()
+
+    def _submit(self, widget_id: str, fn, *args) -> None:
+        self._raise_pending_error()
+        self._queues[self.partition(widget_id)].put((fn, args))
+
+    def _raise_pending_error(self) -> None:
+        with self._lock:
+            e, self._error = self._error, None
+        if e is not None:
+            raise e
+
+    def _work(self, q: queue.Queue) -> None:
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            fn, args = item
+            try:
+                fn(*args)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                self.log.error(f"Write failed on {threading.current_thread().name}: {e}")
+                with self._lock:
+                    self.errors += 1
+                    self._error = self._error or e